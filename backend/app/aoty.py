@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Optional
 
 from sqlalchemy import select
@@ -7,29 +8,99 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import Album, User, UserAlbum
 from .artwork_resolver import resolve_album_cover
+from .metrics import track_outbound
+from .priors import AOTY_PRIOR_COUNT, best_signal, finish_seeding, score_priors, seed_elo
+from .stats import record_library_albums
+from .sync import get_sync_state, save_sync_state
+from .versioning import bump_data_version
 
-try:
-    from albumoftheyearapi.user import UserMethods  # type: ignore
-except Exception:  # pragma: no cover - optional dependency
-    UserMethods = None  # type: ignore
+
+def _user_methods():
+    # Imported on first use: the scraper pulls in a heavy dependency tree that most requests never need.
+    try:
+        from albumoftheyearapi.user import UserMethods  # type: ignore
+    except Exception:  # pragma: no cover - optional dependency
+        return None
+    return UserMethods
+
+
+# Rating pages read per import; a first import of a very large profile stops here and the next
+# sync continues from the top.
+MAX_RATING_PAGES = 40
+
+
+def _rating_key(item: dict) -> str:
+    title = item.get("album") or item.get("album_name") or item.get("title") or ""
+    artist = item.get("artist") or item.get("artist_name") or ""
+    return f"{artist.strip().lower()}|{title.strip().lower()}"
+
+
+async def _new_ratings(client, aoty_username: str, watermark: Optional[str]) -> tuple[list, bool]:
+    """Ratings newer than ``watermark``, newest first, and whether the walk got back to it (or the end).
+
+    The profile's rating pages list the most recently rated albums first, so the walk stops at the
+    newest rating the previous sync saw.
+    """
+    found: list = []
+    seen_pages = set()
+    for page in range(1, MAX_RATING_PAGES + 1):
+        try:
+            with track_outbound("aoty"):
+                # The scraper blocks; keep it off the event loop.
+                rows = await asyncio.to_thread(client.user_ratings, aoty_username, page)
+        except Exception as exc:  # pragma: no cover - upstream/network issues
+            raise RuntimeError(f"Failed to fetch AOTY data: {exc}")
+        if not rows:
+            return found, True
+        # Past the last page the site serves an earlier one again.
+        fingerprint = _rating_key(rows[0])
+        if fingerprint in seen_pages:
+            return found, True
+        seen_pages.add(fingerprint)
+        for item in rows:
+            if watermark is not None and _rating_key(item) == watermark:
+                return found, True
+            found.append(item)
+    return found, False
+
+
+def _user_score(item: dict) -> Optional[float]:
+    """The user's own 0-100 score for an album, if the scraper returned one."""
+    for key in ("rating", "user_rating", "score"):
+        try:
+            value = float(str(item.get(key)).strip())
+        except (TypeError, ValueError):
+            continue
+        if 0.0 <= value <= 100.0:
+            return value
+    return None
 
 
 async def import_aoty_user_albums(
     db: AsyncSession,
     user: User,
     aoty_username: str,
-) -> int:
+    seed_elo_priors: bool = True,
+    full: bool = False,
+) -> tuple[int, int]:
+    """Link the user's AOTY-rated albums; returns (albums linked, ratings seeded from their scores).
+
+    Later imports of the same profile only read ratings added since the previous one, unless
+    ``full``. Scores are only seeded from a full read, where they can be compared with each other.
+    """
+    UserMethods = _user_methods()
     if UserMethods is None:
         raise RuntimeError("Album of the Year integration is not available on this server.")
 
     client = UserMethods()
-
-    try:
-        rated_albums = client.user_ratings(aoty_username)
-    except Exception as exc:  # pragma: no cover - upstream/network issues
-        raise RuntimeError(f"Failed to fetch AOTY data: {exc}")
+    account = aoty_username.strip().lower()
+    state = await get_sync_state(db, user.id, "aoty")
+    watermark = state.watermark if state is not None and state.account == account and not full else None
+    rated_albums, complete = await _new_ratings(client, aoty_username, watermark)
 
     imported = 0
+    linked: list[Album] = []
+    scores: list[tuple[int, float]] = []
 
     for item in rated_albums:
         title = (item.get("album") or item.get("album_name") or item.get("title") or "").strip()
@@ -63,7 +134,11 @@ async def import_aoty_user_albums(
             )
             album = res.scalars().first()
 
+        score = _user_score(item)
+
         if album and album.spotify_id:
+            if score is not None:
+                scores.append((album.id, score))
             link_res = await db.execute(
                 select(UserAlbum).where(
                     UserAlbum.user_id == user.id,
@@ -79,6 +154,7 @@ async def import_aoty_user_albums(
                         added_from="aoty",
                     )
                 )
+                linked.append(album)
                 imported += 1
             continue
 
@@ -113,6 +189,8 @@ async def import_aoty_user_albums(
             aoty_cover = "https:" + aoty_cover
 
         await resolve_album_cover(db, album, aoty_cover_url=aoty_cover)
+        if score is not None:
+            scores.append((album.id, score))
 
         link_res = await db.execute(
             select(UserAlbum).where(
@@ -129,7 +207,26 @@ async def import_aoty_user_albums(
                     added_from="aoty",
                 )
             )
+            linked.append(album)
             imported += 1
 
+    seeded = 0
+    if seed_elo_priors and watermark is None:
+        await db.flush()
+        seeded = await seed_elo(db, user.id, score_priors(best_signal(scores)), AOTY_PRIOR_COUNT)
+    await save_sync_state(
+        db,
+        user.id,
+        "aoty",
+        imported=imported,
+        watermark=_rating_key(rated_albums[0]) if rated_albums else watermark,
+        account=account,
+        advance=complete,
+    )
+    await bump_data_version(db, user.id)
+    if seeded:
+        await finish_seeding(db, user.id)
+    else:
+        await record_library_albums(db, user.id, linked)
     await db.commit()
-    return imported
+    return imported, seeded
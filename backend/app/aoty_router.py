@@ -14,6 +14,10 @@ router = APIRouter(prefix="/import/aoty", tags=["aoty"])
 
 class AOTYImportRequest(BaseModel):
     aoty_username: str
+    # Start albums at an Elo derived from the user's AOTY scores instead of a flat 1500.
+    seed_elo: bool = True
+    # Re-read every rating page instead of stopping at the previous import's newest rating.
+    full: bool = False
 
 
 @router.post("/user-albums")
@@ -25,6 +29,8 @@ async def import_aoty_user_albums_endpoint(
     if not payload.aoty_username:
         raise HTTPException(status_code=400, detail="AOTY username is required")
 
-    imported = await import_aoty_user_albums(db, user, payload.aoty_username)
+    imported, seeded = await import_aoty_user_albums(
+        db, user, payload.aoty_username, payload.seed_elo, payload.full
+    )
 
-    return {"status": "ok", "imported": imported}
+    return {"status": "ok", "imported": imported, "seeded": seeded}
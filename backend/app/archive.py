@@ -0,0 +1,516 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import case, delete, func, null, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from .core.config import settings
+from .db import SessionLocal, engine
+from .models import Comparison
+
+logger = logging.getLogger(__name__)
+
+# One .npy file per column, fixed width so every segment can be memory-mapped and sliced in place.
+# ``winner`` is 1 for album A, 2 for album B, 0 for a draw; ``created_at`` is naive-UTC microseconds
+# since the epoch; Elo deltas that were never recorded are NaN.
+COLUMNS = {
+    "id": "<i8",
+    "album_a_id": "<i8",
+    "album_b_id": "<i8",
+    "winner": "i1",
+    "created_at": "<i8",
+    "elo_a_before": "<f8",
+    "elo_a_after": "<f8",
+    "elo_b_before": "<f8",
+    "elo_b_after": "<f8",
+}
+ELO_COLUMNS = ("elo_a_before", "elo_a_after", "elo_b_before", "elo_b_after")
+EPOCH = datetime(1970, 1, 1)
+# Rows read from the hot table per batch while archiving one user.
+ARCHIVE_BATCH = 50_000
+# A user's segments are merged into one once there are more than this many.
+COMPACT_SEGMENTS = 16
+
+
+def _numpy():
+    try:
+        import numpy  # type: ignore
+    except ImportError as exc:  # pragma: no cover - numpy is a declared dependency
+        raise RuntimeError("The comparison archive needs numpy installed on the server.") from exc
+    return numpy
+
+
+def to_micros(at: datetime) -> int:
+    return (at - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class Segment:
+    """A closed, contiguous id range of one user's comparisons; columns are mapped on first use."""
+
+    def __init__(self, path: Path, first_id: int, last_id: int) -> None:
+        self.path = path
+        self.first_id = first_id
+        self.last_id = last_id
+        self._columns: Dict[str, Any] = {}
+        self._by_album: Optional[Tuple[Any, Any]] = None
+
+    def by_album(self) -> Tuple[Any, Any]:
+        """Both album columns sorted together, with the row each entry came from; built once per process."""
+        if self._by_album is None:
+            np = _numpy()
+            albums = np.concatenate([self.column("album_a_id"), self.column("album_b_id")])
+            order = np.argsort(albums, kind="stable")
+            self._by_album = (albums[order], order % len(self))
+        return self._by_album
+
+    def column(self, name: str):
+        array = self._columns.get(name)
+        if array is None:
+            array = _numpy().load(self.path / f"{name}.npy", mmap_mode="r")
+            self._columns[name] = array
+        return array
+
+    def __len__(self) -> int:
+        return len(self.column("id"))
+
+
+class UserArchive:
+    """A user's archived comparisons: non-overlapping segments in id order.
+
+    Everything with an id up to ``last_id`` lives here; the hot table only holds newer rows, so
+    readers take archived rows first and then ``Comparison.id > last_id`` from the database.
+    """
+
+    def __init__(self, segments: List[Segment]) -> None:
+        self.segments = segments
+
+    @property
+    def last_id(self) -> int:
+        return self.segments[-1].last_id if self.segments else 0
+
+    @property
+    def count(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def chunks(self, after_id: int = 0) -> Iterator[Dict[str, Any]]:
+        """Column views (no copies) of each segment's rows with an id above ``after_id``."""
+        np = _numpy()
+        for segment in self.segments:
+            if segment.last_id <= after_id:
+                continue
+            start = int(np.searchsorted(segment.column("id"), after_id, side="right"))
+            yield {name: segment.column(name)[start:] for name in COLUMNS}
+
+    def column(self, name: str, after_id: int = 0):
+        """One column across segments; a single segment comes back as a view of its map."""
+        np = _numpy()
+        parts = [chunk[name] for chunk in self.chunks(after_id)]
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS[name])
+
+    def touching(self, album_ids) -> int:
+        """Archived comparisons with either album in ``album_ids``."""
+        np = _numpy()
+        ids = np.fromiter(album_ids, dtype=np.int64)
+        if not len(ids):
+            return 0
+        return sum(
+            int(np.count_nonzero(np.isin(chunk["album_a_id"], ids) | np.isin(chunk["album_b_id"], ids)))
+            for chunk in self.chunks()
+        )
+
+    def pairs_touching(self, album_ids) -> List[Tuple[int, int]]:
+        """(album_a_id, album_b_id) of each archived comparison with either album in ``album_ids``.
+
+        Looked up per album in each segment's sorted index instead of scanning the columns.
+        """
+        np = _numpy()
+        ids = np.unique(np.fromiter(album_ids, dtype=np.int64))
+        pairs: List[Tuple[int, int]] = []
+        if not len(ids):
+            return pairs
+        for segment in self.segments:
+            albums, rows = segment.by_album()
+            starts = np.searchsorted(albums, ids, side="left")
+            ends = np.searchsorted(albums, ids, side="right")
+            hits = [rows[start:end] for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+            if not hits:
+                continue
+            # A comparison between two of the albums is found from both sides but counts once.
+            found = np.unique(np.concatenate(hits))
+            a, b = segment.column("album_a_id")[found], segment.column("album_b_id")[found]
+            pairs.extend(zip(a.tolist(), b.tolist()))
+        return pairs
+
+    def outcomes(self) -> Dict[int, Tuple[int, int, int]]:
+        """album_id -> (appearances, wins, draws) over every archived comparison."""
+        np = _numpy()
+        totals: Dict[int, List[int]] = {}
+
+        def add(album_ids, slot: int) -> None:
+            ids, counts = np.unique(album_ids, return_counts=True)
+            for album_id, count in zip(ids.tolist(), counts.tolist()):
+                totals.setdefault(album_id, [0, 0, 0])[slot] += count
+
+        for chunk in self.chunks():
+            winner = np.asarray(chunk["winner"])
+            for side, code in (("album_a_id", 1), ("album_b_id", 2)):
+                albums = np.asarray(chunk[side])
+                add(albums, 0)
+                add(albums[winner == code], 1)
+                add(albums[winner == 0], 2)
+        return {album_id: (row[0], row[1], row[2]) for album_id, row in totals.items()}
+
+    def find(self, created_ats) -> Set[Tuple[int, int, datetime]]:
+        """(album_a_id, album_b_id, created_at) of archived votes at any of ``created_ats``."""
+        np = _numpy()
+        wanted = np.fromiter((to_micros(at) for at in created_ats), dtype=np.int64)
+        found = set()
+        for chunk in self.chunks():
+            hits = np.flatnonzero(np.isin(chunk["created_at"], wanted))
+            for i in hits.tolist():
+                found.add(
+                    (int(chunk["album_a_id"][i]), int(chunk["album_b_id"][i]), from_micros(chunk["created_at"][i]))
+                )
+        return found
+
+
+def archive_root() -> Path:
+    return Path(settings.comparison_archive_dir)
+
+
+def _user_dir(user_id: int) -> Path:
+    return archive_root() / str(user_id)
+
+
+# user_id -> (directory mtime, archive). The archiver may run in another process, so the listing
+# is re-read whenever the user's directory changes.
+_ARCHIVES: Dict[int, Tuple[int, UserArchive]] = {}
+
+
+def _scan(directory: Path) -> UserArchive:
+    found = []
+    for entry in os.scandir(directory):
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        first, _, last = entry.name.partition("-")
+        found.append(Segment(Path(entry.path), int(first), int(last)))
+    # A compaction that has written its merged segment but not yet removed the inputs leaves
+    # overlapping ranges for a moment; the widest one covering each range wins.
+    found.sort(key=lambda segment: (segment.first_id, -segment.last_id))
+    segments: List[Segment] = []
+    for segment in found:
+        if not segments or segment.first_id > segments[-1].last_id:
+            segments.append(segment)
+    return UserArchive(segments)
+
+
+def user_archive(user_id: int) -> UserArchive:
+    directory = _user_dir(user_id)
+    try:
+        mtime = directory.stat().st_mtime_ns
+    except FileNotFoundError:
+        _ARCHIVES.pop(user_id, None)
+        return UserArchive([])
+    cached = _ARCHIVES.get(user_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    archive = _scan(directory)
+    _ARCHIVES[user_id] = (mtime, archive)
+    return archive
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_segment(user_id: int, columns: Dict[str, Any]) -> Segment:
+    """Write columns as a new segment: into a hidden directory first, then renamed into place."""
+    np = _numpy()
+    directory = _user_dir(user_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    ids = columns["id"]
+    final = directory / f"{int(ids[0]):012d}-{int(ids[-1]):012d}"
+    staging = directory / f".tmp-{uuid.uuid4().hex}"
+    staging.mkdir()
+    for name, dtype in COLUMNS.items():
+        path = staging / f"{name}.npy"
+        np.save(path, np.ascontiguousarray(columns[name], dtype=dtype))
+        with open(path, "rb") as fh:
+            os.fsync(fh.fileno())
+    _fsync_dir(staging)
+    # A rewrite keeping the same id range replaces the old segment, which is moved aside first.
+    aside = None
+    if final.exists():
+        aside = directory / f".old-{uuid.uuid4().hex}"
+        os.replace(final, aside)
+    os.replace(staging, final)
+    _fsync_dir(directory)
+    if aside is not None:
+        shutil.rmtree(aside, ignore_errors=True)
+    return Segment(final, int(ids[0]), int(ids[-1]))
+
+
+def _rows_to_columns(rows) -> Dict[str, Any]:
+    np = _numpy()
+    nan = float("nan")
+    columns: Dict[str, List] = {name: [] for name in COLUMNS}
+    for row in rows:
+        columns["id"].append(row.id)
+        columns["album_a_id"].append(row.album_a_id)
+        columns["album_b_id"].append(row.album_b_id)
+        if row.winner_album_id is None:
+            columns["winner"].append(0)
+        else:
+            columns["winner"].append(1 if row.winner_album_id == row.album_a_id else 2)
+        columns["created_at"].append(to_micros(row.created_at))
+        for name in ELO_COLUMNS:
+            value = getattr(row, name)
+            columns[name].append(nan if value is None else value)
+    return {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in columns.items()}
+
+
+def _merge(segments: List[Segment]) -> Dict[str, Any]:
+    np = _numpy()
+    return {name: np.concatenate([segment.column(name) for segment in segments]) for name in COLUMNS}
+
+
+def compact_user(user_id: int) -> bool:
+    """Merge a user's segments into one when there are too many of them."""
+    archive = user_archive(user_id)
+    if len(archive.segments) <= COMPACT_SEGMENTS:
+        return False
+    write_segment(user_id, _merge(archive.segments))
+    for segment in archive.segments:
+        shutil.rmtree(segment.path, ignore_errors=True)
+    return True
+
+
+async def archive_user(db: AsyncSession, user_id: int, cutoff_id: int) -> int:
+    """Move the user's comparisons with ids up to ``cutoff_id`` into a new segment.
+
+    The segment is durable before the rows are deleted, and readers skip hot rows at or below the
+    archive's last id, so a crash in between only leaves rows for the next run to clear.
+    """
+    start_id = user_archive(user_id).last_id
+    moved = 0
+    while start_id < cutoff_id:
+        res = await db.execute(
+            select(
+                Comparison.id,
+                Comparison.album_a_id,
+                Comparison.album_b_id,
+                Comparison.winner_album_id,
+                Comparison.created_at,
+                *(getattr(Comparison, name) for name in ELO_COLUMNS),
+            )
+            .where(Comparison.user_id == user_id, Comparison.id > start_id, Comparison.id <= cutoff_id)
+            .order_by(Comparison.id)
+            .limit(ARCHIVE_BATCH)
+        )
+        rows = res.all()
+        if not rows:
+            break
+        segment = await asyncio.to_thread(write_segment, user_id, _rows_to_columns(rows))
+        start_id = segment.last_id
+        moved += len(rows)
+    last_id = user_archive(user_id).last_id
+    if last_id:
+        await db.execute(delete(Comparison).where(Comparison.user_id == user_id, Comparison.id <= last_id))
+        await db.commit()
+    await asyncio.to_thread(compact_user, user_id)
+    return moved
+
+
+async def archive_older_than(
+    days: Optional[float] = None, bind: AsyncEngine = engine, log: Callable[[str], None] = logger.info
+) -> Dict[str, int]:
+    """Archive every user's comparisons older than ``days`` (default ARCHIVE_AFTER_DAYS).
+
+    Each user's archive is an id prefix, so it stops below their first comparison that is not
+    past the cutoff: imported history can be old-dated yet have higher ids than recent votes,
+    and those votes must stay hot. Old rows above that point wait until it ages out.
+    """
+    days = settings.archive_after_days if days is None else days
+    threshold = datetime.utcnow() - timedelta(days=days)
+    old = Comparison.created_at < threshold
+    last_old_id = func.max(case((old, Comparison.id)))
+    users = moved = 0
+    async with SessionLocal(bind=bind) as db:
+        res = await db.execute(
+            select(Comparison.user_id, last_old_id, func.min(case((old, null()), else_=Comparison.id)))
+            .group_by(Comparison.user_id)
+            .having(last_old_id.is_not(None))
+        )
+        for user_id, last_old, first_recent in res.all():
+            cutoff_id = last_old if first_recent is None else min(last_old, first_recent - 1)
+            count = await archive_user(db, user_id, cutoff_id)
+            if count:
+                users += 1
+                moved += count
+                log(f"user {user_id}: archived {count} comparisons")
+    return {"users": users, "comparisons": moved}
+
+
+def _archived_user_ids() -> List[int]:
+    root = archive_root()
+    if not root.is_dir():
+        return []
+    return sorted(int(entry.name) for entry in os.scandir(root) if entry.is_dir() and entry.name.isdigit())
+
+
+def max_archived_id() -> int:
+    """The highest comparison id in any archive; new comparisons must get ids above it."""
+    return max((user_archive(user_id).last_id for user_id in _archived_user_ids()), default=0)
+
+
+def reclaim_hidden_sync(conn: Connection) -> int:
+    """Give new ids to hot comparisons at or below their user's archive boundary that are not archived.
+
+    Before comparisons were AUTOINCREMENT, SQLite could reuse an archived id for a new vote, and
+    readers skip hot rows at or below the boundary. Such rows move above every id in use. Rows
+    matching their archived copy (a crash between writing a segment and deleting) are left for
+    the next archive run. Returns the number of rows renumbered.
+    """
+    hidden: List[int] = []
+    for user_id in _archived_user_ids():
+        archive = user_archive(user_id)
+        if not archive.last_id:
+            continue
+        rows = conn.execute(
+            select(Comparison.id, Comparison.album_a_id, Comparison.album_b_id, Comparison.created_at).where(
+                Comparison.user_id == user_id, Comparison.id <= archive.last_id
+            )
+        ).all()
+        if not rows:
+            continue
+        np = _numpy()
+        ids = archive.column("id")
+        a, b, at = archive.column("album_a_id"), archive.column("album_b_id"), archive.column("created_at")
+        for row in rows:
+            i = int(np.searchsorted(ids, row.id))
+            archived = (
+                i < len(ids)
+                and ids[i] == row.id
+                and a[i] == row.album_a_id
+                and b[i] == row.album_b_id
+                and row.created_at is not None
+                and at[i] == to_micros(row.created_at)
+            )
+            if not archived:
+                hidden.append(row.id)
+    if not hidden:
+        return 0
+    next_id = max(conn.execute(select(func.max(Comparison.id))).scalar() or 0, max_archived_id())
+    for old_id in sorted(hidden):
+        next_id += 1
+        conn.execute(update(Comparison).where(Comparison.id == old_id).values(id=next_id))
+    return len(hidden)
+
+
+def remap_albums(mapping: Dict[int, int]) -> Set[int]:
+    """Repoint archived comparisons after duplicate albums are merged; returns the users affected.
+
+    Affected segments are rewritten rather than patched in place, so open maps keep a consistent
+    view; comparisons that end up between an album and itself are dropped, as in the hot table.
+    """
+    np = _numpy()
+    root = archive_root()
+    if not mapping or not root.is_dir():
+        return set()
+    old = np.fromiter(mapping, dtype=np.int64)
+    new = np.fromiter(mapping.values(), dtype=np.int64)
+    order = np.argsort(old)
+    old, new = old[order], new[order]
+
+    def apply(values):
+        values = np.array(values, dtype=np.int64)
+        pos = np.clip(np.searchsorted(old, values), 0, len(old) - 1)
+        hit = old[pos] == values
+        values[hit] = new[pos[hit]]
+        return values
+
+    touched = set()
+    for entry in os.scandir(root):
+        if not entry.is_dir() or not entry.name.isdigit():
+            continue
+        user_id = int(entry.name)
+        for segment in user_archive(user_id).segments:
+            if not any(np.isin(segment.column(side), old).any() for side in ("album_a_id", "album_b_id")):
+                continue
+            columns = {name: np.array(segment.column(name)) for name in COLUMNS}
+            columns["album_a_id"] = apply(columns["album_a_id"])
+            columns["album_b_id"] = apply(columns["album_b_id"])
+            keep = columns["album_a_id"] != columns["album_b_id"]
+            columns = {name: values[keep] for name, values in columns.items()}
+            rewritten = write_segment(user_id, columns) if len(columns["id"]) else None
+            if rewritten is None or rewritten.path != segment.path:
+                # Dropped rows moved the first or last id, so the rewrite got a new name.
+                shutil.rmtree(segment.path, ignore_errors=True)
+            touched.add(user_id)
+    return touched
+
+
+async def archive_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            summary = await archive_older_than()
+            logger.info("comparison archive updated: %s", summary)
+        except Exception:  # pragma: no cover - keep the loop alive across transient errors
+            logger.exception("comparison archiving failed")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.archive", description="Move old comparisons into per-user columnar archive segments."
+    )
+    parser.add_argument(
+        "--older-than-days",
+        type=float,
+        default=None,
+        help=f"archive comparisons older than this (default {settings.archive_after_days:g})",
+    )
+    args = parser.parse_args(argv)
+    summary = asyncio.run(archive_older_than(args.older_than_days, log=print))
+    print(summary)
+    return 0
+
+
+__all__ = [
+    "COLUMNS",
+    "Segment",
+    "UserArchive",
+    "user_archive",
+    "to_micros",
+    "from_micros",
+    "archive_user",
+    "archive_older_than",
+    "max_archived_id",
+    "reclaim_hidden_sync",
+    "remap_albums",
+    "archive_periodically",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
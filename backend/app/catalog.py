@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import Album
+
+logger = logging.getLogger(__name__)
+
+# Album fields exposed by AlbumBase, in response order.
+ALBUM_FIELDS = ("id", "title", "artist", "year", "cover_url", "spotify_id", "source", "cover_provider")
+ALBUM_COLUMNS = tuple(getattr(Album, name) for name in ALBUM_FIELDS)
+# Edits made by other workers are picked up by a background reload once the catalog is this old
+# (seconds); this process's own inserts and updates apply as soon as they commit.
+CATALOG_MAX_AGE = 300.0
+LOOKUP_BATCH = 500
+LOAD_BATCH = 10_000
+_PENDING = "album_catalog_pending"
+
+
+class AlbumRecord:
+    """One album's response fields; slotted, so a large catalog stays a fraction of ORM size."""
+
+    __slots__ = ALBUM_FIELDS
+
+    def __init__(self, values: Sequence[Any]) -> None:
+        for name, value in zip(ALBUM_FIELDS, values):
+            setattr(self, name, value)
+
+
+class RankingRow(AlbumRecord):
+    """A catalog album with one user's Elo, shaped like a row of ``RANKING_COLUMNS``."""
+
+    __slots__ = ("elo", "comparisons_count")
+
+    def __init__(self, album: AlbumRecord, elo: float, comparisons_count: int) -> None:
+        for name in ALBUM_FIELDS:
+            setattr(self, name, getattr(album, name))
+        self.elo = elo
+        self.comparisons_count = comparisons_count
+
+
+class AlbumCatalog:
+    """Read-mostly copy of every album's display fields, indexed by id.
+
+    Records live in one list with an id -> position map; changes swap in a new record instead of
+    mutating one, so callers holding a record never see it half-updated. An album keeps its
+    position for the life of the process, so listeners (the search index) can key on it.
+    """
+
+    def __init__(self) -> None:
+        self._records: List[Optional[AlbumRecord]] = []
+        self._index: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._reloading: Optional[asyncio.Task] = None
+        # Called as listener(position, old record or None, new record or None) on every change.
+        self._listeners: List[Callable[[int, Optional[AlbumRecord], Optional[AlbumRecord]], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def get(self, album_id: int) -> Optional[AlbumRecord]:
+        i = self._index.get(album_id)
+        return self._records[i] if i is not None else None
+
+    def at(self, position: int) -> Optional[AlbumRecord]:
+        return self._records[position]
+
+    def position(self, album_id: int) -> Optional[int]:
+        return self._index.get(album_id)
+
+    def ids(self) -> List[int]:
+        return list(self._index)
+
+    def records(self) -> Iterable[tuple]:
+        """(position, record) for every album currently in the catalog."""
+        return ((i, record) for i, record in enumerate(self._records) if record is not None)
+
+    def add_listener(self, listener: Callable[[int, Optional[AlbumRecord], Optional[AlbumRecord]], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, position: int, old: Optional[AlbumRecord], new: Optional[AlbumRecord]) -> None:
+        for listener in self._listeners:
+            listener(position, old, new)
+
+    def put(self, values: Sequence[Any]) -> AlbumRecord:
+        record = AlbumRecord(values)
+        i = self._index.get(record.id)
+        old = None
+        if i is None:
+            i = self._index[record.id] = len(self._records)
+            self._records.append(record)
+        else:
+            old = self._records[i]
+            self._records[i] = record
+        self._notify(i, old, record)
+        return record
+
+    def remove(self, album_id: int) -> None:
+        i = self._index.pop(album_id, None)
+        if i is not None:
+            # Positions are never reused, so the slot stays empty.
+            old, self._records[i] = self._records[i], None
+            self._notify(i, old, None)
+
+    async def _load(self, db: AsyncSession) -> None:
+        """Read every album; later loads only apply the differences, keeping positions."""
+        started = time.monotonic()
+        first = self._loaded_at is None
+        seen = set()
+        result = await db.stream(select(*ALBUM_COLUMNS).order_by(Album.id).execution_options(yield_per=LOAD_BATCH))
+        async for rows in result.partitions(LOAD_BATCH):
+            for row in rows:
+                seen.add(row.id)
+                current = None if first else self.get(row.id)
+                if current is None or any(getattr(current, name) != value for name, value in zip(ALBUM_FIELDS, row)):
+                    self.put(row)
+        if not first:
+            for album_id in [album_id for album_id in self._index if album_id not in seen]:
+                self.remove(album_id)
+        self._loaded_at = started
+
+    async def _reload(self) -> None:
+        from .db import SessionLocal
+
+        try:
+            async with SessionLocal() as db:
+                await self._load(db)
+        except Exception:  # pragma: no cover - the current catalog keeps serving
+            logger.exception("album catalog reload failed")
+        finally:
+            self._reloading = None
+
+    async def ensure(self, db: AsyncSession) -> None:
+        """Load on first use; afterwards schedule a background reload once the copy is old."""
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self._load(db)
+        elif time.monotonic() - self._loaded_at > CATALOG_MAX_AGE and self._reloading is None:
+            self._reloading = asyncio.create_task(self._reload())
+
+    async def lookup(self, db: AsyncSession, album_ids: Iterable[int]) -> Dict[int, AlbumRecord]:
+        """Records for ``album_ids``; ids this process has not seen yet are fetched once and kept."""
+        await self.ensure(db)
+        found: Dict[int, AlbumRecord] = {}
+        missing = []
+        for album_id in album_ids:
+            record = self.get(album_id)
+            if record is not None:
+                found[album_id] = record
+            else:
+                missing.append(album_id)
+        # Albums another worker inserted since the last load.
+        for start in range(0, len(missing), LOOKUP_BATCH):
+            res = await db.execute(select(*ALBUM_COLUMNS).where(Album.id.in_(missing[start : start + LOOKUP_BATCH])))
+            for row in res.all():
+                found[row.id] = self.put(row)
+        return found
+
+
+album_catalog = AlbumCatalog()
+
+
+# Keep the catalog in step with this process's own writes: albums flushed in a transaction are
+# captured while their values are at hand and applied only if it commits.
+@event.listens_for(Session, "after_flush")
+def _capture_albums(session: Session, flush_context: Any) -> None:
+    pending = None
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Album):
+            pending = pending if pending is not None else session.info.setdefault(_PENDING, {})
+            pending[obj.id] = tuple(getattr(obj, name) for name in ALBUM_FIELDS)
+    for obj in session.deleted:
+        if isinstance(obj, Album):
+            pending = pending if pending is not None else session.info.setdefault(_PENDING, {})
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_albums(session: Session) -> None:
+    pending = session.info.pop(_PENDING, None)
+    if not pending or not album_catalog.loaded:
+        return
+    for album_id, values in pending.items():
+        if values is None:
+            album_catalog.remove(album_id)
+        else:
+            album_catalog.put(values)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_albums(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+
+
+__all__ = ["ALBUM_FIELDS", "ALBUM_COLUMNS", "AlbumRecord", "RankingRow", "AlbumCatalog", "album_catalog"]
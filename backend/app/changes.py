@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import EloScore, RankingChange, User
+
+# Versions of history kept per user; older `since` values get a full snapshot instead of a delta.
+CHANGE_LOG_VERSIONS = 1_000
+# Pruning runs on every Nth version rather than on every write.
+PRUNE_EVERY = 100
+
+# (elo, comparisons_count) before a change, or None when the album was not ranked.
+OldState = Optional[Tuple[float, int]]
+
+
+async def record_ranking_changes(
+    db: AsyncSession, user_id: int, version: Optional[int], old_states: Dict[int, OldState]
+) -> None:
+    """Log the pre-change ranking state of albums touched by the write that produced ``version``."""
+    if version is None or not old_states:
+        return
+    for album_id, state in old_states.items():
+        db.add(
+            RankingChange(
+                user_id=user_id,
+                version=version,
+                album_id=album_id,
+                old_elo=state[0] if state else None,
+                old_comparisons_count=state[1] if state else None,
+            )
+        )
+    if version % PRUNE_EVERY == 0:
+        await db.execute(
+            delete(RankingChange).where(
+                RankingChange.user_id == user_id, RankingChange.version <= version - CHANGE_LOG_VERSIONS
+            )
+        )
+
+
+async def record_visibility_changes(
+    db: AsyncSession, user_id: int, version: Optional[int], album_ids: Iterable[int], was_visible: bool
+) -> None:
+    """Log albums entering (``was_visible=False``) or leaving the rankings through (un)exclusion."""
+    album_ids = list(album_ids)
+    if version is None or not album_ids:
+        return
+    res = await db.execute(
+        select(EloScore.album_id, EloScore.elo, EloScore.comparisons_count).where(
+            EloScore.user_id == user_id, EloScore.album_id.in_(album_ids)
+        )
+    )
+    await record_ranking_changes(
+        db,
+        user_id,
+        version,
+        {album_id: (elo, count) if was_visible else None for album_id, elo, count in res.all()},
+    )
+
+
+async def record_ranking_reset(db: AsyncSession, user_ids: int | Iterable[int]) -> None:
+    """Mark the users' current versions as bulk rewrites. Call after ``bump_data_version``."""
+    ids = [user_ids] if isinstance(user_ids, int) else sorted(set(user_ids))
+    if ids:
+        await db.execute(
+            insert(RankingChange).from_select(
+                ["user_id", "version"], select(User.id, User.data_version).where(User.id.in_(ids))
+            )
+        )
+
+
+async def load_recent_changes(db: AsyncSession, user_id: int, versions: int) -> List[Dict[int, Optional[float]]]:
+    """Pre-change Elo of the albums each of the user's latest ``versions`` logged writes touched, newest first.
+
+    None marks an album that was not ranked before the write. The list ends early at a bulk
+    rewrite, since nothing before one can be replayed.
+    """
+    recent = (
+        select(RankingChange.version)
+        .where(RankingChange.user_id == user_id)
+        .distinct()
+        .order_by(RankingChange.version.desc())
+        .limit(versions)
+        .subquery()
+    )
+    res = await db.execute(
+        select(RankingChange.version, RankingChange.album_id, RankingChange.old_elo)
+        .where(RankingChange.user_id == user_id, RankingChange.version >= select(func.min(recent.c.version)).scalar_subquery())
+        .order_by(RankingChange.version.desc(), RankingChange.id)
+    )
+    steps: List[Dict[int, Optional[float]]] = []
+    last_version = None
+    for version, album_id, old_elo in res.all():
+        if album_id is None:
+            break
+        if version != last_version:
+            steps.append({})
+            last_version = version
+        # Within one write the first logged state is the one before it.
+        steps[-1].setdefault(album_id, old_elo)
+    return steps
+
+
+__all__ = [
+    "CHANGE_LOG_VERSIONS",
+    "OldState",
+    "record_ranking_changes",
+    "record_visibility_changes",
+    "record_ranking_reset",
+    "load_recent_changes",
+]
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from .core.elo import elo_to_100
+from .db import engine, get_db
+from .fastjson import FastJSONResponse
+from .genres import normalize_genre
+from .models import Album, AlbumGenre, CommunityAlbumStats, EloScore, Genre
+from .rankings import ALBUM_COLUMNS, album_dict
+from .schemas import CommunityRankingsResponse
+
+logger = logging.getLogger(__name__)
+
+# Bayesian prior: every album starts as if PRIOR_RATERS users had rated it NEUTRAL_RATING, so a
+# single enthusiastic rater cannot put an obscure album above one that many people rank highly.
+PRIOR_RATERS = 5
+NEUTRAL_RATING = 50.0
+MAX_PAGE = 100
+RECONCILE_BATCH = 1_000
+
+# album_id -> (new_rating or None when the user no longer rates it, old_rating or None when the
+# user had not rated it before)
+RatingChange = Tuple[Optional[float], Optional[float]]
+
+
+def normalized_rating(elo: float) -> float:
+    """Per-user Elo on the shared 0-100 scale used for community averages."""
+    return elo_to_100(elo)
+
+
+def _score(rating_sum, raters):
+    return (rating_sum + PRIOR_RATERS * NEUTRAL_RATING) / (raters + PRIOR_RATERS)
+
+
+async def record_ratings(db: AsyncSession, changes: Dict[int, RatingChange]) -> None:
+    """Fold one user's rating changes into the community table. Call from the vote transaction.
+
+    Updates are single atomic UPDATEs so concurrent votes from different users on the same album
+    do not lose increments; drift from anything not fed here is fixed by ``reconcile``.
+    """
+    now = datetime.utcnow()
+    t = CommunityAlbumStats
+    for album_id, (new, old) in changes.items():
+        added = (new is not None) - (old is not None)
+        delta = (new or 0.0) - (old or 0.0)
+        stmt = (
+            update(t)
+            .where(t.album_id == album_id)
+            .values(
+                raters=t.raters + added,
+                rating_sum=t.rating_sum + delta,
+                rating_sq_sum=t.rating_sq_sum + ((new or 0.0) ** 2 - (old or 0.0) ** 2),
+                score=_score(t.rating_sum + delta, t.raters + added),
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        res = await db.execute(stmt)
+        if res.rowcount or new is None:
+            continue
+        try:
+            async with db.begin_nested():
+                db.add(
+                    CommunityAlbumStats(
+                        album_id=album_id,
+                        raters=1,
+                        rating_sum=new,
+                        rating_sq_sum=new * new,
+                        score=_score(new, 1),
+                        updated_at=now,
+                    )
+                )
+        except IntegrityError:
+            # Another vote created the row first; apply ours on top of it.
+            await db.execute(stmt)
+
+
+def _aggregate(rows: Iterable[Tuple[int, float]]) -> Dict[int, List[float]]:
+    totals: Dict[int, List[float]] = {}
+    for album_id, elo in rows:
+        rating = normalized_rating(elo)
+        entry = totals.get(album_id)
+        if entry is None:
+            totals[album_id] = [1, rating, rating * rating]
+        else:
+            entry[0] += 1
+            entry[1] += rating
+            entry[2] += rating * rating
+    return totals
+
+
+def reconcile_sync(conn: Connection) -> int:
+    """Rebuild the community table from every rated EloScore. Returns the number of albums."""
+    # Delete before reading: the write takes the database's write lock, so no vote can commit an
+    # increment between the read and the rewrite (it would be lost until the next reconcile).
+    conn.execute(delete(CommunityAlbumStats))
+    rows = conn.execute(
+        select(EloScore.album_id, EloScore.elo)
+        .where(EloScore.comparisons_count > 0)
+        .execution_options(yield_per=RECONCILE_BATCH)
+    )
+    totals = _aggregate(rows)
+    now = datetime.utcnow()
+    batch = []
+    for album_id, (raters, rating_sum, rating_sq_sum) in totals.items():
+        batch.append(
+            {
+                "album_id": album_id,
+                "raters": int(raters),
+                "rating_sum": rating_sum,
+                "rating_sq_sum": rating_sq_sum,
+                "score": _score(rating_sum, raters),
+                "updated_at": now,
+            }
+        )
+        if len(batch) >= RECONCILE_BATCH:
+            conn.execute(insert(CommunityAlbumStats), batch)
+            batch = []
+    if batch:
+        conn.execute(insert(CommunityAlbumStats), batch)
+    return len(totals)
+
+
+async def reconcile(engine: AsyncEngine) -> int:
+    async with engine.begin() as conn:
+        return await conn.run_sync(reconcile_sync)
+
+
+async def reconcile_periodically(engine: AsyncEngine, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            albums = await reconcile(engine)
+            logger.info("community rankings reconciled (%d albums)", albums)
+        except Exception:  # pragma: no cover - keep the loop alive across transient DB errors
+            logger.exception("community rankings reconcile failed")
+
+
+def _entry(rank: int, row) -> dict:
+    raters = row.raters
+    mean = row.rating_sum / raters
+    variance = max(0.0, row.rating_sq_sum / raters - mean * mean)
+    return {
+        "rank": rank,
+        "album": album_dict(row),
+        "community_rating": round(row.score, 1),
+        "mean_rating": round(mean, 1),
+        "raters": raters,
+        "stddev": round(math.sqrt(variance), 1),
+        "confidence": round(raters / (raters + PRIOR_RATERS), 3),
+    }
+
+
+router = APIRouter(prefix="/community", tags=["community"])
+
+
+@router.get("/rankings", response_model=CommunityRankingsResponse)
+async def community_rankings(
+    year: Optional[int] = None,
+    genre: Optional[str] = None,
+    min_raters: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    t = CommunityAlbumStats
+    conditions = [t.raters >= min_raters]
+    if year is not None:
+        conditions.append(Album.year == year)
+    if genre:
+        # Exact tags through the album_genres index, so "rock" does not match "post-rock".
+        conditions.append(
+            t.album_id.in_(
+                select(AlbumGenre.album_id)
+                .join(Genre, Genre.id == AlbumGenre.genre_id)
+                .where(Genre.name == normalize_genre(genre))
+            )
+        )
+
+    total_res = await db.execute(
+        select(func.count()).select_from(t).join(Album, Album.id == t.album_id).where(*conditions)
+    )
+    res = await db.execute(
+        select(*ALBUM_COLUMNS, t.raters, t.rating_sum, t.rating_sq_sum, t.score)
+        .join(t, t.album_id == Album.id)
+        .where(*conditions)
+        .order_by(t.score.desc(), t.album_id)
+        .offset(offset)
+        .limit(limit)
+    )
+    items = [_entry(offset + i + 1, row) for i, row in enumerate(res.all())]
+    return FastJSONResponse({"items": items, "total": total_res.scalar_one(), "offset": offset, "limit": limit})
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.community", description="Rebuild the community leaderboard from all users' ratings."
+    )
+    parser.parse_args(argv)
+    albums = asyncio.run(reconcile(engine))
+    print(f"community rankings rebuilt for {albums} albums")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
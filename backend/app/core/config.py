@@ -9,8 +9,35 @@ class Settings(BaseModel):
     spotify_client_secret: str | None = os.getenv("SPOTIFY_CLIENT_SECRET")
     spotify_redirect_uri: str | None = os.getenv("SPOTIFY_REDIRECT_URI")
     lastfm_api_key: str | None = os.getenv("LASTFM_API_KEY")
+    lastfm_api_secret: str | None = os.getenv("LASTFM_API_SECRET")
     jwt_secret: str = os.getenv("JWT_SECRET", "change-me")
     cors_origins: str = os.getenv("CORS_ORIGINS", "*")
+    # Log a warning when one request issues more SQL statements than this (0 disables).
+    query_warn_threshold: int = int(os.getenv("QUERY_WARN_THRESHOLD", "50"))
+    admin_token: str | None = os.getenv("ADMIN_TOKEN")
+    profiling_enabled: bool = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    profile_keep: int = int(os.getenv("PROFILE_KEEP", "50"))
+    profile_dir: str | None = os.getenv("PROFILE_DIR")
+    # Seconds between in-process rebuilds of the community leaderboard (0 disables; use the CLI from cron).
+    community_reconcile_interval: float = float(os.getenv("COMMUNITY_RECONCILE_INTERVAL", "0"))
+    recommendation_model_path: str = os.getenv("RECOMMENDATION_MODEL_PATH", "./recommendation_model.npz")
+    # Seconds between in-process recommendation refreshes (0 disables; use the CLI from cron).
+    recommendation_interval: float = float(os.getenv("RECOMMENDATION_INTERVAL", "0"))
+    # Per-user columnar segments holding comparisons moved out of the hot table.
+    comparison_archive_dir: str = os.getenv("COMPARISON_ARCHIVE_DIR", "./comparison_archive")
+    archive_after_days: float = float(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+    # Seconds between in-process archive runs (0 disables; use the CLI from cron).
+    archive_interval: float = float(os.getenv("ARCHIVE_INTERVAL", "0"))
+    # Seconds between in-process genre enrichment runs (0 disables; use the CLI from cron).
+    genre_enrich_interval: float = float(os.getenv("GENRE_ENRICH_INTERVAL", "0"))
+    # Seconds between background library re-syncs; each user's Spotify, Last.fm and AOTY imports are
+    # re-run incrementally once their last sync is this old (0 disables).
+    import_sync_interval: float = float(os.getenv("IMPORT_SYNC_INTERVAL", "0"))
+    # Directory for the write-behind vote log (unset disables buffering; single API worker only).
+    vote_buffer_dir: str | None = os.getenv("VOTE_BUFFER_DIR") or None
+    # Seconds between flushes of buffered votes to the database.
+    vote_buffer_flush_interval: float = float(os.getenv("VOTE_BUFFER_FLUSH_INTERVAL", "0.5"))
 
 
 settings = Settings()
@@ -4,16 +4,23 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from .core.config import settings
-from .models import Base
+from .metrics import instrument_engine
+from .migrations import LATEST_VERSION, schema_version
 
 
 engine = create_async_engine(settings.database_url, echo=False, future=True)
+instrument_engine(engine.sync_engine)
 SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
-async def init_db() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def check_schema() -> None:
+    # Boot only verifies the schema version; migrations run once via `python -m app.migrations`.
+    current = await schema_version(engine)
+    if current < LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema is at version {current}, expected {LATEST_VERSION}. "
+            "Run `python -m app.migrations` before starting the API."
+        )
 
 
 async def get_db():
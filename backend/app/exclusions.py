@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import User, UserAlbumExclusion
+from .changes import record_visibility_changes
+from .versioning import bump_data_version
+
+
+class ExclusionSet:
+    """Compact set of excluded album ids for one user, kept as a sorted int64 array."""
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, album_ids: Iterable[int] = ()) -> None:
+        self._ids = array("q", sorted(set(album_ids)))
+
+    def __contains__(self, album_id: object) -> bool:
+        if not isinstance(album_id, int):
+            return False
+        i = bisect_left(self._ids, album_id)
+        return i < len(self._ids) and self._ids[i] == album_id
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, album_id: int) -> bool:
+        i = bisect_left(self._ids, album_id)
+        if i < len(self._ids) and self._ids[i] == album_id:
+            return False
+        self._ids.insert(i, album_id)
+        return True
+
+    def discard(self, album_id: int) -> bool:
+        i = bisect_left(self._ids, album_id)
+        if i < len(self._ids) and self._ids[i] == album_id:
+            del self._ids[i]
+            return True
+        return False
+
+    def update(self, album_ids: Iterable[int]) -> None:
+        # Bulk changes rebuild once instead of shifting the array per id.
+        self._ids = array("q", sorted(set(self._ids).union(album_ids)))
+
+    def difference_update(self, album_ids: Iterable[int]) -> None:
+        self._ids = array("q", sorted(set(self._ids).difference(album_ids)))
+
+
+# Users whose exclusions stay in memory per process, least recently used dropped first.
+MAX_CACHED_USERS = 1024
+
+# Per-process cache: user id -> (users.exclusions_version it was read at, exclusions). Only
+# exclusion changes bump that counter, so votes and imports leave the cached copy valid while a
+# change made by another worker still shows up on the next read.
+_EXCLUSIONS: "OrderedDict[int, Tuple[int, ExclusionSet]]" = OrderedDict()
+
+
+async def _exclusions_version(db: AsyncSession, user_id: int) -> int:
+    # Request handlers have already loaded the user to authenticate, so this is an identity-map hit.
+    user = await db.get(User, user_id)
+    return (user.exclusions_version or 0) if user is not None else 0
+
+
+async def bump_exclusions_version(db: AsyncSession, user_id: int) -> Optional[int]:
+    """Mark a user's exclusions as changed. Call inside the transaction that changes them."""
+    res = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(exclusions_version=User.exclusions_version + 1)
+        .returning(User.exclusions_version)
+        .execution_options(synchronize_session=False)
+    )
+    version = res.scalar_one_or_none()
+    user = db.identity_map.get(db.identity_key(User, user_id)) if version is not None else None
+    if user is not None:
+        set_committed_value(user, "exclusions_version", version)
+    return version
+
+
+async def get_exclusions(db: AsyncSession, user_id: int) -> ExclusionSet:
+    version = await _exclusions_version(db, user_id)
+    cached = _EXCLUSIONS.get(user_id)
+    if cached is not None and cached[0] == version:
+        _EXCLUSIONS.move_to_end(user_id)
+        return cached[1]
+    res = await db.execute(
+        select(UserAlbumExclusion.album_id).where(UserAlbumExclusion.user_id == user_id)
+    )
+    excluded = ExclusionSet(res.scalars().all())
+    _EXCLUSIONS[user_id] = (version, excluded)
+    _EXCLUSIONS.move_to_end(user_id)
+    while len(_EXCLUSIONS) > MAX_CACHED_USERS:
+        _EXCLUSIONS.popitem(last=False)
+    return excluded
+
+
+def invalidate_exclusions(user_id: int | None = None) -> None:
+    if user_id is None:
+        _EXCLUSIONS.clear()
+    else:
+        _EXCLUSIONS.pop(user_id, None)
+
+
+def _apply_to_cache(user_id: int, version: Optional[int], change: Callable[[ExclusionSet], None]) -> None:
+    # Patch in place only when the cached copy was current right before this change.
+    cached = _EXCLUSIONS.get(user_id)
+    if cached is None:
+        return
+    if version is not None and cached[0] == version - 1:
+        change(cached[1])
+        _EXCLUSIONS[user_id] = (version, cached[1])
+    else:
+        _EXCLUSIONS.pop(user_id, None)
+
+
+async def _shift_stats(
+    db: AsyncSession, user_id: int, album_ids: Iterable[int], before: ExclusionSet, excluding: bool
+) -> None:
+    # stats reads exclusions through this module, so it is imported here rather than at the top.
+    from .stats import shift_exclusion_counts
+
+    await shift_exclusion_counts(db, user_id, album_ids, before, excluding)
+
+
+async def exclude_albums(db: AsyncSession, user_id: int, album_ids: Iterable[int]) -> int:
+    wanted = set(album_ids)
+    if not wanted:
+        return 0
+    # Read before the change, so a cache miss cannot load pending rows.
+    before = await get_exclusions(db, user_id)
+    res = await db.execute(
+        select(UserAlbumExclusion.album_id).where(
+            UserAlbumExclusion.user_id == user_id,
+            UserAlbumExclusion.album_id.in_(wanted),
+        )
+    )
+    missing = wanted.difference(res.scalars().all())
+    for album_id in sorted(missing):
+        db.add(UserAlbumExclusion(user_id=user_id, album_id=album_id))
+    version = None
+    if missing:
+        await _shift_stats(db, user_id, missing, before, excluding=True)
+        data_version = await bump_data_version(db, user_id)
+        await record_visibility_changes(db, user_id, data_version, missing, was_visible=True)
+        version = await bump_exclusions_version(db, user_id)
+    await db.commit()
+
+    if missing:
+        _apply_to_cache(user_id, version, lambda excluded: excluded.update(missing))
+    return len(missing)
+
+
+async def unexclude_albums(db: AsyncSession, user_id: int, album_ids: Iterable[int]) -> int:
+    wanted = set(album_ids)
+    if not wanted:
+        return 0
+    before = await get_exclusions(db, user_id)
+    res = await db.execute(
+        select(UserAlbumExclusion).where(
+            UserAlbumExclusion.user_id == user_id,
+            UserAlbumExclusion.album_id.in_(wanted),
+        )
+    )
+    rows = list(res.scalars().all())
+    for row in rows:
+        await db.delete(row)
+    version = None
+    removed = [row.album_id for row in rows]
+    if rows:
+        await _shift_stats(db, user_id, removed, before, excluding=False)
+        data_version = await bump_data_version(db, user_id)
+        await record_visibility_changes(db, user_id, data_version, removed, was_visible=False)
+        version = await bump_exclusions_version(db, user_id)
+    await db.commit()
+
+    if rows:
+        _apply_to_cache(user_id, version, lambda excluded: excluded.difference_update(removed))
+    return len(rows)
+
+
+__all__ = [
+    "MAX_CACHED_USERS",
+    "ExclusionSet",
+    "get_exclusions",
+    "bump_exclusions_version",
+    "invalidate_exclusions",
+    "exclude_albums",
+    "unexclude_albums",
+]
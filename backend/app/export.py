@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from .archive import from_micros, user_archive
+from .db import SessionLocal, get_db
+from .exclusions import bump_exclusions_version, get_exclusions, invalidate_exclusions
+from .fastjson import dumps
+from .models import Album, Comparison, EloScore, User, UserAlbum, UserAlbumExclusion
+from .spotify import require_spotify_user
+from .stats import rebuild_user_stats
+from .changes import record_ranking_reset
+from .history import take_snapshot
+from .versioning import bump_data_version
+
+# Rows fetched from the server-side cursor and encoded per response chunk.
+CHUNK_ROWS = 1_000
+# Rows resolved and written per transaction on re-import.
+IMPORT_BATCH = 500
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+ALBUM_EXPORT_FIELDS = ("spotify_id", "mbid", "title", "artist", "year", "genres", "cover_url", "source")
+RANKING_FIELDS = ("rank", "album_id") + ALBUM_EXPORT_FIELDS + ("elo", "comparisons_count", "excluded")
+COMPARISON_FIELDS = (
+    ("id", "created_at", "winner")
+    + tuple(f"a_{f}" for f in ("album_id",) + ALBUM_EXPORT_FIELDS)
+    + tuple(f"b_{f}" for f in ("album_id",) + ALBUM_EXPORT_FIELDS)
+)
+
+router = APIRouter(tags=["export"])
+
+Record = Dict[str, Any]
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode(fmt: str, fields: Sequence[str], records: Iterable[Record]) -> bytes:
+    if fmt == "ndjson":
+        return b"".join(dumps(record) + b"\n" for record in records)
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for record in records:
+        writer.writerow([_csv_value(record[f]) for f in fields])
+    return buf.getvalue().encode("utf-8")
+
+
+def _csv_header(fields: Sequence[str]) -> bytes:
+    return (",".join(fields) + "\n").encode("utf-8")
+
+
+async def _stream(
+    stmt, fmt: str, fields: Sequence[str], to_record: Callable[[Any], Record], header: bool = True
+) -> AsyncIterator[bytes]:
+    # The request's session is closed once the endpoint returns, so the body gets its own.
+    async with SessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=CHUNK_ROWS))
+        if fmt == "csv" and header:
+            yield _csv_header(fields)
+        async for rows in result.partitions(CHUNK_ROWS):
+            yield _encode(fmt, fields, (to_record(row) for row in rows))
+
+
+def _download(body: AsyncIterator[bytes], fmt: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="albumduel-{name}.{fmt}"'},
+    )
+
+
+def _album_fields(prefix: str, row: Any) -> Record:
+    return {f"{prefix}{f}": getattr(row, f"{prefix}{f}") for f in ("album_id",) + ALBUM_EXPORT_FIELDS}
+
+
+@router.get("/export/rankings")
+async def export_rankings(
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    excluded = await get_exclusions(db, user.id)
+    stmt = (
+        select(
+            Album.id.label("album_id"),
+            *(getattr(Album, f) for f in ALBUM_EXPORT_FIELDS),
+            EloScore.elo,
+            EloScore.comparisons_count,
+        )
+        .join(EloScore, EloScore.album_id == Album.id)
+        .where(EloScore.user_id == user.id)
+        .order_by(EloScore.elo.desc(), Album.id)
+    )
+    rank = 0
+
+    def to_record(row: Any) -> Record:
+        nonlocal rank
+        rank += 1
+        record = {"rank": rank, **_album_fields("", row)}
+        record.update(elo=row.elo, comparisons_count=row.comparisons_count, excluded=row.album_id in excluded)
+        return record
+
+    return _download(_stream(stmt, format, RANKING_FIELDS, to_record), format, "rankings")
+
+
+async def _archived_comparison_rows(user_id: int) -> AsyncIterator[List[SimpleNamespace]]:
+    """Archived votes in export-row shape, a chunk at a time, with album fields looked up per chunk."""
+    async with SessionLocal() as session:
+        for chunk in user_archive(user_id).chunks():
+            for start in range(0, len(chunk["id"]), CHUNK_ROWS):
+                part = {
+                    name: chunk[name][start : start + CHUNK_ROWS].tolist()
+                    for name in ("id", "album_a_id", "album_b_id", "winner", "created_at")
+                }
+                ids = set(part["album_a_id"]) | set(part["album_b_id"])
+                res = await session.execute(
+                    select(Album.id, *(getattr(Album, f) for f in ALBUM_EXPORT_FIELDS)).where(Album.id.in_(ids))
+                )
+                albums = {row.id: row for row in res.all()}
+                rows = []
+                for vote_id, a_id, b_id, winner, created_at in zip(*part.values()):
+                    if a_id not in albums or b_id not in albums:
+                        continue
+                    fields = {
+                        "id": vote_id,
+                        "created_at": from_micros(created_at),
+                        "winner_album_id": (None, a_id, b_id)[winner],
+                    }
+                    for prefix, album in (("a_", albums[a_id]), ("b_", albums[b_id])):
+                        fields[f"{prefix}album_id"] = album.id
+                        fields.update({f"{prefix}{f}": getattr(album, f) for f in ALBUM_EXPORT_FIELDS})
+                    rows.append(SimpleNamespace(**fields))
+                yield rows
+
+
+@router.get("/export/comparisons")
+async def export_comparisons(
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    user: User = Depends(require_spotify_user),
+):
+    a, b = aliased(Album), aliased(Album)
+    album_cols = []
+    for prefix, alias in (("a_", a), ("b_", b)):
+        album_cols.append(alias.id.label(f"{prefix}album_id"))
+        album_cols.extend(getattr(alias, f).label(f"{prefix}{f}") for f in ALBUM_EXPORT_FIELDS)
+    # Archived votes are older than every row left in the table, so they come first.
+    stmt = (
+        select(Comparison.id, Comparison.created_at, Comparison.winner_album_id, *album_cols)
+        .join(a, a.id == Comparison.album_a_id)
+        .join(b, b.id == Comparison.album_b_id)
+        .where(Comparison.user_id == user.id, Comparison.id > user_archive(user.id).last_id)
+        .order_by(Comparison.id)
+    )
+
+    def to_record(row: Any) -> Record:
+        if row.winner_album_id is None:
+            winner = "draw"
+        else:
+            winner = "a" if row.winner_album_id == row.a_album_id else "b"
+        record = {"id": row.id, "created_at": row.created_at, "winner": winner}
+        record.update(_album_fields("a_", row))
+        record.update(_album_fields("b_", row))
+        return record
+
+    async def body() -> AsyncIterator[bytes]:
+        if format == "csv":
+            yield _csv_header(COMPARISON_FIELDS)
+        async for rows in _archived_comparison_rows(user.id):
+            yield _encode(format, COMPARISON_FIELDS, (to_record(row) for row in rows))
+        async for chunk in _stream(stmt, format, COMPARISON_FIELDS, to_record, header=False):
+            yield chunk
+
+    return _download(body(), format, "comparisons")
+
+
+# --- Re-import -------------------------------------------------------------------------------
+
+
+def _read_records(upload: UploadFile, fmt: Optional[str]) -> Iterator[Optional[Record]]:
+    """Yield records from an uploaded export one at a time; malformed rows come back as None."""
+    if fmt is None:
+        name = (upload.filename or "").lower()
+        fmt = "csv" if name.endswith(".csv") else "ndjson"
+    lines = codecs.iterdecode(upload.file, "utf-8-sig")
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield record if isinstance(record, dict) else None
+
+
+def _batches(records: Iterable[Optional[Record]]) -> Iterator[List[Optional[Record]]]:
+    batch: List[Optional[Record]] = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= IMPORT_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _int(value: Any) -> Optional[int]:
+    value = _text(value)
+    return int(float(value)) if value is not None else None
+
+
+def _album_spec(record: Record, prefix: str = "") -> Optional[Record]:
+    spec = {f: _text(record.get(f"{prefix}{f}")) for f in ALBUM_EXPORT_FIELDS}
+    spec["year"] = _int(record.get(f"{prefix}year"))
+    if not (spec["spotify_id"] or spec["mbid"] or (spec["title"] and spec["artist"])):
+        return None
+    return spec
+
+
+def _name_key(title: Optional[str], artist: Optional[str]) -> Tuple[str, str]:
+    return ((title or "").lower(), (artist or "").lower())
+
+
+class _AlbumResolver:
+    """Matches exported album descriptions to local albums by Spotify id, MBID, then title/artist.
+
+    Album ids differ between instances, so the exported ids are never trusted. Unknown albums are
+    created; lookups are batched per import chunk.
+    """
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+        self.created = 0
+
+    async def resolve(self, specs: Sequence[Optional[Record]]) -> List[Optional[Album]]:
+        wanted = [s for s in specs if s is not None]
+        spotify_ids = {s["spotify_id"] for s in wanted if s["spotify_id"]}
+        mbids = {s["mbid"] for s in wanted if s["mbid"]}
+        titles = {s["title"].lower() for s in wanted if s["title"] and s["artist"]}
+
+        by_spotify: Dict[str, Album] = {}
+        by_mbid: Dict[str, Album] = {}
+        by_name: Dict[Tuple[str, str], Album] = {}
+        if spotify_ids:
+            res = await self.db.execute(select(Album).where(Album.spotify_id.in_(spotify_ids)))
+            by_spotify = {a.spotify_id: a for a in res.scalars().all()}
+        if mbids:
+            res = await self.db.execute(select(Album).where(Album.mbid.in_(mbids)))
+            by_mbid = {a.mbid: a for a in res.scalars().all()}
+        if titles:
+            res = await self.db.execute(select(Album).where(func.lower(Album.title).in_(titles)))
+            for album in res.scalars().all():
+                by_name.setdefault(_name_key(album.title, album.artist), album)
+
+        out: List[Optional[Album]] = []
+        pending = False
+        for spec in specs:
+            if spec is None:
+                out.append(None)
+                continue
+            album = (
+                (spec["spotify_id"] and by_spotify.get(spec["spotify_id"]))
+                or (spec["mbid"] and by_mbid.get(spec["mbid"]))
+                or by_name.get(_name_key(spec["title"], spec["artist"]))
+            )
+            if album is None and spec["title"] and spec["artist"]:
+                album = Album(**{**spec, "source": spec["source"] or "import"})
+                self.db.add(album)
+                self.created += 1
+                pending = True
+            if album is not None:
+                if album.spotify_id:
+                    by_spotify.setdefault(album.spotify_id, album)
+                if album.mbid:
+                    by_mbid.setdefault(album.mbid, album)
+                by_name.setdefault(_name_key(album.title, album.artist), album)
+            out.append(album)
+        if pending:
+            await self.db.flush()
+        return out
+
+
+def _truthy(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+
+async def _existing_ids(db: AsyncSession, model, user_id: int, album_ids: Iterable[int]) -> set:
+    res = await db.execute(select(model.album_id).where(model.user_id == user_id, model.album_id.in_(set(album_ids))))
+    return set(res.scalars().all())
+
+
+def _ranking_row(record: Optional[Record]) -> Optional[Tuple[Record, float, int, bool]]:
+    if not record:
+        return None
+    try:
+        spec = _album_spec(record)
+        if spec is None:
+            return None
+        return spec, float(record["elo"]), _int(record.get("comparisons_count")) or 0, _truthy(record.get("excluded"))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+@router.post("/import/rankings")
+async def import_rankings(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    """Load a rankings export: links albums, sets Elo scores and restores exclusions."""
+    resolver = _AlbumResolver(db)
+    imported = skipped = 0
+    for batch in _batches(_read_records(file, format)):
+        rows = [_ranking_row(record) for record in batch]
+        albums = await resolver.resolve([row[0] if row else None for row in rows])
+
+        resolved: Dict[int, Tuple[Album, float, int, bool]] = {}
+        for album, row in zip(albums, rows):
+            if album is None or row is None:
+                skipped += 1
+                continue
+            # A later row for the same album wins, matching what a second import would do.
+            resolved[album.id] = (album, *row[1:])
+        if not resolved:
+            continue
+
+        linked = await _existing_ids(db, UserAlbum, user.id, resolved)
+        excluded = await _existing_ids(db, UserAlbumExclusion, user.id, resolved)
+        res = await db.execute(
+            select(EloScore).where(EloScore.user_id == user.id, EloScore.album_id.in_(list(resolved)))
+        )
+        scores = {s.album_id: s for s in res.scalars().all()}
+        now = datetime.utcnow()
+        for album_id, (album, elo, count, is_excluded) in resolved.items():
+            if album_id not in linked:
+                db.add(UserAlbum(user_id=user.id, album_id=album_id, added_from="import"))
+            score = scores.get(album_id)
+            if score is None:
+                db.add(EloScore(user_id=user.id, album_id=album_id, elo=elo, comparisons_count=count, updated_at=now))
+            else:
+                score.elo, score.comparisons_count, score.updated_at = elo, count, now
+            if is_excluded and album_id not in excluded:
+                db.add(UserAlbumExclusion(user_id=user.id, album_id=album_id))
+        imported += len(resolved)
+        await db.commit()
+
+    invalidate_exclusions(user.id)
+    await rebuild_user_stats(db, user.id)
+    await bump_data_version(db, user.id)
+    await bump_exclusions_version(db, user.id)
+    await record_ranking_reset(db, user.id)
+    await take_snapshot(db, user.id)
+    await db.commit()
+    return {"status": "ok", "imported": imported, "skipped": skipped, "created_albums": resolver.created}
+
+
+def _parse_created_at(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    # Stored timestamps are naive UTC.
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@router.post("/import/comparisons")
+async def import_comparisons(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    """Load a comparison history export. Votes already present (same pair and timestamp) are skipped.
+
+    History is restored as-is; Elo scores come from a rankings import, not from replaying votes.
+    """
+    resolver = _AlbumResolver(db)
+    imported = skipped = duplicates = 0
+    for batch in _batches(_read_records(file, format)):
+        parsed: List[Optional[Tuple[datetime, str]]] = []
+        specs: List[Optional[Record]] = []
+        for record in batch:
+            entry = None
+            spec_a = spec_b = None
+            if record:
+                try:
+                    winner = str(record.get("winner") or "draw").strip().lower()
+                    spec_a, spec_b = _album_spec(record, "a_"), _album_spec(record, "b_")
+                    if winner in ("a", "b", "draw") and spec_a and spec_b:
+                        entry = (_parse_created_at(record["created_at"]), winner)
+                except (KeyError, TypeError, ValueError):
+                    entry = None
+            parsed.append(entry)
+            specs.extend((spec_a, spec_b) if entry else (None, None))
+        albums = await resolver.resolve(specs)
+
+        votes = []
+        for i, entry in enumerate(parsed):
+            album_a, album_b = albums[2 * i], albums[2 * i + 1]
+            if entry is None or album_a is None or album_b is None or album_a.id == album_b.id:
+                skipped += 1
+                continue
+            created_at, winner = entry
+            winner_id = {"a": album_a.id, "b": album_b.id}.get(winner)
+            votes.append((album_a.id, album_b.id, winner_id, created_at))
+        if not votes:
+            continue
+
+        res = await db.execute(
+            select(Comparison.album_a_id, Comparison.album_b_id, Comparison.created_at).where(
+                Comparison.user_id == user.id, Comparison.created_at.in_({v[3] for v in votes})
+            )
+        )
+        seen = set(res.all()) | user_archive(user.id).find({v[3] for v in votes})
+        for a_id, b_id, winner_id, created_at in votes:
+            if (a_id, b_id, created_at) in seen:
+                duplicates += 1
+                continue
+            seen.add((a_id, b_id, created_at))
+            db.add(
+                Comparison(
+                    user_id=user.id, album_a_id=a_id, album_b_id=b_id, winner_album_id=winner_id, created_at=created_at
+                )
+            )
+            imported += 1
+        await db.commit()
+
+    await rebuild_user_stats(db, user.id)
+    await bump_data_version(db, user.id)
+    await db.commit()
+    return {
+        "status": "ok",
+        "imported": imported,
+        "duplicates": duplicates,
+        "skipped": skipped,
+        "created_albums": resolver.created,
+    }
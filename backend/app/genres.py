@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .db import SessionLocal, get_db
+from .fastjson import FastJSONResponse
+from .models import Album, AlbumGenre, EloScore, Genre, User
+from .schemas import GenresResponse
+from .spotify import require_spotify_user
+from .spotify_resolver import SpotifyAppClient, spotify_app
+
+logger = logging.getLogger(__name__)
+
+# Albums looked up per enrichment transaction.
+ENRICH_BATCH = 200
+# Genres kept per album, in Spotify's order for its artists.
+MAX_ALBUM_GENRES = 8
+MAX_GENRES_LISTED = 200
+
+
+def normalize_genre(name: str) -> str:
+    return " ".join(name.strip().lower().split())
+
+
+async def genre_album_ids(db: AsyncSession, genre: str) -> Set[int]:
+    """Ids of albums tagged ``genre``, read from the genre-first album_genres index."""
+    res = await db.execute(
+        select(AlbumGenre.album_id)
+        .join(Genre, Genre.id == AlbumGenre.genre_id)
+        .where(Genre.name == normalize_genre(genre))
+    )
+    return set(res.scalars().all())
+
+
+async def genres_stamp(db: AsyncSession) -> str:
+    """Changes whenever enrichment writes genres, for ETags of genre-filtered views."""
+    res = await db.execute(select(func.max(Album.genres_fetched_at)))
+    latest = res.scalar_one_or_none()
+    return latest.strftime("%Y%m%d%H%M%S%f") if latest else "0"
+
+
+async def _genre_ids(db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+    names = sorted(set(names))
+    ids: Dict[str, int] = {}
+    if not names:
+        return ids
+    res = await db.execute(select(Genre.name, Genre.id).where(Genre.name.in_(names)))
+    ids.update(res.all())
+    for name in names:
+        if name in ids:
+            continue
+        try:
+            async with db.begin_nested():
+                res = await db.execute(insert(Genre).values(name=name).returning(Genre.id))
+                ids[name] = res.scalar_one()
+        except IntegrityError:
+            # Another worker added it first.
+            res = await db.execute(select(Genre.id).where(Genre.name == name))
+            ids[name] = res.scalar_one()
+    return ids
+
+
+async def _lookup(client: SpotifyAppClient, albums: List) -> Dict[int, Optional[List[str]]]:
+    """album id -> genres (possibly empty), or None when the lookup failed and should be retried."""
+    found: Dict[int, Optional[List[str]]] = {}
+    by_spotify = {album.spotify_id: album.id for album in albums if album.spotify_id}
+    artists = await client.album_artist_ids(by_spotify) if by_spotify else {}
+    artist_genres = await client.artist_genres(a for ids in artists.values() for a in ids)
+    for spotify_id, album_id in by_spotify.items():
+        if spotify_id in artists:
+            genres = [g for artist_id in artists[spotify_id] for g in artist_genres.get(artist_id, [])]
+            found[album_id] = genres
+    for album in albums:
+        if album.id in found:
+            continue
+        # Imported from AOTY or Last.fm, or a Spotify id that no longer resolves: search the lead artist.
+        lead = album.artist.split(",")[0].strip()
+        found[album.id] = await client.search_artist_genres(lead) if lead else []
+    return found
+
+
+async def enrich_batch(db: AsyncSession, client: SpotifyAppClient = spotify_app, limit: int = ENRICH_BATCH) -> int:
+    """Look up genres for up to ``limit`` albums not tried yet and store them. Returns albums handled."""
+    res = await db.execute(
+        select(Album.id, Album.spotify_id, Album.artist)
+        .where(Album.genres_fetched_at.is_(None))
+        .order_by(Album.id)
+        .limit(limit)
+    )
+    albums = res.all()
+    if not albums:
+        return 0
+    found = await _lookup(client, albums)
+    done = {album_id: genres for album_id, genres in found.items() if genres is not None}
+    if not done:
+        # Spotify is unreachable or refusing us; leave the albums for the next run.
+        return 0
+
+    lists = {
+        album_id: list(dict.fromkeys(normalize_genre(g) for g in genres))[:MAX_ALBUM_GENRES]
+        for album_id, genres in done.items()
+    }
+    ids = await _genre_ids(db, (g for genres in lists.values() for g in genres))
+    await db.execute(delete(AlbumGenre).where(AlbumGenre.album_id.in_(list(lists))))
+    links = [{"album_id": album_id, "genre_id": ids[g]} for album_id, genres in lists.items() for g in genres]
+    if links:
+        await db.execute(insert(AlbumGenre), links)
+    now = datetime.utcnow()
+    await db.execute(
+        update(Album.__table__)
+        .where(Album.__table__.c.id == bindparam("album_id"))
+        .values(genres=bindparam("names"), genres_fetched_at=now),
+        [{"album_id": album_id, "names": ", ".join(genres) or None} for album_id, genres in lists.items()],
+    )
+    await db.commit()
+    return len(lists)
+
+
+async def enrich_genres(max_albums: Optional[int] = None, log: Callable[[str], None] = logger.info) -> int:
+    """Enrich albums batch by batch until none are left (or ``max_albums`` is reached)."""
+    if not spotify_app.configured:
+        raise RuntimeError("Genre enrichment needs SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET.")
+    total = 0
+    while max_albums is None or total < max_albums:
+        limit = ENRICH_BATCH if max_albums is None else min(ENRICH_BATCH, max_albums - total)
+        async with SessionLocal() as db:
+            done = await enrich_batch(db, limit=limit)
+        if not done:
+            break
+        total += done
+        log(f"genres enriched for {total} albums")
+    return total
+
+
+async def enrich_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            albums = await enrich_genres()
+            if albums:
+                logger.info("genre enrichment added %d albums", albums)
+        except Exception:  # pragma: no cover - keep the loop alive across transient errors
+            logger.exception("genre enrichment failed")
+
+
+router = APIRouter(prefix="/genres", tags=["genres"])
+
+
+@router.get("", response_model=GenresResponse)
+async def list_genres(
+    limit: int = Query(50, ge=1, le=MAX_GENRES_LISTED),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    """Genres among the user's rated albums, most common first, for the /rankings genre filter."""
+    albums = func.count(AlbumGenre.album_id)
+    res = await db.execute(
+        select(Genre.name, albums)
+        .join(AlbumGenre, AlbumGenre.genre_id == Genre.id)
+        .join(EloScore, (EloScore.album_id == AlbumGenre.album_id) & (EloScore.user_id == user.id))
+        .group_by(Genre.name)
+        .order_by(albums.desc(), Genre.name)
+        .limit(limit)
+    )
+    return FastJSONResponse({"items": [{"name": name, "albums": count} for name, count in res.all()]})
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.genres", description="Fill album genres from Spotify artist metadata."
+    )
+    parser.add_argument("--max-albums", type=int, default=None, help="stop after this many albums")
+    args = parser.parse_args(argv)
+
+    async def run() -> int:
+        try:
+            return await enrich_genres(args.max_albums, log=print)
+        finally:
+            await spotify_app.aclose()
+
+    print(f"{asyncio.run(run())} albums enriched")
+    return 0
+
+
+__all__ = [
+    "normalize_genre",
+    "genre_album_ids",
+    "genres_stamp",
+    "enrich_batch",
+    "enrich_genres",
+    "enrich_periodically",
+    "router",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
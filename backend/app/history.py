@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import zlib
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .archive import ELO_COLUMNS as ARCHIVED_ELO, to_micros, user_archive
+from .catalog import RankingRow, album_catalog
+from .changes import OldState, record_ranking_changes
+from .community import normalized_rating, record_ratings
+from .exclusions import get_exclusions
+from .inference import invalidate_closure
+from .models import Album, Comparison, EloScore, RatingSnapshot
+from .rankings import merge_ranking_rows
+from .stats import forget_comparisons
+from .versioning import bump_data_version
+
+# A snapshot is taken on every Nth data version, so a point-in-time lookup replays at most about
+# this many votes on top of the nearest one.
+SNAPSHOT_EVERY = 200
+UNDO_MAX = 50
+
+# album_id -> (elo, comparisons_count)
+Ratings = Dict[int, Tuple[float, int]]
+
+
+def pack_ratings(ratings: Iterable[Tuple[int, float, int]]) -> Tuple[int, bytes]:
+    """(album count, compressed blob) for rows of (album_id, elo, comparisons_count)."""
+    ids, elos, counts = array("q"), array("d"), array("q")
+    for album_id, elo, count in ratings:
+        ids.append(album_id)
+        elos.append(elo)
+        counts.append(count or 0)
+    return len(ids), zlib.compress(ids.tobytes() + elos.tobytes() + counts.tobytes())
+
+
+def unpack_ratings(albums: int, data: bytes) -> Ratings:
+    raw = zlib.decompress(data)
+    width = albums * 8
+    ids, elos, counts = array("q"), array("d"), array("q")
+    ids.frombytes(raw[:width])
+    elos.frombytes(raw[width : 2 * width])
+    counts.frombytes(raw[2 * width :])
+    return {album_id: (elo, count) for album_id, elo, count in zip(ids, elos, counts)}
+
+
+def _snapshot_queries(user_id: int):
+    return (
+        select(EloScore.album_id, EloScore.elo, EloScore.comparisons_count)
+        .where(EloScore.user_id == user_id)
+        .order_by(EloScore.album_id),
+        select(func.max(Comparison.id)).where(Comparison.user_id == user_id),
+    )
+
+
+async def take_snapshot(db: AsyncSession, user_ids: int | Iterable[int], reset: bool = True) -> None:
+    """Store the users' current ratings. Call inside the transaction that changed them.
+
+    ``reset`` marks a bulk rewrite; periodic snapshots taken after ordinary votes pass False.
+    """
+    ids = [user_ids] if isinstance(user_ids, int) else sorted(set(user_ids))
+    for user_id in ids:
+        scores_q, latest_q = _snapshot_queries(user_id)
+        albums, data = pack_ratings((await db.execute(scores_q)).all())
+        latest = max((await db.execute(latest_q)).scalar_one() or 0, user_archive(user_id).last_id)
+        db.add(RatingSnapshot(user_id=user_id, last_comparison_id=latest, albums=albums, data=data, reset=reset))
+
+
+def take_snapshots_sync(conn: Connection) -> int:
+    """Snapshot every user with ratings; used when history starts. Returns the number of users."""
+    user_ids = conn.execute(select(EloScore.user_id).distinct()).scalars().all()
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        scores_q, latest_q = _snapshot_queries(user_id)
+        albums, data = pack_ratings(conn.execute(scores_q).all())
+        conn.execute(
+            insert(RatingSnapshot).values(
+                user_id=user_id,
+                taken_at=now,
+                last_comparison_id=max(conn.execute(latest_q).scalar_one() or 0, user_archive(user_id).last_id),
+                albums=albums,
+                data=data,
+                reset=True,
+            )
+        )
+    return len(user_ids)
+
+
+async def maybe_snapshot(db: AsyncSession, user_id: int, version: Optional[int]) -> None:
+    if version and version % SNAPSHOT_EVERY == 0:
+        await take_snapshot(db, user_id, reset=False)
+
+
+def _utc(at: datetime) -> datetime:
+    # Timestamps are stored as naive UTC.
+    return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+
+async def ratings_at(db: AsyncSession, user_id: int, at: datetime) -> Optional[Ratings]:
+    """The user's ratings as of ``at``: the nearest earlier snapshot plus the votes after it.
+
+    Without an earlier snapshot, votes are replayed from an empty ranking, unless the first
+    snapshot is a reset; then ``at`` predates the recorded history and the result is None.
+    """
+    at = _utc(at)
+    res = await db.execute(
+        select(RatingSnapshot)
+        .where(RatingSnapshot.user_id == user_id, RatingSnapshot.taken_at <= at)
+        .order_by(RatingSnapshot.taken_at.desc(), RatingSnapshot.id.desc())
+        .limit(1)
+    )
+    snapshot = res.scalar_one_or_none()
+    if snapshot is not None:
+        ratings, after_id = unpack_ratings(snapshot.albums, snapshot.data), snapshot.last_comparison_id
+    else:
+        res = await db.execute(
+            select(RatingSnapshot.reset)
+            .where(RatingSnapshot.user_id == user_id)
+            .order_by(RatingSnapshot.taken_at, RatingSnapshot.id)
+            .limit(1)
+        )
+        if res.scalar_one_or_none():
+            return None
+        ratings, after_id = {}, 0
+
+    pending: Dict[int, int] = {}
+
+    def replay(rows: Iterable[Tuple]) -> None:
+        for album_a, album_b, a_before, a_after, b_before, b_after in rows:
+            # A placement probe records the ranked opponent's side only. A vote with no Elo on
+            # either side (older or imported) has nothing to replay.
+            probe = (a_after is None) != (b_after is None)
+            for album_id, before, after in ((album_a, a_before, a_after), (album_b, b_before, b_after)):
+                if after is None:
+                    if probe:
+                        # Probe for an album still being placed; it is seeded with one count per probe.
+                        pending[album_id] = pending.get(album_id, 0) + 1
+                elif before is None:
+                    ratings[album_id] = (after, pending.pop(album_id, 0) + 1)
+                else:
+                    _, count = ratings.get(album_id, (before, 0))
+                    ratings[album_id] = (after, count + 1)
+
+    archive = user_archive(user_id)
+    until = to_micros(at)
+    for chunk in archive.chunks(after_id):
+        keep = chunk["created_at"] <= until
+        columns = [chunk[name][keep].tolist() for name in ("album_a_id", "album_b_id", *ARCHIVED_ELO)]
+        # NaN marks a side without a recorded Elo, like NULL in the hot table.
+        replay(tuple(None if value != value else value for value in row) for row in zip(*columns))
+
+    result = await db.stream(
+        select(
+            Comparison.album_a_id,
+            Comparison.album_b_id,
+            Comparison.elo_a_before,
+            Comparison.elo_a_after,
+            Comparison.elo_b_before,
+            Comparison.elo_b_after,
+        )
+        .where(
+            Comparison.user_id == user_id,
+            Comparison.id > max(after_id, archive.last_id),
+            Comparison.created_at <= at,
+        )
+        .order_by(Comparison.id)
+        .execution_options(yield_per=5_000)
+    )
+    async for rows in result.partitions(5_000):
+        replay(rows)
+    return ratings
+
+
+async def rankings_at(db: AsyncSession, user_id: int, at: datetime) -> Optional[List]:
+    """Merged ranking entries (as ``/rankings`` returns them) as of ``at``."""
+    ratings = await ratings_at(db, user_id, at)
+    if ratings is None:
+        return None
+    excluded = await get_exclusions(db, user_id)
+    ids = sorted(album_id for album_id in ratings if album_id not in excluded)
+    albums = await album_catalog.lookup(db, ids)
+    rows = [RankingRow(albums[album_id], *ratings[album_id]) for album_id in ids if album_id in albums]
+    return merge_ranking_rows(rows)
+
+
+async def undo_votes(db: AsyncSession, user_id: int, count: int) -> List[int]:
+    """Revert the user's last ``count`` votes from their recorded Elo deltas; returns undone ids.
+
+    Stops early at a vote without deltas for both sides (older and imported votes, placement
+    probes) or one from before a bulk rewrite of the ratings, since those cannot be reverted
+    without a replay.
+    """
+    floor_res = await db.execute(
+        select(func.max(RatingSnapshot.last_comparison_id)).where(
+            RatingSnapshot.user_id == user_id, RatingSnapshot.reset.is_(True)
+        )
+    )
+    floor = floor_res.scalar_one() or 0
+    res = await db.execute(
+        select(Comparison).where(Comparison.user_id == user_id).order_by(Comparison.id.desc()).limit(count)
+    )
+    votes = []
+    for vote in res.scalars().all():
+        if vote.id <= floor or None in (vote.elo_a_before, vote.elo_a_after, vote.elo_b_before, vote.elo_b_after):
+            break
+        votes.append(vote)
+    if not votes:
+        return []
+
+    album_ids = {album_id for vote in votes for album_id in (vote.album_a_id, vote.album_b_id)}
+    res = await db.execute(select(EloScore).where(EloScore.user_id == user_id, EloScore.album_id.in_(album_ids)))
+    scores = {score.album_id: score for score in res.scalars().all()}
+    excluded = await get_exclusions(db, user_id)
+    old_states: Dict[int, OldState] = {
+        album_id: (score.elo, score.comparisons_count) for album_id, score in scores.items() if album_id not in excluded
+    }
+    old_ratings = {album_id: normalized_rating(score.elo) for album_id, score in scores.items()}
+
+    # Newest first, so each vote's delta comes off the Elo it produced.
+    for vote in votes:
+        for album_id, before, after in (
+            (vote.album_a_id, vote.elo_a_before, vote.elo_a_after),
+            (vote.album_b_id, vote.elo_b_before, vote.elo_b_after),
+        ):
+            score = scores.get(album_id)
+            if score is not None:
+                score.elo -= after - before
+                score.comparisons_count -= 1
+        await db.delete(vote)
+
+    rating_changes = {}
+    unrated = []
+    for album_id, score in scores.items():
+        if score.comparisons_count <= 0:
+            if not score.prior_count:
+                # The vote being undone created this score; a seeded one goes back to its prior.
+                await db.delete(score)
+                unrated.append(album_id)
+            rating_changes[album_id] = (None, old_ratings[album_id])
+        else:
+            rating_changes[album_id] = (normalized_rating(score.elo), old_ratings[album_id])
+    await record_ratings(db, rating_changes)
+
+    undone = [vote.id for vote in votes]
+    await db.execute(
+        delete(RatingSnapshot).where(RatingSnapshot.user_id == user_id, RatingSnapshot.last_comparison_id >= undone[-1])
+    )
+    res = await db.execute(select(Album).where(Album.id.in_(album_ids)))
+    await forget_comparisons(db, user_id, votes, {album.id: album for album in res.scalars().all()}, unrated)
+    version = await bump_data_version(db, user_id)
+    await record_ranking_changes(db, user_id, version, old_states)
+    await db.commit()
+    invalidate_closure(user_id)
+    return undone
+
+
+__all__ = [
+    "SNAPSHOT_EVERY",
+    "UNDO_MAX",
+    "pack_ratings",
+    "unpack_ratings",
+    "take_snapshot",
+    "take_snapshots_sync",
+    "maybe_snapshot",
+    "ratings_at",
+    "rankings_at",
+    "undo_votes",
+]
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Optional
+
+import httpx
+
+from .metrics import OUTBOUND_LATENCY, OUTBOUND_REQUESTS
+
+# Replaces the real network transport for every outbound client when set (benchmarks use this).
+_upstream_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def set_upstream_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    global _upstream_transport
+    _upstream_transport = transport
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Records call counts and latency per external service, including failed connections."""
+
+    def __init__(self, service: str, inner: httpx.AsyncBaseTransport, owns_inner: bool = True) -> None:
+        self.service = service
+        self.inner = inner
+        self.owns_inner = owns_inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.inner.handle_async_request(request)
+            outcome = str(response.status_code)
+            return response
+        finally:
+            OUTBOUND_LATENCY.observe(time.perf_counter() - started, (self.service,))
+            OUTBOUND_REQUESTS.inc((self.service, outcome))
+
+    async def aclose(self) -> None:
+        if self.owns_inner:
+            await self.inner.aclose()
+
+
+def outbound_client(service: str, **kwargs: Any) -> httpx.AsyncClient:
+    """``httpx.AsyncClient`` for calls to Spotify, Last.fm and other external services."""
+    if _upstream_transport is not None:
+        transport = InstrumentedTransport(service, _upstream_transport, owns_inner=False)
+    else:
+        transport = InstrumentedTransport(service, httpx.AsyncHTTPTransport())
+    return httpx.AsyncClient(transport=transport, **kwargs)
+
+
+__all__ = ["outbound_client", "set_upstream_transport", "InstrumentedTransport"]
@@ -7,6 +7,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from .core.config import settings
 from .db import get_db
 from .models import Album, User, UserAlbum
+from .stats import record_library_albums
+from .versioning import bump_data_version
 
 router = APIRouter(prefix="/import", tags=["import"])
 
@@ -29,6 +31,7 @@ async def import_demo_albums(db: AsyncSession = Depends(get_db)):
     ]
 
     created = 0
+    linked: list[Album] = []
     for da in demo_albums:
         existing_q = await db.execute(
             select(Album).where(Album.title == da["title"], Album.artist == da["artist"])
@@ -46,6 +49,9 @@ async def import_demo_albums(db: AsyncSession = Depends(get_db)):
         link = link_q.scalar_one_or_none()
         if not link:
             db.add(UserAlbum(user_id=user.id, album_id=album.id, added_from="demo"))
+            linked.append(album)
 
+    await record_library_albums(db, user.id, linked)
+    await bump_data_version(db, user.id)
     await db.commit()
     return {"status": "ok", "created_albums": created}
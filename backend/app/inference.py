@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .archive import UserArchive, user_archive
+from .models import Comparison
+
+# Users whose closures stay in memory per process; each costs about 2 * n^2 / 8 bytes for n albums.
+MAX_CACHED_USERS = 256
+# Random pairs /compare/next tries before accepting one whose outcome is already implied.
+MAX_SAMPLE_TRIES = 20
+
+
+def _bits(mask: int) -> Iterator[int]:
+    # Scanning the binary string is linear in the width; peeling low bits off a big int is quadratic.
+    digits = bin(mask)[:1:-1]
+    i = digits.find("1")
+    while i >= 0:
+        yield i
+        i = digits.find("1", i + 1)
+
+
+class PreferenceClosure:
+    """Transitive closure of one user's "A beat B" votes, as a bitset of descendants per album.
+
+    Adding an edge u -> v ORs v and everything below it into u and everything above u, and the
+    reverse into the ancestor sets, so each vote costs O(|ancestors| + |descendants|) big-int ORs
+    rather than a full recomputation. Votes that contradict an already implied order (or repeat
+    one) leave the closure unchanged, so it stays acyclic. Draws add no edge.
+    """
+
+    __slots__ = ("index", "desc", "anc", "resolved", "contradictions", "last_comparison_id", "comparisons")
+
+    def __init__(self) -> None:
+        self.index: Dict[int, int] = {}
+        self.desc: List[int] = []
+        self.anc: List[int] = []
+        self.resolved = 0
+        self.contradictions = 0
+        self.last_comparison_id = 0
+        # Comparisons (draws included) with ids up to last_comparison_id when it was caught up.
+        self.comparisons = 0
+
+    def _node(self, album_id: int) -> int:
+        node = self.index.get(album_id)
+        if node is None:
+            node = len(self.desc)
+            self.index[album_id] = node
+            self.desc.append(0)
+            self.anc.append(0)
+        return node
+
+    def add(self, winner_id: int, loser_id: int) -> bool:
+        """Record that ``winner_id`` beat ``loser_id``; False if the closure did not change."""
+        u, v = self._node(winner_id), self._node(loser_id)
+        if u == v or (self.desc[v] >> u) & 1:
+            self.contradictions += u != v
+            return False
+        if (self.desc[u] >> v) & 1:
+            return False
+        below = self.desc[v] | (1 << v)
+        above = self.anc[u] | (1 << u)
+        for a in _bits(above):
+            new = below & ~self.desc[a]
+            if new:
+                self.desc[a] |= new
+                self.resolved += new.bit_count()
+        for d in _bits(below):
+            self.anc[d] |= above
+        return True
+
+    def implied(self, album_a: int, album_b: int) -> bool:
+        a, b = self.index.get(album_a), self.index.get(album_b)
+        if a is None or b is None:
+            return False
+        return bool((self.desc[a] >> b) & 1 or (self.desc[b] >> a) & 1)
+
+    @property
+    def albums(self) -> int:
+        return len(self.desc)
+
+
+_CLOSURES: "OrderedDict[int, PreferenceClosure]" = OrderedDict()
+
+
+def invalidate_closure(user_id: int | None = None) -> None:
+    """Drop cached closures after comparisons are deleted or rewritten."""
+    if user_id is None:
+        _CLOSURES.clear()
+    else:
+        _CLOSURES.pop(user_id, None)
+
+
+def _add_archived(closure: PreferenceClosure, archive: UserArchive, after_id: int) -> None:
+    # Straight from the mapped columns; winner is 1 for album A, 2 for album B, 0 for a draw.
+    for chunk in archive.chunks(after_id):
+        for album_a_id, album_b_id, winner in zip(
+            chunk["album_a_id"].tolist(), chunk["album_b_id"].tolist(), chunk["winner"].tolist()
+        ):
+            if winner == 1:
+                closure.add(album_a_id, album_b_id)
+            elif winner == 2:
+                closure.add(album_b_id, album_a_id)
+
+
+def _add_hot(closure: PreferenceClosure, rows: Iterable[Tuple[int, int, Any]]) -> None:
+    for album_a_id, album_b_id, winner_id in rows:
+        loser_id = album_b_id if winner_id == album_a_id else album_a_id
+        closure.add(winner_id, loser_id)
+
+
+def _build(archive: UserArchive, rows: List[Tuple[int, int, Any]]) -> PreferenceClosure:
+    closure = PreferenceClosure()
+    _add_archived(closure, archive, 0)
+    _add_hot(closure, rows)
+    return closure
+
+
+def _archived_up_to(archive: UserArchive, last_id: int) -> int:
+    return archive.count - sum(len(chunk["id"]) for chunk in archive.chunks(last_id))
+
+
+async def get_closure(db: AsyncSession, user_id: int) -> PreferenceClosure:
+    """The user's closure, caught up with any votes recorded since it was last used.
+
+    New votes normally arrive with higher ids, so catching up reads just the rows above the last
+    one seen; other workers' votes are picked up the same way. A transaction can still commit a
+    lower id after a higher one was read, so the rows up to that id are counted again, and a
+    mismatch (or a deleted row) rebuilds the closure. Rebuilds run in a worker thread.
+    """
+    closure = _CLOSURES.get(user_id)
+    archive = user_archive(user_id)
+    seen = closure.last_comparison_id if closure is not None else 0
+    latest_res = await db.execute(
+        select(func.max(Comparison.id), func.count(), func.count(case((Comparison.id <= seen, 1)))).where(
+            Comparison.user_id == user_id, Comparison.id > archive.last_id
+        )
+    )
+    latest, hot_total, hot_seen = latest_res.one()
+    latest = latest or archive.last_id
+    if closure is not None and (
+        latest < closure.last_comparison_id
+        or hot_seen + _archived_up_to(archive, closure.last_comparison_id) != closure.comparisons
+    ):
+        closure = None
+
+    def hot_rows(after_id: int):
+        return (
+            select(Comparison.album_a_id, Comparison.album_b_id, Comparison.winner_album_id)
+            .where(
+                Comparison.user_id == user_id,
+                Comparison.id > max(after_id, archive.last_id),
+                Comparison.id <= latest,
+                Comparison.winner_album_id.is_not(None),
+            )
+            .order_by(Comparison.id)
+        )
+
+    if closure is None:
+        rows = (await db.execute(hot_rows(0))).all()
+        closure = await asyncio.to_thread(_build, archive, rows)
+    elif latest > closure.last_comparison_id:
+        _add_archived(closure, archive, closure.last_comparison_id)
+        result = await db.stream(hot_rows(closure.last_comparison_id).execution_options(yield_per=5_000))
+        async for rows in result.partitions(5_000):
+            _add_hot(closure, rows)
+    closure.last_comparison_id = latest
+    closure.comparisons = hot_total + archive.count
+
+    _CLOSURES[user_id] = closure
+    _CLOSURES.move_to_end(user_id)
+    while len(_CLOSURES) > MAX_CACHED_USERS:
+        _CLOSURES.popitem(last=False)
+    return closure
+
+
+__all__ = ["PreferenceClosure", "get_closure", "invalidate_closure", "MAX_SAMPLE_TRIES"]
@@ -2,18 +2,24 @@ from __future__ import annotations
 
 import hashlib
 import os
-from typing import Any, Dict, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-import httpx
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import RedirectResponse
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .catalog import AlbumRecord, album_catalog
 from .core.config import settings
 from .db import get_db
+from .http_client import outbound_client
 from .models import Album, User, UserAlbum
+from .priors import LASTFM_PRIOR_COUNT, best_signal, finish_seeding, rank_priors, seed_elo as seed_elo_priors
 from .spotify import require_spotify_user
+from .stats import record_library_albums
+from .sync import get_sync_state, save_sync_state
+from .versioning import bump_data_version
 
 router = APIRouter(prefix="/auth/lastfm", tags=["lastfm"])
 import_router = APIRouter(prefix="/import/lastfm", tags=["lastfm-import"])
@@ -56,7 +62,7 @@ async def lastfm_callback(token: str, db: AsyncSession = Depends(get_db), user:
     sig = _sign_lastfm(params, api_secret)
     params["api_sig"] = sig
 
-    async with httpx.AsyncClient() as client:
+    async with outbound_client("lastfm") as client:
         r = await client.get(LASTFM_API_URL, params=params)
     if r.status_code != 200:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Last.fm auth failed")
@@ -87,6 +93,42 @@ def _normalize(s: str) -> str:
     return "".join(ch.lower() for ch in s if ch.isalnum() or ch.isspace()).strip()
 
 
+# (normalized artist, normalized title) -> album ids, over the whole catalog. Built on first use and
+# kept in step with it, since SQL cannot apply the normalization (SQLite's lower() only folds ASCII).
+_BY_NAME: Optional[Dict[Tuple[str, str], Set[int]]] = None
+
+
+def _name_key(record: Any) -> Tuple[str, str]:
+    return (_normalize(record.artist), _normalize(record.title))
+
+
+def _on_catalog_change(position: int, old: Optional[AlbumRecord], new: Optional[AlbumRecord]) -> None:
+    if _BY_NAME is None:
+        return
+    if old is not None:
+        ids = _BY_NAME.get(_name_key(old))
+        if ids is not None:
+            ids.discard(old.id)
+            if not ids:
+                del _BY_NAME[_name_key(old)]
+    if new is not None:
+        _BY_NAME.setdefault(_name_key(new), set()).add(new.id)
+
+
+album_catalog.add_listener(_on_catalog_change)
+
+
+async def _albums_named(db: AsyncSession, artist: str, title: str) -> List[int]:
+    global _BY_NAME
+    await album_catalog.ensure(db)
+    if _BY_NAME is None:
+        by_name: Dict[Tuple[str, str], Set[int]] = {}
+        for _, record in album_catalog.records():
+            by_name.setdefault(_name_key(record), set()).add(record.id)
+        _BY_NAME = by_name
+    return sorted(_BY_NAME.get((_normalize(artist), _normalize(title)), ()))
+
+
 async def _find_or_create_album(
     db: AsyncSession,
     *,
@@ -110,13 +152,24 @@ async def _find_or_create_album(
                 album.source = source_hint
             return album
 
-    res = await db.execute(
-        select(Album).where(
-            _normalize(Album.artist) == norm_artist,
-            _normalize(Album.title) == norm_title,
+    # Match on the normalized name in the catalog; albums other workers added since it was loaded
+    # are only in the database, where both sides are lowered by SQL as far as it can.
+    album = None
+    for album_id in await _albums_named(db, artist, title):
+        album = await db.get(Album, album_id)
+        if album is not None:
+            break
+    if album is None:
+        res = await db.execute(
+            select(Album).where(
+                func.lower(Album.artist) == func.lower(artist.strip()),
+                func.lower(Album.title) == func.lower(title.strip()),
+            )
+        )
+        album = next(
+            (a for a in res.scalars().all() if _normalize(a.artist) == norm_artist and _normalize(a.title) == norm_title),
+            None,
         )
-    )
-    album = res.scalar_one_or_none()
     if album:
         if not album.cover_url and image_url:
             album.cover_url = image_url
@@ -138,65 +191,138 @@ async def _find_or_create_album(
     return album
 
 
-async def _lastfm_api_get(user_key: str, extra_params: Dict[str, Any]) -> Dict[str, Any]:
+async def _lastfm_api_get(user_key: Optional[str], extra_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Call the Last.fm API; public methods such as user.getTopAlbums need no session key."""
     api_key, _ = _get_lastfm_creds()
     params = {
         "api_key": api_key,
-        "sk": user_key,
         "format": "json",
     }
+    if user_key:
+        params["sk"] = user_key
     params.update(extra_params)
-    async with httpx.AsyncClient() as client:
+    async with outbound_client("lastfm") as client:
         r = await client.get(LASTFM_API_URL, params=params)
     if r.status_code != 200:
         raise HTTPException(status_code=400, detail=f"Last.fm API error: {r.text}")
     return r.json()
 
 
-@import_router.post("/top-albums")
-async def import_lastfm_top_albums(
-    db: AsyncSession = Depends(get_db),
-    user: User = Depends(require_spotify_user),
-    limit: int = 200,
-):
-    sess = LASTFM_SESSIONS.get(user.id)
-    if not sess:
-        raise HTTPException(status_code=400, detail="Last.fm not linked for this user")
+# Chart periods of user.getTopAlbums and the days each covers, shortest first.
+LASTFM_PERIODS = (("7day", 7), ("1month", 30), ("3month", 90), ("6month", 180), ("12month", 365))
+
 
-    username = sess["username"]
-    key = sess["key"]
+def resync_period(last_synced_at: Optional[datetime]) -> str:
+    """The shortest chart period covering everything played since the last complete sync."""
+    if last_synced_at is None:
+        return "overall"
+    # A day of slack for plays scrobbled late.
+    days = (datetime.utcnow() - last_synced_at).total_seconds() / 86400 + 1
+    for period, covers in LASTFM_PERIODS:
+        if days <= covers:
+            return period
+    return "overall"
 
+
+async def _library_keys(db: AsyncSession, user_id: int) -> Dict[Any, int]:
+    """The user's linked albums by MBID and by normalized (artist, title), to skip them without lookups."""
+    res = await db.execute(
+        select(Album.id, Album.mbid, Album.artist, Album.title)
+        .join(UserAlbum, UserAlbum.album_id == Album.id)
+        .where(UserAlbum.user_id == user_id)
+    )
+    keys: Dict[Any, int] = {}
+    for album_id, mbid, artist, title in res.all():
+        if mbid:
+            keys[mbid] = album_id
+        keys[(_normalize(artist), _normalize(title))] = album_id
+    return keys
+
+
+async def sync_top_albums(
+    db: AsyncSession, user: User, username: str, limit: int = 200, seed_elo: bool = True, full: bool = False
+) -> Dict[str, Any]:
+    """Link the user's most-played albums for the chart period since the last complete sync.
+
+    The first sync (or ``full``) reads the all-time chart; later ones read the shortest period
+    covering the time since, so only albums played recently come back. Albums already in the
+    library are skipped in memory. Play-count seeding only runs on all-time charts, where the
+    ranks describe the whole library.
+    """
     limit = max(10, min(limit, 500))
+    state = await get_sync_state(db, user.id, "lastfm")
+    period = "overall" if full or state is None else resync_period(state.last_synced_at)
 
-    data = await _lastfm_api_get(key, {"method": "user.getTopAlbums", "user": username, "limit": limit})
+    data = await _lastfm_api_get(
+        None, {"method": "user.getTopAlbums", "user": username, "limit": limit, "period": period}
+    )
     albums = data.get("topalbums", {}).get("album", [])
+    library = await _library_keys(db, user.id)
 
     imported = 0
+    linked: list[Album] = []
+    playcounts: list[tuple[int, float]] = []
     for a in albums:
         name = a.get("name")
         artist = a.get("artist", {}).get("name") or ""
         if not name or not artist:
             continue
         mbid = a.get("mbid") or None
-        imgs = a.get("image") or []
-        image_url = imgs[-1]["#text"] if imgs else None
-
-        album = await _find_or_create_album(
-            db,
-            artist=artist,
-            title=name,
-            mbid=mbid,
-            image_url=image_url,
-            source_hint="lastfm",
-        )
+        album_id = library.get(mbid) if mbid else None
+        if album_id is None:
+            album_id = library.get((_normalize(artist), _normalize(name)))
+        if album_id is None:
+            imgs = a.get("image") or []
+            image_url = imgs[-1]["#text"] if imgs else None
+
+            album = await _find_or_create_album(
+                db,
+                artist=artist,
+                title=name,
+                mbid=mbid,
+                image_url=image_url,
+                source_hint="lastfm",
+            )
+            album_id = album.id
+
+            res = await db.execute(
+                select(UserAlbum).where(UserAlbum.user_id == user.id, UserAlbum.album_id == album.id)
+            )
+            link = res.scalar_one_or_none()
+            if not link:
+                db.add(UserAlbum(user_id=user.id, album_id=album.id, added_from="lastfm"))
+                linked.append(album)
+                imported += 1
+            library[(_normalize(artist), _normalize(name))] = album_id
+        try:
+            playcounts.append((album_id, float(a.get("playcount") or 0)))
+        except (TypeError, ValueError):
+            pass
+
+    seeded = 0
+    if seed_elo and period == "overall":
+        await db.flush()
+        seeded = await seed_elo_priors(db, user.id, rank_priors(best_signal(playcounts)), LASTFM_PRIOR_COUNT)
+    await save_sync_state(db, user.id, "lastfm", imported=imported, account=username)
+    await bump_data_version(db, user.id)
+    if seeded:
+        await finish_seeding(db, user.id)
+    else:
+        await record_library_albums(db, user.id, linked)
+    await db.commit()
+    return {"status": "ok", "imported": imported, "seeded": seeded, "period": period}
 
-        res = await db.execute(
-            select(UserAlbum).where(UserAlbum.user_id == user.id, UserAlbum.album_id == album.id)
-        )
-        link = res.scalar_one_or_none()
-        if not link:
-            db.add(UserAlbum(user_id=user.id, album_id=album.id, added_from="lastfm"))
-            imported += 1
 
-    await db.commit()
-    return {"status": "ok", "imported": imported}
+@import_router.post("/top-albums")
+async def import_lastfm_top_albums(
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+    limit: int = 200,
+    seed_elo: bool = True,
+    full: bool = False,
+):
+    """Link the user's most-played albums; with ``seed_elo`` they start at an Elo from their play-count rank."""
+    sess = LASTFM_SESSIONS.get(user.id)
+    if not sess:
+        raise HTTPException(status_code=400, detail="Last.fm not linked for this user")
+    return await sync_top_albums(db, user, sess["username"], limit, seed_elo, full)
@@ -1,32 +1,62 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import random
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .core.config import settings
-from .core.elo import update_elo, elo_to_100
-from .db import get_db, init_db
-from .models import Album, EloScore, Comparison, User, UserAlbumExclusion
-from .schemas import ComparePair, ComparePairAlbum, CompareSubmit, RankingsResponse, RankingEntry, StatsResponse, ExcludeAlbumRequest
+from .db import engine, get_db, check_schema
+from .fastjson import FastJSONResponse
+from .rankings import (
+    album_dict,
+    build_ranking_changes,
+    load_ranking_rows,
+    merge_ranking_rows,
+)
+from .metrics import MetricsMiddleware, router as metrics_router
+from .exclusions import get_exclusions, exclude_albums, unexclude_albums
+from .archive import archive_periodically, user_archive
+from .catalog import album_catalog
+from .changes import load_recent_changes
+from .search import (
+    DEFAULT_LIMIT as DEFAULT_SEARCH_LIMIT,
+    MAX_LIMIT as MAX_SEARCH_LIMIT,
+    ensure_search_index,
+    warm_search_index,
+)
+from .genres import (
+    enrich_periodically as enrich_genres_periodically,
+    genre_album_ids,
+    genres_stamp,
+    router as genres_router,
+)
+from .history import UNDO_MAX, rankings_at, undo_votes
+from .inference import MAX_SAMPLE_TRIES, get_closure
+from .placement import next_placement_pair
+from .refinement import DEFAULT_CONFIDENCE, DEFAULT_K, MAX_K, find_boundary, pick_pair, progress as refinement_progress, stable_updates
+from .sync import resync_periodically, sync_states
+from .stats import build_stats_response, get_user_stats
+from .versioning import cache_headers, data_etag, not_modified
+from .votes import record_vote
+from .vote_buffer import get_vote_buffer, start_vote_buffer, stop_vote_buffer
+from .models import EloScore, Comparison, User, UserAlbum
+from .schemas import CompareMeta, ComparePair, CompareSubmit, ResolvedPairs, AlbumSearchResponse, ImportSyncStatesResponse, RankingChangesResponse, RankingsResponse, StatsResponse, ExcludeAlbumRequest, ExcludeAlbumsRequest
 from .auth import router as auth_router
 from .imports import router as import_router
+from .spotify_resolver import spotify_app
 from .spotify import router as spotify_auth_router, import_router as spotify_import_router, require_spotify_user
-
-
-def choose_canonical_album(a: Album, b: Album) -> Album:
-    # Prefer album with spotify_id, else with any cover_url, else newer year, else higher id for stability.
-    if bool(a.spotify_id) != bool(b.spotify_id):
-        return a if a.spotify_id else b
-    if bool(a.cover_url) != bool(b.cover_url):
-        return a if a.cover_url else b
-    if (a.year or 0) != (b.year or 0):
-        return a if (a.year or 0) >= (b.year or 0) else b
-    return a if a.id >= b.id else b
 from .aoty_router import router as aoty_import_router
 from .lastfm import router as lastfm_router, import_router as lastfm_import_router
 from .auth_status import router as auth_status_router
+from .export import router as export_router
+from .community import reconcile_periodically, router as community_router
+from .recommendations import run_periodically as run_recommendations_periodically, router as recommendations_router
 
 
 app = FastAPI(title="AlbumDuel API")
@@ -39,13 +69,44 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.profiling_enabled:
+    from .profiling import ProfilingMiddleware, router as profiling_router
+
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(profiling_router)
+app.add_middleware(MetricsMiddleware)
+
+
+# Strong references keep background loops from being garbage-collected mid-run.
+_background_tasks: set[asyncio.Task] = set()
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
-    await init_db()
-    
-    
+    await check_schema()
+    _background_tasks.add(asyncio.create_task(warm_search_index()))
+    if settings.community_reconcile_interval > 0:
+        _background_tasks.add(
+            asyncio.create_task(reconcile_periodically(engine, settings.community_reconcile_interval))
+        )
+    if settings.recommendation_interval > 0:
+        _background_tasks.add(asyncio.create_task(run_recommendations_periodically(settings.recommendation_interval)))
+    if settings.archive_interval > 0:
+        _background_tasks.add(asyncio.create_task(archive_periodically(settings.archive_interval)))
+    if settings.genre_enrich_interval > 0:
+        _background_tasks.add(asyncio.create_task(enrich_genres_periodically(settings.genre_enrich_interval)))
+    if settings.import_sync_interval > 0:
+        _background_tasks.add(asyncio.create_task(resync_periodically(settings.import_sync_interval)))
+    if settings.vote_buffer_dir:
+        await start_vote_buffer(settings.vote_buffer_dir, settings.vote_buffer_flush_interval)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await stop_vote_buffer()
+    await spotify_app.aclose()
+
+
 app.include_router(auth_router)
 app.include_router(import_router)
 app.include_router(spotify_auth_router)
@@ -54,53 +115,155 @@ app.include_router(auth_status_router)
 app.include_router(aoty_import_router)
 app.include_router(lastfm_router)
 app.include_router(lastfm_import_router)
+app.include_router(metrics_router)
+app.include_router(export_router)
+app.include_router(community_router)
+app.include_router(recommendations_router)
+app.include_router(genres_router)
 
 
 async def get_current_user_id(user = Depends(require_spotify_user)) -> int:
     return user.id
 
 
+async def settle_votes(db: AsyncSession, user: Optional[User] = None, user_id: Optional[int] = None) -> None:
+    """Flush the user's buffered votes before a read or write that must see them.
+
+    ``user`` is refreshed so ETags are built from the data version the flush produced.
+    """
+    buffer = get_vote_buffer()
+    if buffer is not None and buffer.pending(user.id if user is not None else user_id):
+        await buffer.settle()
+        if user is not None:
+            await db.refresh(user)
+
+
 @app.get("/compare/next", response_model=ComparePair)
-async def get_next_pair(db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    # Simple random pair from user's albums (or global fallback)
-    res = await db.execute(
-        select(Album)
-        .where(~Album.id.in_(
-            select(UserAlbumExclusion.album_id).where(UserAlbumExclusion.user_id == user_id)
-        ))
-        .order_by(func.random())
-        .limit(2)
+async def get_next_pair(
+    mode: str = Query("random", pattern="^(random|placement|topk)$"),
+    k: int = Query(DEFAULT_K, ge=1, le=MAX_K),
+    confidence: float = Query(DEFAULT_CONFIDENCE, gt=0.5, lt=1.0),
+    genre: Optional[str] = Query(None, min_length=1, max_length=100),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    # Placement binary-searches unrated library albums into the ranking; topk duels albums that may
+    # still cross the K-th rank. When either has nothing left to do it falls back to a random pair.
+    # A genre limits random and topk pairs to that genre; placement slots into the whole ranking.
+    in_genre = await genre_album_ids(db, genre) if genre else None
+    picked = None
+    placement = None
+    refinement = None
+    if mode != "random":
+        await settle_votes(db, user_id=user_id)
+    if mode == "placement":
+        probe = await next_placement_pair(db, user_id)
+        if probe is not None:
+            album_id, opponent_id, placement = probe
+            picked = random.sample([album_id, opponent_id], 2)
+    elif mode == "topk":
+        rows = await load_ranking_rows(db, user_id)
+        if in_genre is not None:
+            rows = [row for row in rows if row.id in in_genre]
+        items = merge_ranking_rows(rows)
+        ids = [item["album"]["id"] for item in items]
+        elos = [item["elo"] for item in items]
+        boundary = find_boundary(elos, [item["comparisons_count"] for item in items], k, confidence)
+        if not boundary.converged:
+            # Interval overlap alone never settles albums rated close together; check whether the
+            # membership has held over the latest updates instead.
+            history = await load_recent_changes(db, user_id, boundary.required)
+            if in_genre is not None:
+                history = [{a: elo for a, elo in step.items() if a in in_genre} for step in history]
+                history = [step for step in history if step]
+            boundary.stable_updates = stable_updates({row.id: row.elo for row in rows}, history, k)
+        refinement = refinement_progress(boundary)
+        closure = await get_closure(db, user_id)
+        pair = pick_pair(boundary, elos, implied=lambda i, j: closure.implied(ids[i], ids[j]))
+        if pair is not None:
+            picked = random.sample([ids[pair[0]], ids[pair[1]]], 2)
+
+    if picked is None:
+        # Simple random pair from user's albums (or global fallback), skipping exclusions in memory.
+        excluded = await get_exclusions(db, user_id)
+        await album_catalog.ensure(db)
+        pool = album_catalog.ids() if in_genre is None else in_genre
+        candidates = [album_id for album_id in pool if album_id not in excluded]
+        if len(candidates) < 2:
+            raise HTTPException(status_code=400, detail="Not enough albums to compare")
+
+        # Skip pairs whose order already follows from earlier votes (A > B > C implies A > C).
+        closure = await get_closure(db, user_id)
+        for _ in range(MAX_SAMPLE_TRIES):
+            picked = random.sample(candidates, 2)
+            if not closure.implied(*picked):
+                break
+    by_id = await album_catalog.lookup(db, picked)
+    elo_res = await db.execute(
+        select(EloScore.album_id, EloScore.elo, EloScore.comparisons_count).where(
+            EloScore.user_id == user_id, EloScore.album_id.in_(picked)
+        )
     )
-    albums = res.scalars().all()
-    if len(albums) < 2:
-        raise HTTPException(status_code=400, detail="Not enough albums to compare")
+    elos = {album_id: (elo, count) for album_id, elo, count in elo_res.all()}
+    buffer = get_vote_buffer()
+    if buffer is not None:
+        # Show Elo including votes that have not been flushed yet.
+        for album_id in picked:
+            working = buffer.working_elo(user_id, album_id)
+            if working is not None:
+                elos[album_id] = working
 
     pairs = []
-    for a in albums:
-        elo_row = await db.execute(
-            select(EloScore).where(EloScore.user_id == user_id, EloScore.album_id == a.id)
-        )
-        elo = elo_row.scalar_one_or_none()
-        pairs.append(
-            ComparePairAlbum(
-                id=a.id,
-                title=a.title,
-                artist=a.artist,
-                year=a.year,
-                cover_url=a.cover_url,
-                spotify_id=a.spotify_id,
-                source=a.source,
-                cover_provider=a.cover_provider,
-                elo=elo.elo if elo else 1500.0,
-                comparisons_count=elo.comparisons_count if elo else 0,
-            )
-        )
+    for album_id in picked:
+        elo, count = elos.get(album_id, (1500.0, 0))
+        pairs.append({**album_dict(by_id[album_id]), "elo": elo, "comparisons_count": count})
 
+    archive = user_archive(user_id)
     total_comparisons_res = await db.execute(
-        select(func.count()).select_from(Comparison).where(Comparison.user_id == user_id)
+        select(func.count()).select_from(Comparison).where(Comparison.user_id == user_id, Comparison.id > archive.last_id)
     )
 
-    return ComparePair(album_a=pairs[0], album_b=pairs[1], total_comparisons=total_comparisons_res.scalar_one())
+    return FastJSONResponse(
+        {
+            "album_a": pairs[0],
+            "album_b": pairs[1],
+            "total_comparisons": total_comparisons_res.scalar_one() + archive.count,
+            "placement": placement,
+            "refinement": refinement,
+        }
+    )
+
+
+@app.get("/compare/meta", response_model=CompareMeta)
+async def get_compare_meta(request: Request, db: AsyncSession = Depends(get_db), user: User = Depends(require_spotify_user)):
+    await settle_votes(db, user)
+    etag = data_etag("compare-meta", user)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    stats = await get_user_stats(db, user.id)
+    return FastJSONResponse(
+        {
+            "total_comparisons": stats.total_comparisons - stats.excluded_comparisons,
+            "rated_albums": stats.rated_albums - stats.excluded_rated_albums,
+            "library_albums": stats.library_albums,
+            "data_version": user.data_version or 0,
+        },
+        headers=cache_headers(etag),
+    )
+
+
+@app.get("/compare/resolved", response_model=ResolvedPairs)
+async def get_resolved_pairs(db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    closure = await get_closure(db, user_id)
+    total = closure.albums * (closure.albums - 1) // 2
+    return ResolvedPairs(
+        albums=closure.albums,
+        total_pairs=total,
+        resolved_pairs=closure.resolved,
+        resolved_fraction=round(closure.resolved / total, 4) if total else 0.0,
+        contradictions=closure.contradictions,
+    )
 
 
 @app.post("/compare/submit")
@@ -111,144 +274,153 @@ async def submit_comparison(
 ):
     if payload.album_a_id == payload.album_b_id:
         raise HTTPException(status_code=400, detail="Albums must be different")
+    buffer = get_vote_buffer()
+    if buffer is not None:
+        if payload.mode == "random":
+            # Logged and fsynced, applied to the database by the next flush.
+            return await buffer.submit(db, user_id, payload)
+        # Placement bounds are read from the database, so earlier votes must land first.
+        await buffer.settle()
+    return await record_vote(db, user_id, payload)
+
+
+@app.post("/compare/undo")
+async def undo_comparisons(
+    count: int = Query(1, ge=1, le=UNDO_MAX),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    # Reverts the newest votes first; fewer than `count` are undone if an older vote has no deltas.
+    await settle_votes(db, user_id=user_id)
+    undone = await undo_votes(db, user_id, count)
+    return {"status": "ok", "undone": len(undone), "comparison_ids": undone}
+
+
+@app.get("/import/sync-state", response_model=ImportSyncStatesResponse)
+async def get_import_sync_state(db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    # When each source last finished a sync and how many albums it added.
+    return {"items": await sync_states(db, user_id)}
 
-    res = await db.execute(select(Album).where(Album.id.in_([payload.album_a_id, payload.album_b_id])))
-    albums = {a.id: a for a in res.scalars().all()}
-    if len(albums) != 2:
-        raise HTTPException(status_code=404, detail="Albums not found")
 
-    res = await db.execute(
-        select(EloScore).where(
-            EloScore.user_id == user_id, EloScore.album_id.in_([payload.album_a_id, payload.album_b_id])
+@app.get("/albums/search", response_model=AlbumSearchResponse)
+async def search_albums(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: str = Query("all", pattern="^(all|library|rated)$"),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    # Prefix and typo-tolerant matching over title and artist from the in-memory trigram index.
+    index = await ensure_search_index(db)
+    allowed = None
+    if scope == "library":
+        res = await db.execute(select(UserAlbum.album_id).where(UserAlbum.user_id == user_id))
+        allowed = set(res.scalars().all())
+    elif scope == "rated":
+        res = await db.execute(select(EloScore.album_id).where(EloScore.user_id == user_id))
+        allowed = set(res.scalars().all())
+    matches = index.search(q, limit, allowed)
+    ids = [record.id for _, record in matches]
+    elo_res = await db.execute(
+        select(EloScore.album_id, EloScore.elo, EloScore.comparisons_count).where(
+            EloScore.user_id == user_id, EloScore.album_id.in_(ids)
         )
     )
-    elo_rows = {e.album_id: e for e in res.scalars().all()}
-
-    def ensure_elo(album_id: int) -> EloScore:
-        if album_id not in elo_rows:
-            es = EloScore(user_id=user_id, album_id=album_id, elo=1500.0, comparisons_count=0)
-            db.add(es)
-            elo_rows[album_id] = es
-        return elo_rows[album_id]
-
-    ea = ensure_elo(payload.album_a_id)
-    eb = ensure_elo(payload.album_b_id)
-
-    if payload.winner_album_id is None:
-        score_a = 0.5
-    elif payload.winner_album_id == payload.album_a_id:
-        score_a = 1.0
-    elif payload.winner_album_id == payload.album_b_id:
-        score_a = 0.0
-    else:
-        raise HTTPException(status_code=400, detail="winner_album_id must be one of the compared albums or null")
-
-    new_a, new_b = update_elo(ea.elo, eb.elo, score_a, ea.comparisons_count, eb.comparisons_count)
-    ea.elo, eb.elo = new_a, new_b
-    ea.comparisons_count += 1
-    eb.comparisons_count += 1
-
-    cmp_row = Comparison(
-        user_id=user_id,
-        album_a_id=payload.album_a_id,
-        album_b_id=payload.album_b_id,
-        winner_album_id=payload.winner_album_id,
+    elos = {album_id: (elo, count) for album_id, elo, count in elo_res.all()}
+    library_res = await db.execute(
+        select(UserAlbum.album_id).where(UserAlbum.user_id == user_id, UserAlbum.album_id.in_(ids))
     )
-    db.add(cmp_row)
-    await db.commit()
-
-    return {"status": "ok"}
+    library = set(library_res.scalars().all())
+    excluded = await get_exclusions(db, user_id)
+    items = []
+    for score, record in matches:
+        elo, count = elos.get(record.id, (None, 0))
+        items.append(
+            {
+                "album": album_dict(record),
+                "score": score,
+                "elo": elo,
+                "comparisons_count": count,
+                "in_library": record.id in library,
+                "excluded": record.id in excluded,
+            }
+        )
+    return FastJSONResponse({"items": items})
 
 
 @app.post("/albums/exclude")
 async def exclude_album(payload: ExcludeAlbumRequest, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    existing = await db.execute(
-        select(UserAlbumExclusion).where(
-            UserAlbumExclusion.user_id == user_id,
-            UserAlbumExclusion.album_id == payload.album_id,
-        )
-    )
-    if not existing.scalar_one_or_none():
-        db.add(UserAlbumExclusion(user_id=user_id, album_id=payload.album_id))
-        await db.commit()
+    await exclude_albums(db, user_id, [payload.album_id])
     return {"status": "ok"}
 
 
+@app.post("/albums/exclude/bulk")
+async def exclude_albums_bulk(payload: ExcludeAlbumsRequest, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    excluded = await exclude_albums(db, user_id, payload.album_ids)
+    return {"status": "ok", "excluded": excluded}
+
+
+@app.post("/albums/unexclude")
+async def unexclude_album(payload: ExcludeAlbumRequest, db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    restored = await unexclude_albums(db, user_id, [payload.album_id])
+    return {"status": "ok", "restored": restored}
+
+
 @app.get("/rankings", response_model=RankingsResponse)
-async def get_rankings(db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+async def get_rankings(
+    request: Request,
+    at: Optional[datetime] = None,
+    genre: Optional[str] = Query(None, min_length=1, max_length=100),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    await settle_votes(db, user)
+    if at is not None:
+        # Point-in-time view: nearest snapshot plus the votes after it, not cached.
+        items = await rankings_at(db, user.id, at)
+        if items is None:
+            raise HTTPException(status_code=404, detail="No ranking history that far back")
+        if genre:
+            in_genre = await genre_album_ids(db, genre)
+            items = [item for item in items if item["album"]["id"] in in_genre]
+        return FastJSONResponse({"items": items})
+    # The auth lookup already loaded the data version, so a revalidation costs no further queries;
+    # a genre view also changes when enrichment tags more albums.
+    etag = data_etag("rankings", user) if not genre else data_etag("rankings", user, "genre", await genres_stamp(db))
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
     # Aggregate by logical album (title/artist/year), prefer canonical with artwork/source icon, merge Elo within group.
-    res = await db.execute(
-        select(Album, EloScore)
-        .join(EloScore, (EloScore.album_id == Album.id) & (EloScore.user_id == user_id))
-        .where(~Album.id.in_(
-            select(UserAlbumExclusion.album_id).where(UserAlbumExclusion.user_id == user_id)
-        ))
-    )
-    rows = [(album, elo) for album, elo in res.all()]
-
-    groups: dict[tuple[str, str], list[tuple[Album, EloScore]]] = {}
-    for album, elo in rows:
-        key = (album.title.strip().lower(), album.artist.strip().lower())
-        existing = groups.get(key)
-        if existing and any(a.id == album.id for a, _ in existing):
-            continue
-        groups.setdefault(key, []).append((album, elo))
-
-    items: list[RankingEntry] = []
-
-    for key, entries in groups.items():
-        # Merge Elo within this logical album group.
-        total_weighted_elo = 0.0
-        total_weight = 0
-        total_comparisons = 0
-        canonical = None
-
-        for album, elo in entries:
-            weight = max(1, elo.comparisons_count)
-            total_weighted_elo += elo.elo * weight
-            total_weight += weight
-            total_comparisons += elo.comparisons_count
-
-            if canonical is None:
-                canonical = album
-            else:
-                canonical = choose_canonical_album(canonical, album)
-
-        merged_elo = total_weighted_elo / total_weight if total_weight > 0 else 1500.0
-        rating = elo_to_100(merged_elo)
+    rows = await load_ranking_rows(db, user.id)
+    if genre:
+        in_genre = await genre_album_ids(db, genre)
+        rows = [row for row in rows if row.id in in_genre]
+    return FastJSONResponse({"items": merge_ranking_rows(rows)}, headers=cache_headers(etag))
 
-        items.append(
-            RankingEntry(
-                album=canonical,
-                elo=merged_elo,
-                rating_100=rating,
-                comparisons_count=total_comparisons,
-            )
-        )
 
-    items.sort(key=lambda x: x.elo, reverse=True)
-    return RankingsResponse(items=items)
+@app.get("/rankings/changes", response_model=RankingChangesResponse)
+async def get_ranking_changes(
+    since: int = Query(..., ge=0),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    # `since` is the data version from a previous /rankings ETag or /rankings/changes response.
+    await settle_votes(db, user)
+    return FastJSONResponse(await build_ranking_changes(db, user, since))
 
 
 @app.get("/stats", response_model=StatsResponse)
-async def get_stats(db: AsyncSession = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    albums_res = await db.execute(
-        select(func.count()).select_from(EloScore).where(
-            EloScore.user_id == user_id,
-            ~EloScore.album_id.in_(
-                select(UserAlbumExclusion.album_id).where(UserAlbumExclusion.user_id == user_id)
-            ),
-        )
-    )
-    comps_res = await db.execute(
-        select(func.count()).select_from(Comparison).where(
-            Comparison.user_id == user_id,
-            ~Comparison.album_a_id.in_(
-                select(UserAlbumExclusion.album_id).where(UserAlbumExclusion.user_id == user_id)
-            ),
-            ~Comparison.album_b_id.in_(
-                select(UserAlbumExclusion.album_id).where(UserAlbumExclusion.user_id == user_id)
-            ),
-        )
-    )
-    return StatsResponse(total_albums=albums_res.scalar_one(), total_comparisons=comps_res.scalar_one())
+async def get_stats(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    await settle_votes(db, user)
+    # Velocity windows roll over at midnight UTC even without new writes, so the day is part of the tag.
+    etag = data_etag("stats", user, datetime.utcnow().date().isoformat())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers.update(cache_headers(etag))
+    return await build_stats_response(db, user.id)
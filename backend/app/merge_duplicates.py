@@ -2,15 +2,34 @@ from __future__ import annotations
 
 import asyncio
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from typing import Dict, List, Set, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .core.config import settings
 from .db import engine as async_engine
-from .models import Album, EloScore, UserAlbum, Comparison
-from .main import choose_canonical_album
+from .archive import remap_albums
+from .community import reconcile_sync
+from .exclusions import bump_exclusions_version, invalidate_exclusions
+from .models import (
+    Album,
+    AlbumGenre,
+    CommunityAlbumStats,
+    Comparison,
+    EloScore,
+    Placement,
+    RankingChange,
+    UserAlbum,
+    UserAlbumExclusion,
+    UserRecommendation,
+)
+from .rankings import choose_canonical_album
+from .changes import record_ranking_reset
+from .history import take_snapshot
+from .inference import invalidate_closure
+from .stats import rebuild_user_stats
+from .versioning import bump_data_version
 
 
 async def merge_duplicates() -> None:
@@ -18,6 +37,9 @@ async def merge_duplicates() -> None:
         res = await db.execute(select(Album))
         albums: List[Album] = list(res.scalars().all())
 
+        touched_users: Set[int] = set()
+        excluding_users: Set[int] = set()
+        merged: Dict[int, int] = {}
         groups: Dict[Tuple[str, str, int | None], List[Album]] = defaultdict(list)
         for a in albums:
             key = (a.title.strip().lower(), a.artist.strip().lower(), a.year)
@@ -40,6 +62,7 @@ async def merge_duplicates() -> None:
                 res = await db.execute(select(EloScore).where(EloScore.album_id == dup.id))
                 dup_elos = list(res.scalars().all())
                 for de in dup_elos:
+                    touched_users.add(de.user_id)
                     existing_q = await db.execute(
                         select(EloScore).where(
                             EloScore.user_id == de.user_id,
@@ -62,6 +85,7 @@ async def merge_duplicates() -> None:
                 # Repoint UserAlbum
                 res = await db.execute(select(UserAlbum).where(UserAlbum.album_id == dup.id))
                 for ua in res.scalars().all():
+                    touched_users.add(ua.user_id)
                     existing_q = await db.execute(
                         select(UserAlbum).where(
                             UserAlbum.user_id == ua.user_id,
@@ -82,6 +106,7 @@ async def merge_duplicates() -> None:
                     )
                 )
                 for c in res.scalars().all():
+                    touched_users.add(c.user_id)
                     if c.album_a_id == dup.id:
                         c.album_a_id = canonical.id
                     if c.album_b_id == dup.id:
@@ -92,9 +117,56 @@ async def merge_duplicates() -> None:
                         # Invalid self-comparison; drop it.
                         await db.delete(c)
 
-                await db.delete(dup)
+                # Repoint exclusions and placements, dropping the duplicate's where the user already
+                # has one for the canonical album.
+                for model in (UserAlbumExclusion, Placement):
+                    res = await db.execute(select(model).where(model.album_id == dup.id))
+                    for row in res.scalars().all():
+                        touched_users.add(row.user_id)
+                        if model is UserAlbumExclusion:
+                            excluding_users.add(row.user_id)
+                        existing_q = await db.execute(
+                            select(model.id).where(model.user_id == row.user_id, model.album_id == canonical.id)
+                        )
+                        if existing_q.scalar_one_or_none() is not None:
+                            await db.delete(row)
+                        else:
+                            row.album_id = canonical.id
+
+                # Change-log rows are superseded by the ranking reset below but must not dangle.
+                res = await db.execute(select(RankingChange.user_id).where(RankingChange.album_id == dup.id))
+                touched_users.update(res.scalars().all())
+                await db.execute(
+                    update(RankingChange).where(RankingChange.album_id == dup.id).values(album_id=canonical.id)
+                )
 
+                # Recommendations are recomputed once the data version moves; community totals are
+                # rebuilt below. The canonical album gets its own genres from enrichment.
+                for model in (UserRecommendation, CommunityAlbumStats, AlbumGenre):
+                    await db.execute(delete(model).where(model.album_id == dup.id))
+                await db.delete(dup)
+                merged[dup.id] = canonical.id
+
+        # Archived comparisons are rewritten before the commit; a failed commit leaves them pointing
+        # at the canonical album, which a rerun would have done anyway.
+        touched_users |= remap_albums(merged)
+
+        await bump_data_version(db, touched_users)
+        for user_id in sorted(excluding_users):
+            await bump_exclusions_version(db, user_id)
+        # Merged EloScores change rated-album and facet counts.
+        for user_id in sorted(touched_users):
+            await rebuild_user_stats(db, user_id)
+        if merged:
+            await db.run_sync(lambda session: reconcile_sync(session.connection()))
+        await record_ranking_reset(db, touched_users)
+        await take_snapshot(db, touched_users)
         await db.commit()
+        for user_id in excluding_users:
+            invalidate_exclusions(user_id)
+        # Comparisons now name the canonical albums; closures still hold the merged ones.
+        for user_id in touched_users:
+            invalidate_closure(user_id)
 
 
 if __name__ == "__main__":
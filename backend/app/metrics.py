@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, labels: Labels = (), amount: float = 1.0) -> None:
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> None:
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets)
+        # Per label set: non-cumulative bucket counts (last slot is +Inf), sum, count.
+        self._values: Dict[Labels, List] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._values[labels] = entry
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                label_str = _fmt_labels(self.labels, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, labels)} {count}")
+        return lines
+
+
+HTTP_REQUESTS = Counter("albumduel_http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("albumduel_http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("albumduel_http_requests_in_flight", "HTTP requests currently being handled.")
+DB_QUERIES = Histogram(
+    "albumduel_db_queries_per_request", "SQL statements issued per HTTP request.", ("route",), QUERY_BUCKETS
+)
+DB_TIME = Histogram("albumduel_db_time_per_request_seconds", "Time spent in SQL per HTTP request.", ("route",))
+DB_QUERIES_TOTAL = Counter("albumduel_db_queries_total", "SQL statements executed.")
+OUTBOUND_REQUESTS = Counter(
+    "albumduel_outbound_requests_total", "Calls to external services.", ("service", "outcome")
+)
+OUTBOUND_LATENCY = Histogram(
+    "albumduel_outbound_request_duration_seconds", "Latency of calls to external services.", ("service",)
+)
+
+REGISTRY = (
+    HTTP_REQUESTS,
+    HTTP_LATENCY,
+    HTTP_IN_FLIGHT,
+    DB_QUERIES,
+    DB_TIME,
+    DB_QUERIES_TOTAL,
+    OUTBOUND_REQUESTS,
+    OUTBOUND_LATENCY,
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("albumduel_request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count statements and time spent in SQL, attributed to the HTTP request that issued them."""
+
+    # The start time lives on the statement's execution context, so a statement that raises (and
+    # never reaches after_cursor_execute) leaves nothing behind on the connection.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._albumduel_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._albumduel_start
+        DB_QUERIES_TOTAL.inc()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+
+@contextmanager
+def track_outbound(service: str) -> Iterator[None]:
+    """Time a call to an external service that does not go through ``outbound_client``."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        OUTBOUND_LATENCY.observe(time.perf_counter() - started, (service,))
+        OUTBOUND_REQUESTS.inc((service, outcome))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, in-flight requests and SQL usage."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc((method, route, str(status["code"])))
+            HTTP_LATENCY.observe(elapsed, (method, route))
+            DB_QUERIES.observe(stats.queries, (route,))
+            DB_TIME.observe(stats.db_seconds, (route,))
+            if settings.query_warn_threshold and stats.queries > settings.query_warn_threshold:
+                logger.warning(
+                    "%s %s issued %d SQL statements (%.1f ms in DB, %.1f ms total)",
+                    method,
+                    route,
+                    stats.queries,
+                    stats.db_seconds * 1000.0,
+                    elapsed * 1000.0,
+                )
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
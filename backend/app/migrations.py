@@ -0,0 +1,617 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import zlib
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    UniqueConstraint,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .core.config import settings
+from .models import SchemaMigration
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+# Every step declares the tables it creates as they were when the step was written, on its own
+# MetaData, and does its data work in place; nothing here reads app models or app logic, so a
+# later change elsewhere can never alter what an old step does.
+
+
+def _metadata(*referenced: str) -> MetaData:
+    # Tables a step only points foreign keys at, declared by name so the keys resolve.
+    md = MetaData()
+    for name in referenced:
+        Table(name, md, Column("id", Integer, primary_key=True))
+    return md
+
+
+def _create(conn: Connection, *tables: Table) -> None:
+    # checkfirst skips tables that already exist, so every step is idempotent.
+    for table in tables:
+        table.create(conn, checkfirst=True)
+
+
+def _add_column(table: str, column: str, ddl: str) -> Callable[[Connection], None]:
+    def apply(conn: Connection) -> None:
+        existing = {c["name"] for c in inspect(conn).get_columns(table)}
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+    return apply
+
+
+def _baseline_comparisons(md: MetaData) -> Table:
+    return Table(
+        "comparisons",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("album_a_id", Integer, ForeignKey("albums.id"), nullable=False),
+        Column("album_b_id", Integer, ForeignKey("albums.id"), nullable=False),
+        Column("winner_album_id", Integer, ForeignKey("albums.id"), nullable=True),
+        Column("created_at", DateTime),
+        Index("ix_comparisons_user", "user_id"),
+    )
+
+
+def _baseline(conn: Connection) -> None:
+    md = MetaData()
+    users = Table(
+        "users",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("provider", String, nullable=False),
+        Column("provider_user_id", String, nullable=False),
+        Column("display_name", String, nullable=True),
+        Column("created_at", DateTime),
+        UniqueConstraint("provider", "provider_user_id", name="uq_user_provider"),
+        Index("ix_users_id", "id"),
+    )
+    spotify_tokens = Table(
+        "spotify_tokens",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False, unique=True),
+        Column("access_token", String, nullable=False),
+        Column("refresh_token", String, nullable=True),
+        Column("expires_at", Integer, nullable=False),
+    )
+    albums = Table(
+        "albums",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("spotify_id", String, nullable=True),
+        Column("mbid", String, nullable=True),
+        Column("title", String, nullable=False),
+        Column("artist", String, nullable=False),
+        Column("year", Integer, nullable=True),
+        Column("genres", String, nullable=True),
+        Column("cover_url", String, nullable=True),
+        Column("source", String, nullable=True),
+        Column("cover_provider", String, nullable=True),
+        Index("ix_albums_id", "id"),
+        Index("ix_albums_mbid", "mbid"),
+        Index("ix_albums_spotify_id", "spotify_id"),
+    )
+    user_albums = Table(
+        "user_albums",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("album_id", Integer, ForeignKey("albums.id"), nullable=False),
+        Column("added_from", String, nullable=True),
+        UniqueConstraint("user_id", "album_id", name="uq_user_album"),
+        Index("ix_user_albums_user", "user_id"),
+    )
+    user_album_exclusions = Table(
+        "user_album_exclusions",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("album_id", Integer, ForeignKey("albums.id"), nullable=False),
+        UniqueConstraint("user_id", "album_id", name="uq_user_album_exclusion"),
+        Index("ix_user_album_exclusions_user", "user_id"),
+    )
+    elo_scores = Table(
+        "elo_scores",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("album_id", Integer, ForeignKey("albums.id"), nullable=False),
+        Column("elo", Float),
+        Column("comparisons_count", Integer),
+        Column("updated_at", DateTime),
+        UniqueConstraint("user_id", "album_id", name="uq_elo_user_album"),
+        Index("ix_elo_user", "user_id"),
+        Index("ix_elo_elo", "elo"),
+    )
+    _create(conn, users, spotify_tokens, albums, user_albums, user_album_exclusions, elo_scores, _baseline_comparisons(md))
+
+
+def _stats_aggregates(conn: Connection) -> None:
+    md = _metadata("users")
+    user_stats = Table(
+        "user_stats",
+        md,
+        Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+        Column("library_albums", Integer),
+        Column("rated_albums", Integer),
+        Column("excluded_rated_albums", Integer),
+        Column("total_comparisons", Integer),
+        Column("excluded_comparisons", Integer),
+        Column("draws", Integer),
+        Column("recent_abs_delta", Float, nullable=True),
+        Column("last_comparison_at", DateTime, nullable=True),
+        Column("updated_at", DateTime),
+    )
+    user_daily_comparisons = Table(
+        "user_daily_comparisons",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("day", String(10), nullable=False),
+        Column("comparisons", Integer),
+        UniqueConstraint("user_id", "day", name="uq_user_daily_comparisons"),
+    )
+    user_facet_stats = Table(
+        "user_facet_stats",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("facet", String, nullable=False),
+        Column("value", String, nullable=False),
+        Column("library_albums", Integer),
+        Column("rated_albums", Integer),
+        Column("wins", Integer),
+        Column("losses", Integer),
+        Column("draws", Integer),
+        UniqueConstraint("user_id", "facet", "value", name="uq_user_facet_value"),
+        Index("ix_user_facet_stats_user_facet", "user_id", "facet"),
+    )
+    _create(conn, user_stats, user_daily_comparisons, user_facet_stats)
+
+
+def _ranking_change_log(conn: Connection) -> None:
+    md = _metadata("users", "albums")
+    ranking_changes = Table(
+        "ranking_changes",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("version", Integer, nullable=False),
+        Column("album_id", Integer, ForeignKey("albums.id"), nullable=True),
+        Column("old_elo", Float, nullable=True),
+        Column("old_comparisons_count", Integer, nullable=True),
+        Index("ix_ranking_changes_user_version", "user_id", "version"),
+    )
+    _create(conn, ranking_changes)
+    # History before the log existed cannot be replayed: mark each user's current version as a reset.
+    conn.execute(
+        text("INSERT INTO ranking_changes (user_id, version) SELECT id, data_version FROM users WHERE data_version > 0")
+    )
+
+
+# Community scores as first defined: Elo squashed onto 0-100, then a Bayesian mean that counts
+# five neutral (50) raters for every album.
+_COMMUNITY_PRIOR_RATERS = 5
+_COMMUNITY_NEUTRAL_RATING = 50.0
+_COMMUNITY_BATCH = 1_000
+
+
+def _community_rating(elo: float) -> float:
+    x = (elo - 1500.0) / 120.0
+    return round(max(0.0, min(100.0, 50.0 + 45.0 * (x / (1.0 + abs(x))))), 1)
+
+
+def _community_rankings(conn: Connection) -> None:
+    md = _metadata("albums")
+    community_album_stats = Table(
+        "community_album_stats",
+        md,
+        Column("album_id", Integer, ForeignKey("albums.id"), primary_key=True),
+        Column("raters", Integer, nullable=False),
+        Column("rating_sum", Float, nullable=False),
+        Column("rating_sq_sum", Float, nullable=False),
+        Column("score", Float, nullable=False),
+        Column("updated_at", DateTime),
+        Index("ix_community_album_stats_score", "score"),
+    )
+    _create(conn, community_album_stats)
+    # Seed the table from every rated EloScore; votes keep it current from here on.
+    totals: Dict[int, List[float]] = {}
+    rows = conn.execute(
+        text("SELECT album_id, elo FROM elo_scores WHERE comparisons_count > 0").execution_options(
+            yield_per=_COMMUNITY_BATCH
+        )
+    )
+    for album_id, elo in rows:
+        rating = _community_rating(elo)
+        entry = totals.setdefault(album_id, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += rating
+        entry[2] += rating * rating
+    now = datetime.utcnow()
+    conn.execute(community_album_stats.delete())
+    batch = [
+        {
+            "album_id": album_id,
+            "raters": int(raters),
+            "rating_sum": rating_sum,
+            "rating_sq_sum": rating_sq_sum,
+            "score": (rating_sum + _COMMUNITY_PRIOR_RATERS * _COMMUNITY_NEUTRAL_RATING)
+            / (raters + _COMMUNITY_PRIOR_RATERS),
+            "updated_at": now,
+        }
+        for album_id, (raters, rating_sum, rating_sq_sum) in totals.items()
+    ]
+    for start in range(0, len(batch), _COMMUNITY_BATCH):
+        conn.execute(community_album_stats.insert(), batch[start : start + _COMMUNITY_BATCH])
+
+
+def _recommendations(conn: Connection) -> None:
+    md = _metadata("users", "albums")
+    user_recommendations = Table(
+        "user_recommendations",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("album_id", Integer, ForeignKey("albums.id"), nullable=False),
+        Column("score", Float, nullable=False),
+        Column("rank", Integer, nullable=False),
+        Index("ix_user_recommendations_user_rank", "user_id", "rank"),
+    )
+    user_recommendation_state = Table(
+        "user_recommendation_state",
+        md,
+        Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+        Column("data_version", Integer, nullable=False),
+        Column("model_id", Integer, nullable=False),
+        Column("computed_at", DateTime),
+    )
+    _create(conn, user_recommendations, user_recommendation_state)
+
+
+def _placements(conn: Connection) -> None:
+    md = _metadata("users", "albums")
+    placements = Table(
+        "placements",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("album_id", Integer, ForeignKey("albums.id"), nullable=False),
+        Column("lower_elo", Float, nullable=True),
+        Column("upper_elo", Float, nullable=True),
+        Column("probes", Integer, nullable=False),
+        Column("created_at", DateTime),
+        UniqueConstraint("user_id", "album_id", name="uq_placement_user_album"),
+    )
+    _create(conn, placements)
+
+
+def _vote_history(conn: Connection) -> None:
+    for side in ("a", "b"):
+        for when in ("before", "after"):
+            _add_column("comparisons", f"elo_{side}_{when}", "FLOAT")(conn)
+    md = _metadata("users")
+    rating_snapshots = Table(
+        "rating_snapshots",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("taken_at", DateTime, nullable=False),
+        Column("last_comparison_id", Integer, nullable=False),
+        Column("albums", Integer, nullable=False),
+        Column("data", LargeBinary, nullable=False),
+        Column("reset", Boolean, nullable=False),
+        Index("ix_rating_snapshots_user_taken", "user_id", "taken_at"),
+    )
+    _create(conn, rating_snapshots)
+    # Older votes carry no deltas, so point-in-time rankings start from today's ratings: one reset
+    # snapshot per user, packed as zlib(int64 album ids + float64 Elos + int64 comparison counts).
+    now = datetime.utcnow()
+    user_ids = conn.execute(text("SELECT DISTINCT user_id FROM elo_scores")).scalars().all()
+    for user_id in user_ids:
+        ids, elos, counts = array("q"), array("d"), array("q")
+        rows = conn.execute(
+            text(
+                "SELECT album_id, elo, comparisons_count FROM elo_scores WHERE user_id = :user_id ORDER BY album_id"
+            ),
+            {"user_id": user_id},
+        )
+        for album_id, elo, count in rows:
+            ids.append(album_id)
+            elos.append(elo)
+            counts.append(count or 0)
+        latest = conn.execute(
+            text("SELECT max(id) FROM comparisons WHERE user_id = :user_id"), {"user_id": user_id}
+        ).scalar()
+        conn.execute(
+            rating_snapshots.insert().values(
+                user_id=user_id,
+                taken_at=now,
+                last_comparison_id=latest or 0,
+                albums=len(ids),
+                data=zlib.compress(ids.tobytes() + elos.tobytes() + counts.tobytes()),
+                reset=True,
+            )
+        )
+
+
+def _vote_concurrency(conn: Connection) -> None:
+    _add_column("elo_scores", "version", "INTEGER NOT NULL DEFAULT 0")(conn)
+    _add_column("user_stats", "version", "INTEGER NOT NULL DEFAULT 0")(conn)
+    _add_column("comparisons", "vote_id", "VARCHAR(64)")(conn)
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_comparisons_user_vote ON comparisons (user_id, vote_id)"))
+
+
+def _album_genres(conn: Connection) -> None:
+    _add_column("albums", "genres_fetched_at", "DATETIME")(conn)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_albums_genres_fetched_at ON albums (genres_fetched_at)"))
+    md = _metadata("albums")
+    genres = Table(
+        "genres",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("name", String, nullable=False, unique=True),
+    )
+    album_genres = Table(
+        "album_genres",
+        md,
+        Column("album_id", Integer, ForeignKey("albums.id"), primary_key=True),
+        Column("genre_id", Integer, ForeignKey("genres.id"), primary_key=True),
+        Index("ix_album_genres_genre_album", "genre_id", "album_id"),
+    )
+    _create(conn, genres, album_genres)
+
+
+def _import_sync_state(conn: Connection) -> None:
+    md = _metadata("users")
+    import_sync_state = Table(
+        "import_sync_state",
+        md,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("source", String, nullable=False),
+        Column("account", String, nullable=True),
+        Column("watermark", String, nullable=True),
+        Column("last_synced_at", DateTime, nullable=True),
+        Column("last_imported", Integer, nullable=False),
+        UniqueConstraint("user_id", "source", name="uq_import_sync_user_source"),
+        Index("ix_import_sync_state_synced", "last_synced_at"),
+    )
+    _create(conn, import_sync_state)
+
+
+def _archived_segments(root: Path) -> Dict[int, List[Path]]:
+    """user id -> segment directories in id order, read from the archive layout as of this step.
+
+    Each user's archive is ``<root>/<user_id>/<first_id>-<last_id>/<column>.npy``; overlapping
+    ranges left by an interrupted compaction resolve to the widest one.
+    """
+    found: Dict[int, List[Path]] = {}
+    if not root.is_dir():
+        return found
+    for user_entry in os.scandir(root):
+        if not user_entry.is_dir() or not user_entry.name.isdigit():
+            continue
+        ranges = []
+        for entry in os.scandir(user_entry.path):
+            if entry.is_dir() and not entry.name.startswith("."):
+                first, _, last = entry.name.partition("-")
+                ranges.append((int(first), -int(last), Path(entry.path)))
+        ranges.sort()
+        segments: List[Path] = []
+        last_id = 0
+        for first, neg_last, path in ranges:
+            if not segments or first > last_id:
+                segments.append(path)
+                last_id = -neg_last
+        if segments:
+            found[int(user_entry.name)] = segments
+    return found
+
+
+def _comparison_autoincrement(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'comparisons'")).scalar()
+    if ddl is not None and "AUTOINCREMENT" not in ddl.upper():
+        # SQLite cannot add AUTOINCREMENT in place: rebuild the table and copy the rows, ids included.
+        md = _metadata("users", "albums")
+        comparisons = Table(
+            "comparisons",
+            md,
+            Column("id", Integer, primary_key=True),
+            Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+            Column("album_a_id", Integer, ForeignKey("albums.id"), nullable=False),
+            Column("album_b_id", Integer, ForeignKey("albums.id"), nullable=False),
+            Column("winner_album_id", Integer, ForeignKey("albums.id"), nullable=True),
+            Column("created_at", DateTime),
+            Column("elo_a_before", Float, nullable=True),
+            Column("elo_a_after", Float, nullable=True),
+            Column("elo_b_before", Float, nullable=True),
+            Column("elo_b_after", Float, nullable=True),
+            Column("vote_id", String(64), nullable=True),
+            Index("ix_comparisons_user", "user_id"),
+            Index("uq_comparisons_user_vote", "user_id", "vote_id", unique=True),
+            sqlite_autoincrement=True,
+        )
+        existing = {c["name"] for c in inspect(conn).get_columns("comparisons")}
+        columns = ", ".join(c.name for c in comparisons.columns if c.name in existing)
+        conn.execute(text("ALTER TABLE comparisons RENAME TO comparisons_rowid"))
+        for index in comparisons.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        _create(conn, comparisons)
+        conn.execute(text(f"INSERT INTO comparisons ({columns}) SELECT {columns} FROM comparisons_rowid"))
+        conn.execute(text("DROP TABLE comparisons_rowid"))
+
+    # Before AUTOINCREMENT, SQLite could hand an archived id to a new vote, and readers skip hot
+    # rows at or below a user's archive boundary. Rows there that are not the archived copy (a
+    # crash between writing a segment and deleting) move above every id in use.
+    archives = _archived_segments(Path(settings.comparison_archive_dir))
+    max_archived = max((int(segments[-1].name.partition("-")[2]) for segments in archives.values()), default=0)
+    hidden: List[int] = []
+    if archives:
+        import numpy as np
+
+        for user_id, segments in sorted(archives.items()):
+            boundary = int(segments[-1].name.partition("-")[2])
+            rows = conn.execute(
+                text(
+                    "SELECT id, album_a_id, album_b_id, created_at FROM comparisons "
+                    "WHERE user_id = :user_id AND id <= :boundary"
+                ),
+                {"user_id": user_id, "boundary": boundary},
+            ).all()
+            if not rows:
+                continue
+            columns = {
+                name: np.concatenate([np.load(path / f"{name}.npy", mmap_mode="r") for path in segments])
+                for name in ("id", "album_a_id", "album_b_id", "created_at")
+            }
+            ids = columns["id"]
+            for row_id, a, b, created_at in rows:
+                i = int(np.searchsorted(ids, row_id))
+                if isinstance(created_at, str):
+                    created_at = datetime.fromisoformat(created_at)
+                archived = (
+                    i < len(ids)
+                    and ids[i] == row_id
+                    and columns["album_a_id"][i] == a
+                    and columns["album_b_id"][i] == b
+                    and created_at is not None
+                    and columns["created_at"][i] == (created_at - _EPOCH) // timedelta(microseconds=1)
+                )
+                if not archived:
+                    hidden.append(row_id)
+    next_id = max(conn.execute(text("SELECT max(id) FROM comparisons")).scalar() or 0, max_archived)
+    for old_id in sorted(hidden):
+        next_id += 1
+        conn.execute(text("UPDATE comparisons SET id = :new WHERE id = :old"), {"new": next_id, "old": old_id})
+
+    # Ids deleted by archiving must not come back, including ones above every remaining row.
+    floor = next_id
+    seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'comparisons'")).scalar()
+    if seq is None:
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('comparisons', :floor)"), {"floor": floor})
+    elif seq < floor:
+        conn.execute(text("UPDATE sqlite_sequence SET seq = :floor WHERE name = 'comparisons'"), {"floor": floor})
+
+
+def _comparison_album_indexes(conn: Connection) -> None:
+    for side in ("a", "b"):
+        conn.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS ix_comparisons_user_album_{side} ON comparisons (user_id, album_{side}_id)"
+            )
+        )
+
+
+# Append new steps at the end; never renumber or edit an applied one.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "stats_aggregates", _stats_aggregates),
+    Migration(3, "user_data_version", _add_column("users", "data_version", "INTEGER NOT NULL DEFAULT 0")),
+    Migration(4, "ranking_change_log", _ranking_change_log),
+    Migration(5, "community_rankings", _community_rankings),
+    Migration(6, "recommendations", _recommendations),
+    Migration(7, "placements", _placements),
+    Migration(8, "vote_history", _vote_history),
+    Migration(9, "vote_concurrency", _vote_concurrency),
+    Migration(10, "album_genres", _album_genres),
+    Migration(11, "elo_priors", _add_column("elo_scores", "prior_count", "INTEGER NOT NULL DEFAULT 0")),
+    Migration(12, "import_sync_state", _import_sync_state),
+    Migration(13, "comparison_autoincrement", _comparison_autoincrement),
+    Migration(14, "user_exclusions_version", _add_column("users", "exclusions_version", "INTEGER NOT NULL DEFAULT 0")),
+    Migration(15, "comparison_album_indexes", _comparison_album_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(SchemaMigration.__tablename__):
+        return 0
+    return conn.execute(select(SchemaMigration.version).order_by(SchemaMigration.version.desc()).limit(1)).scalar() or 0
+
+
+def _migrate(conn: Connection, log: Callable[[str], None]) -> int:
+    SchemaMigration.__table__.create(conn, checkfirst=True)
+    current = _current_version(conn)
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        log(f"applying {migration.version:04d} {migration.name}")
+        migration.apply(conn)
+        conn.execute(
+            SchemaMigration.__table__.insert().values(
+                version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+            )
+        )
+        current = migration.version
+    return current
+
+
+async def migrate(engine: AsyncEngine, log: Callable[[str], None] = print) -> int:
+    """Apply pending migrations in order, each recorded in schema_migrations. Safe to re-run."""
+    async with engine.begin() as conn:
+        return await conn.run_sync(_migrate, log)
+
+
+async def schema_version(engine: AsyncEngine) -> int:
+    async with engine.connect() as conn:
+        return await conn.run_sync(_current_version)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="print the current and latest schema version only")
+    args = parser.parse_args(argv)
+
+    from .db import engine
+
+    async def run() -> int:
+        current = await schema_version(engine)
+        if args.status:
+            print(f"schema version {current} (latest {LATEST_VERSION})")
+            return 0 if current == LATEST_VERSION else 1
+        version = await migrate(engine)
+        print(f"schema version {version}")
+        return 0
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
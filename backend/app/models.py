@@ -12,6 +12,7 @@ from sqlalchemy import (
     Boolean,
     UniqueConstraint,
     Index,
+    LargeBinary,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -37,6 +38,10 @@ class User(Base):
     provider_user_id = Column(String, nullable=False)
     display_name = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped by every write that changes the user's rankings or stats; drives ETags.
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped only when the user's exclusions change; keeps per-process exclusion caches current.
+    exclusions_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     __table_args__ = (
         UniqueConstraint("provider", "provider_user_id", name="uq_user_provider"),
@@ -52,12 +57,36 @@ class Album(Base):
     title = Column(String, nullable=False)
     artist = Column(String, nullable=False)
     year = Column(Integer, nullable=True)
+    # Comma-separated copy of the album's album_genres names, for display and export.
     genres = Column(String, nullable=True)
+    # When genre enrichment last looked the album up; None means it has not been tried yet.
+    genres_fetched_at = Column(DateTime, nullable=True, index=True)
     cover_url = Column(String, nullable=True)
     source = Column(String, nullable=True)
     cover_provider = Column(String, nullable=True)
 
 
+class Genre(Base):
+    __tablename__ = "genres"
+
+    id = Column(Integer, primary_key=True)
+    # Lower-cased, as Spotify reports them.
+    name = Column(String, nullable=False, unique=True)
+
+
+class AlbumGenre(Base):
+    """Album <-> genre link filled by app.genres; the genre-first index serves genre filters."""
+
+    __tablename__ = "album_genres"
+
+    album_id = Column(Integer, ForeignKey("albums.id"), primary_key=True, autoincrement=False)
+    genre_id = Column(Integer, ForeignKey("genres.id"), primary_key=True, autoincrement=False)
+
+    __table_args__ = (
+        Index("ix_album_genres_genre_album", "genre_id", "album_id"),
+    )
+
+
 class UserAlbum(Base):
     __tablename__ = "user_albums"
 
@@ -72,6 +101,30 @@ class UserAlbum(Base):
     )
 
 
+class ImportSyncState(Base):
+    """Where a user's last import from one source stopped, so the next one only fetches newer items.
+
+    ``watermark`` is source-specific: the newest Spotify ``added_at``, the newest AOTY rating's
+    artist|title key, or for Last.fm nothing (the next sync picks a chart period from
+    ``last_synced_at``). ``account`` is the Last.fm or AOTY username background syncs use.
+    """
+
+    __tablename__ = "import_sync_state"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    source = Column(String, nullable=False)
+    account = Column(String, nullable=True)
+    watermark = Column(String, nullable=True)
+    last_synced_at = Column(DateTime, nullable=True)
+    last_imported = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "source", name="uq_import_sync_user_source"),
+        Index("ix_import_sync_state_synced", "last_synced_at"),
+    )
+
+
 class UserAlbumExclusion(Base):
     __tablename__ = "user_album_exclusions"
 
@@ -93,13 +146,19 @@ class EloScore(Base):
     album_id = Column(Integer, ForeignKey("albums.id"), nullable=False)
     elo = Column(Float, default=1500.0)
     comparisons_count = Column(Integer, default=0)
+    # Pseudo-comparisons an imported prior is worth (app.priors); added to comparisons_count when
+    # picking K, so a seeded rating moves less than a blank 1500.
+    prior_count = Column(Integer, nullable=False, default=0, server_default="0")
     updated_at = Column(DateTime, default=datetime.utcnow)
+    # Optimistic-locking counter: ORM updates check it and raise StaleDataError if another write won.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     __table_args__ = (
         UniqueConstraint("user_id", "album_id", name="uq_elo_user_album"),
         Index("ix_elo_user", "user_id"),
         Index("ix_elo_elo", "elo"),
     )
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Comparison(Base):
@@ -111,7 +170,190 @@ class Comparison(Base):
     album_b_id = Column(Integer, ForeignKey("albums.id"), nullable=False)
     winner_album_id = Column(Integer, ForeignKey("albums.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Each album's Elo around the vote; None when the vote did not rate that side (older and imported
+    # votes, unfinished placement probes). See app.history.
+    elo_a_before = Column(Float, nullable=True)
+    elo_a_after = Column(Float, nullable=True)
+    elo_b_before = Column(Float, nullable=True)
+    elo_b_after = Column(Float, nullable=True)
+    # Client-supplied idempotency key; NULLs never collide.
+    vote_id = Column(String(64), nullable=True)
 
     __table_args__ = (
         Index("ix_comparisons_user", "user_id"),
+        # Exclusion changes count the comparisons of just the albums involved.
+        Index("ix_comparisons_user_album_a", "user_id", "album_a_id"),
+        Index("ix_comparisons_user_album_b", "user_id", "album_b_id"),
+        Index("uq_comparisons_user_vote", "user_id", "vote_id", unique=True),
+        # Archiving deletes users' oldest rows, which can include the newest id overall; without
+        # AUTOINCREMENT SQLite would hand that id out again, below the archive boundary.
+        {"sqlite_autoincrement": True},
     )
+
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    library_albums = Column(Integer, default=0)
+    rated_albums = Column(Integer, default=0)
+    excluded_rated_albums = Column(Integer, default=0)
+    total_comparisons = Column(Integer, default=0)
+    excluded_comparisons = Column(Integer, default=0)
+    draws = Column(Integer, default=0)
+    # Exponential moving average of the per-vote Elo movement; None until the first vote is seen.
+    recent_abs_delta = Column(Float, nullable=True)
+    last_comparison_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    # Votes and imports change this row with increments that never conflict and bump the counter,
+    # so a rebuild that read the row before one of them fails on flush instead of overwriting it.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class UserDailyComparisons(Base):
+    __tablename__ = "user_daily_comparisons"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(String(10), nullable=False)
+    comparisons = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_user_daily_comparisons"),
+    )
+
+
+class UserFacetStats(Base):
+    __tablename__ = "user_facet_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    facet = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+    library_albums = Column(Integer, default=0)
+    rated_albums = Column(Integer, default=0)
+    wins = Column(Integer, default=0)
+    losses = Column(Integer, default=0)
+    draws = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "facet", "value", name="uq_user_facet_value"),
+        Index("ix_user_facet_stats_user_facet", "user_id", "facet"),
+    )
+
+
+class RankingChange(Base):
+    """Previous visible state of an album in a user's rankings, keyed by the data version that changed it.
+
+    ``old_elo`` is None when the album was not ranked (unrated or excluded) before the change. A row
+    with no ``album_id`` marks a bulk rewrite that cannot be replayed; clients must refetch.
+    """
+
+    __tablename__ = "ranking_changes"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    album_id = Column(Integer, ForeignKey("albums.id"), nullable=True)
+    old_elo = Column(Float, nullable=True)
+    old_comparisons_count = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ranking_changes_user_version", "user_id", "version"),
+    )
+
+
+class CommunityAlbumStats(Base):
+    """Cross-user rating totals per album on the 0-100 scale, kept current by votes."""
+
+    __tablename__ = "community_album_stats"
+
+    album_id = Column(Integer, ForeignKey("albums.id"), primary_key=True, autoincrement=False)
+    raters = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rating_sq_sum = Column(Float, nullable=False, default=0.0)
+    # Bayesian-smoothed mean used for ordering; see app.community.
+    score = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_community_album_stats_score", "score"),
+    )
+
+
+class UserRecommendation(Base):
+    __tablename__ = "user_recommendations"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    album_id = Column(Integer, ForeignKey("albums.id"), nullable=False)
+    score = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_user_recommendations_user_rank", "user_id", "rank"),
+    )
+
+
+class UserRecommendationState(Base):
+    """Which data version and model a user's stored recommendations were computed from."""
+
+    __tablename__ = "user_recommendation_state"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, autoincrement=False)
+    data_version = Column(Integer, nullable=False, default=0)
+    model_id = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Placement(Base):
+    """Binary-search bounds for an unrated album being slotted into a user's ranking.
+
+    Bounds are merged Elo values rather than rank positions, so votes elsewhere between probes
+    shift the search window instead of invalidating it. None means unbounded on that side.
+    """
+
+    __tablename__ = "placements"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    album_id = Column(Integer, ForeignKey("albums.id"), nullable=False)
+    # Elo of the best album it beat and of the worst album it lost to.
+    lower_elo = Column(Float, nullable=True)
+    upper_elo = Column(Float, nullable=True)
+    probes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "album_id", name="uq_placement_user_album"),
+    )
+
+
+class RatingSnapshot(Base):
+    """A user's EloScores packed into one blob, as of ``last_comparison_id``. See app.history."""
+
+    __tablename__ = "rating_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    taken_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_comparison_id = Column(Integer, nullable=False, default=0)
+    albums = Column(Integer, nullable=False, default=0)
+    data = Column(LargeBinary, nullable=False)
+    # Taken after ratings were rewritten without per-vote deltas (imports, merges, the migration that
+    # started history), so nothing before it can be replayed from scratch.
+    reset = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index("ix_rating_snapshots_user_taken", "user_id", "taken_at"),
+    )
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
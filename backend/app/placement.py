@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import math
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .changes import record_ranking_changes
+from .community import normalized_rating, record_ratings
+from .exclusions import get_exclusions
+from .history import maybe_snapshot
+from .models import Album, Comparison, EloScore, Placement, UserAlbum
+from .rankings import album_key, load_ranking_rows, merge_ranking_rows
+from .schemas import CompareSubmit
+from .stats import record_comparison
+from .versioning import bump_data_version
+
+# Below this many ranked albums there is no settled order worth searching; random duels are used.
+PLACEMENT_MIN_RANKED = 8
+# Elo given beyond the top or bottom album to newcomers that win or lose every probe.
+EDGE_GAP = 40.0
+
+
+def seed_elo(lower: Optional[float], upper: Optional[float]) -> float:
+    """Starting Elo for an album placed between ``lower`` and ``upper`` (either may be open)."""
+    if lower is not None and upper is not None:
+        return (lower + upper) / 2.0
+    if lower is not None:
+        return lower + EDGE_GAP
+    if upper is not None:
+        return upper - EDGE_GAP
+    return 1500.0
+
+
+def _window(items: List[Dict[str, Any]], lower: Optional[float], upper: Optional[float]) -> List[Dict[str, Any]]:
+    # Ranked entries (best first) the album has not yet been ordered against.
+    return [
+        item
+        for item in items
+        if (lower is None or item["elo"] > lower) and (upper is None or item["elo"] < upper)
+    ]
+
+
+def _probe(items: List[Dict[str, Any]], lower: Optional[float], upper: Optional[float]) -> Tuple[Dict[str, Any], int]:
+    """The entry at the midpoint rank of the open window, and the window size."""
+    window = _window(items, lower, upper)
+    if window:
+        return window[len(window) // 2], len(window)
+    # Votes since the last probe moved every candidate out of the window; one more duel against the
+    # closest entry pins the bound and finishes the placement.
+    target = seed_elo(lower, upper)
+    return min(items, key=lambda item: abs(item["elo"] - target)), 0
+
+
+async def _pending(db: AsyncSession, user_id: int, ranked_keys: set) -> List:
+    """Unrated library albums awaiting placement: ones already in progress first, then newest imports."""
+    excluded = await get_exclusions(db, user_id)
+    res = await db.execute(
+        select(Album.id, Album.title, Album.artist, Placement.lower_elo, Placement.upper_elo, Placement.probes)
+        .join(UserAlbum, (UserAlbum.album_id == Album.id) & (UserAlbum.user_id == user_id))
+        .outerjoin(EloScore, (EloScore.album_id == Album.id) & (EloScore.user_id == user_id))
+        .outerjoin(Placement, (Placement.album_id == Album.id) & (Placement.user_id == user_id))
+        .where(EloScore.id.is_(None))
+        .order_by(Placement.id.is_(None), Placement.id, UserAlbum.id.desc())
+    )
+    return [row for row in res.all() if row.id not in excluded and album_key(row) not in ranked_keys]
+
+
+async def next_placement_pair(db: AsyncSession, user_id: int) -> Optional[Tuple[int, int, Dict[str, Any]]]:
+    """(album being placed, ranked opponent, progress) for the next probe, or None if nothing to place."""
+    items = merge_ranking_rows(await load_ranking_rows(db, user_id))
+    if len(items) < PLACEMENT_MIN_RANKED:
+        return None
+    pending = await _pending(db, user_id, {album_key(SimpleNamespace(**item["album"])) for item in items})
+    if not pending:
+        return None
+
+    current = pending[0]
+    opponent, window = _probe(items, current.lower_elo, current.upper_elo)
+    progress = {
+        "album_id": current.id,
+        "probes": current.probes or 0,
+        "remaining_probes": max(1, math.ceil(math.log2(window + 1))),
+        "pending_albums": len(pending),
+    }
+    return current.id, opponent["album"]["id"], progress
+
+
+async def submit_placement(
+    db: AsyncSession, user_id: int, payload: CompareSubmit, albums: Dict[int, Album]
+) -> Dict[str, Any]:
+    """Record one placement probe and narrow the album's bounds; seed its EloScore once they meet.
+
+    Like ``apply_vote``, this leaves the commit to the caller.
+
+    The ranked opponent's Elo is left as is (only its comparison count moves): a newcomer at the
+    default rating would otherwise pull settled albums around while it is still being slotted in.
+    """
+    res = await db.execute(
+        select(EloScore.album_id).where(
+            EloScore.user_id == user_id, EloScore.album_id.in_([payload.album_a_id, payload.album_b_id])
+        )
+    )
+    rated = set(res.scalars().all())
+    unrated = [album_id for album_id in (payload.album_a_id, payload.album_b_id) if album_id not in rated]
+    if len(unrated) != 1:
+        raise HTTPException(status_code=400, detail="Placement compares one unrated album against one ranked album")
+    album_id = unrated[0]
+    opponent_id = payload.album_b_id if album_id == payload.album_a_id else payload.album_a_id
+    if payload.winner_album_id not in (None, payload.album_a_id, payload.album_b_id):
+        raise HTTPException(status_code=400, detail="winner_album_id must be one of the compared albums or null")
+
+    items = merge_ranking_rows(await load_ranking_rows(db, user_id))
+    merged = {album_key(SimpleNamespace(**item["album"])): item["elo"] for item in items}
+    opponent_elo = merged.get(album_key(albums[opponent_id]))
+    if opponent_elo is None:
+        raise HTTPException(status_code=400, detail="Opponent is not in your rankings")
+
+    res = await db.execute(select(Placement).where(Placement.user_id == user_id, Placement.album_id == album_id))
+    placement = res.scalar_one_or_none()
+    if placement is None:
+        placement = Placement(user_id=user_id, album_id=album_id, probes=0)
+        db.add(placement)
+
+    placement.probes = (placement.probes or 0) + 1
+    if payload.winner_album_id is None:
+        # A draw places it level with the opponent.
+        placement.lower_elo = placement.upper_elo = opponent_elo
+    elif payload.winner_album_id == album_id:
+        placement.lower_elo = opponent_elo
+    else:
+        placement.upper_elo = opponent_elo
+    placed = placement.lower_elo == placement.upper_elo or not _window(items, placement.lower_elo, placement.upper_elo)
+
+    # The opponent's side records an unchanged Elo; the placed album's side stays empty until it is
+    # seeded, so app.history can replay and undo around probes.
+    res = await db.execute(select(EloScore).where(EloScore.user_id == user_id, EloScore.album_id == opponent_id))
+    opponent_score = res.scalar_one()
+    old_states = {opponent_id: (opponent_score.elo, opponent_score.comparisons_count)}
+    opponent_score.comparisons_count += 1
+    elo = seed_elo(placement.lower_elo, placement.upper_elo) if placed else None
+    sides = {album_id: (None, elo), opponent_id: (opponent_score.elo, opponent_score.elo)}
+    db.add(
+        Comparison(
+            user_id=user_id,
+            album_a_id=payload.album_a_id,
+            album_b_id=payload.album_b_id,
+            winner_album_id=payload.winner_album_id,
+            vote_id=payload.vote_id,
+            elo_a_before=sides[payload.album_a_id][0],
+            elo_a_after=sides[payload.album_a_id][1],
+            elo_b_before=sides[payload.album_b_id][0],
+            elo_b_after=sides[payload.album_b_id][1],
+        )
+    )
+    await record_comparison(
+        db,
+        user_id,
+        albums[payload.album_a_id],
+        albums[payload.album_b_id],
+        payload.winner_album_id,
+        [album_id] if placed else [],
+        None,
+    )
+
+    probes = placement.probes
+    if placed:
+        # Later duels still use the provisional K tier, since the count is only the probes so far.
+        db.add(EloScore(user_id=user_id, album_id=album_id, elo=elo, comparisons_count=probes))
+        if placement.id is not None:
+            await db.delete(placement)
+        else:
+            db.expunge(placement)
+        await record_ratings(db, {album_id: (normalized_rating(elo), None)})
+        old_states[album_id] = None
+    version = await bump_data_version(db, user_id)
+    excluded = await get_exclusions(db, user_id)
+    await record_ranking_changes(
+        db, user_id, version, {key: state for key, state in old_states.items() if key not in excluded}
+    )
+    await maybe_snapshot(db, user_id, version)
+
+    return {"status": "ok", "placed": placed, "probes": probes, "elo": elo}
+
+
+async def discard_placements(db: AsyncSession, user_id: int, album_ids: List[int]) -> None:
+    """Forget placement progress for albums that were rated some other way."""
+    if album_ids:
+        await db.execute(delete(Placement).where(Placement.user_id == user_id, Placement.album_id.in_(album_ids)))
+
+
+__all__ = [
+    "PLACEMENT_MIN_RANKED",
+    "seed_elo",
+    "next_placement_pair",
+    "submit_placement",
+    "discard_placements",
+]
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .changes import record_ranking_reset
+from .history import take_snapshot
+from .models import EloScore
+from .stats import rebuild_user_stats
+from .vote_buffer import get_vote_buffer
+
+# Pseudo-comparisons a seeded rating counts as when picking K (see core.elo.k_factor): an AOTY score
+# is the user's own verdict and starts in the K=20 tier; a play count is a weaker hint and only
+# shortens the K=40 tier.
+AOTY_PRIOR_COUNT = 20
+LASTFM_PRIOR_COUNT = 10
+# Elo per standard deviation of the signal within the import. Kept inside the range duels reach
+# after a few dozen votes, so real results can still reorder seeded albums.
+AOTY_SPREAD = 150.0
+LASTFM_SPREAD = 100.0
+MAX_Z = 2.5
+# Too few values to say where an album sits among the user's others.
+MIN_PRIOR_ALBUMS = 5
+
+
+def _numpy():
+    try:
+        import numpy  # type: ignore
+    except ImportError as exc:  # pragma: no cover - numpy is a declared dependency
+        raise RuntimeError("Elo seeding needs numpy installed on the server.") from exc
+    return numpy
+
+
+def score_priors(scores: Dict[int, float], spread: float = AOTY_SPREAD) -> Dict[int, float]:
+    """album id -> initial Elo from the user's own scores, by how far each is from their average.
+
+    Standardizing per import makes a harsh rater's 60 and a generous rater's 85 land the same way.
+    """
+    np = _numpy()
+    if len(scores) < MIN_PRIOR_ALBUMS:
+        return {}
+    values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+    std = values.std()
+    if std == 0:
+        return {}
+    z = np.clip((values - values.mean()) / std, -MAX_Z, MAX_Z)
+    return dict(zip(scores, (1500.0 + spread * z).tolist()))
+
+
+def rank_priors(counts: Dict[int, float], spread: float = LASTFM_SPREAD) -> Dict[int, float]:
+    """album id -> initial Elo from where each album's count ranks among the import's albums.
+
+    Ranks rather than raw counts, so one album played a thousand times does not flatten the rest;
+    tied counts share their average rank. Percentiles go through the logistic quantile scaled to
+    unit variance, giving the same spread per standard deviation as ``score_priors``.
+    """
+    np = _numpy()
+    if len(counts) < MIN_PRIOR_ALBUMS:
+        return {}
+    values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    unique, inverse, sizes = np.unique(values, return_inverse=True, return_counts=True)
+    if len(unique) < 2:
+        return {}
+    average_rank = np.cumsum(sizes) - (sizes + 1) / 2.0
+    pct = (average_rank[inverse] + 0.5) / len(values)
+    z = np.clip(np.log(pct / (1.0 - pct)) * math.sqrt(3.0) / math.pi, -MAX_Z, MAX_Z)
+    return dict(zip(counts, (1500.0 + spread * z).tolist()))
+
+
+async def seed_elo(db: AsyncSession, user_id: int, priors: Dict[int, float], prior_count: int) -> int:
+    """Insert EloScores for albums the user has no rating for yet; returns how many were seeded.
+
+    Ratings the user already has, from duels or an earlier import, are left alone.
+    """
+    if not priors:
+        return 0
+    res = await db.execute(
+        select(EloScore.album_id).where(EloScore.user_id == user_id, EloScore.album_id.in_(list(priors)))
+    )
+    rated = set(res.scalars().all())
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "album_id": album_id,
+            "elo": elo,
+            "comparisons_count": 0,
+            "prior_count": prior_count,
+            "updated_at": now,
+        }
+        for album_id, elo in priors.items()
+        if album_id not in rated
+    ]
+    if rows:
+        await db.execute(insert(EloScore), rows)
+        buffer = get_vote_buffer()
+        if buffer is not None:
+            buffer.add_priors(user_id, {row["album_id"]: (row["elo"], prior_count) for row in rows})
+    return len(rows)
+
+
+async def finish_seeding(db: AsyncSession, user_id: int) -> None:
+    """Bookkeeping after ``seed_elo`` added ratings, before the import commits.
+
+    Seeded ratings have no per-vote deltas, so like a rankings import they start a new history.
+    Call after ``bump_data_version``.
+    """
+    await rebuild_user_stats(db, user_id)
+    await record_ranking_reset(db, user_id)
+    await take_snapshot(db, user_id)
+
+
+def best_signal(pairs: Iterable[Tuple[int, float]]) -> Dict[int, float]:
+    """Collapse repeated albums (two releases resolving to one row) to their highest value."""
+    best: Dict[int, float] = {}
+    for album_id, value in pairs:
+        if album_id not in best or value > best[album_id]:
+            best[album_id] = value
+    return best
+
+
+__all__ = [
+    "AOTY_PRIOR_COUNT",
+    "LASTFM_PRIOR_COUNT",
+    "score_priors",
+    "rank_priors",
+    "seed_elo",
+    "finish_seeding",
+    "best_signal",
+]
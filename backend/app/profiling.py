@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter as FrameCounter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import FrameType
+from typing import Deque, Dict, List, Optional, Pattern
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from starlette.routing import Match, compile_path
+
+from .core.config import settings
+
+PROFILE_HEADER = b"x-profile"
+ADMIN_HEADER = b"x-admin-token"
+AWAIT_MARKER = "[awaiting I/O]"
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _await_chain(task: asyncio.Task) -> List[FrameType]:
+    """Frames of a suspended task, outermost first, following each coroutine's awaitable."""
+    frames: List[FrameType] = []
+    obj = task.get_coro()
+    while obj is not None:
+        frame = getattr(obj, "cr_frame", None) or getattr(obj, "gi_frame", None) or getattr(obj, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        obj = getattr(obj, "cr_await", None) or getattr(obj, "gi_yieldfrom", None) or getattr(obj, "ag_await", None)
+    return frames
+
+
+class Sampler:
+    """Samples one request's task from a background thread at a fixed interval.
+
+    While the task is running on the loop thread the thread's live stack is recorded; while it is
+    suspended the coroutine await chain is recorded instead, ending in ``[awaiting I/O]`` so time
+    spent waiting on the database or an HTTP call shows up in the flamegraph.
+    """
+
+    def __init__(self, task: asyncio.Task, root: FrameType, interval: float) -> None:
+        self.task = task
+        self.root = root
+        self.interval = interval
+        self.loop_thread = threading.get_ident()
+        self.stacks: FrameCounter[str] = FrameCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="albumduel-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        # The thread may be mid-sample; wait for it without blocking the loop.
+        await asyncio.to_thread(self._thread.join)
+
+    def _trim(self, frames: List[FrameType]) -> Optional[List[FrameType]]:
+        for i, frame in enumerate(frames):
+            if frame is self.root:
+                return frames[i + 1 :]
+        return None
+
+    def _sample(self) -> None:
+        live = sys._current_frames().get(self.loop_thread)
+        stack: List[FrameType] = []
+        while live is not None:
+            stack.append(live)
+            live = live.f_back
+        stack.reverse()
+        running = self._trim(stack)
+        if running is not None:
+            labels = [_label(f) for f in running]
+        else:
+            suspended = self._trim(_await_chain(self.task))
+            if suspended is None:
+                return
+            labels = [_label(f) for f in suspended] + [AWAIT_MARKER]
+        self.stacks[";".join(labels) or "[request]"] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:  # pragma: no cover - frames can vanish mid-walk
+                continue
+
+
+@dataclass
+class Profile:
+    id: int
+    method: str
+    path: str
+    route: str
+    status: int
+    started_at: datetime
+    duration_ms: float
+    samples: int
+    interval_ms: float
+    stacks: Dict[str, int] = field(repr=False, default_factory=dict)
+
+    def folded(self) -> str:
+        """Collapsed-stack text accepted by flamegraph.pl, speedscope and inferno."""
+        lines = [f"{stack} {count}" for stack, count in sorted(self.stacks.items())]
+        return "\n".join(lines) + "\n"
+
+
+class ProfilerState:
+    def __init__(self, keep: int) -> None:
+        self.armed: Dict[str, int] = {}
+        # Path regex of each armed template, so most requests are ruled out without routing them.
+        self._patterns: Dict[str, Pattern[str]] = {}
+        self.profiles: Deque[Profile] = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def arm(self, route: str, count: int) -> None:
+        with self._lock:
+            self.armed[route] = count
+            self._patterns[route] = compile_path(route)[0]
+
+    def disarm(self, route: Optional[str] = None) -> None:
+        with self._lock:
+            if route is None:
+                self.armed.clear()
+                self._patterns.clear()
+            else:
+                self.armed.pop(route, None)
+                self._patterns.pop(route, None)
+
+    def could_match(self, path: str) -> bool:
+        return any(pattern.match(path) for pattern in list(self._patterns.values()))
+
+    def claim(self, route: str) -> bool:
+        with self._lock:
+            remaining = self.armed.get(route)
+            if not remaining:
+                return False
+            if remaining <= 1:
+                del self.armed[route]
+                del self._patterns[route]
+            else:
+                self.armed[route] = remaining - 1
+            return True
+
+    async def store(self, profile: Profile) -> None:
+        profile.id = next(self._ids)
+        self.profiles.append(profile)
+        if settings.profile_dir:
+            name = f"{profile.id:05d}-{profile.method}-{profile.route.strip('/').replace('/', '_') or 'root'}.folded"
+            await asyncio.to_thread(_write_profile, os.path.join(settings.profile_dir, name), profile.folded())
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+
+def _write_profile(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fh:
+        fh.write(text)
+
+
+state = ProfilerState(keep=settings.profile_keep)
+
+
+def _route_template(scope) -> str:
+    """Path template of the route that will handle the request, e.g. ``/albums/{album_id}``.
+
+    Routing happens inside the app, after this middleware, so the match is worked out here the
+    same way; requests no route matches keep their raw path.
+    """
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return scope["path"]
+
+
+def _admin_token_ok(token: Optional[str]) -> bool:
+    return bool(settings.admin_token and token and secrets.compare_digest(token, settings.admin_token))
+
+
+class ProfilingMiddleware:
+    """Profiles requests armed via the admin API or carrying ``X-Profile`` with a valid admin token.
+
+    Only installed when ``PROFILING_ENABLED`` is set, so disabled deployments pay nothing.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    def _wanted(self, scope) -> Optional[str]:
+        """The route template to file the profile under, or None to pass the request through.
+
+        Routing is only repeated here for requests that may be profiled: paths matching an armed
+        template (another route may own the path, so the match is confirmed) or carrying the header.
+        """
+        template = None
+        if state.armed and state.could_match(scope["path"]):
+            template = _route_template(scope)
+            if state.claim(template):
+                return template
+        headers = dict(scope.get("headers") or ())
+        if PROFILE_HEADER in headers and _admin_token_ok(headers.get(ADMIN_HEADER, b"").decode("latin-1")):
+            return template or _route_template(scope)
+        return None
+
+    async def __call__(self, scope, receive, send) -> None:
+        route = self._wanted(scope) if scope["type"] == "http" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        task = asyncio.current_task()
+        sampler = Sampler(task, sys._getframe(), settings.profile_interval_ms / 1000.0)
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await sampler.stop()
+            await state.store(
+                Profile(
+                    id=0,
+                    method=scope.get("method", ""),
+                    path=scope["path"],
+                    route=route,
+                    status=status["code"],
+                    started_at=started_at,
+                    duration_ms=round((time.perf_counter() - started) * 1000.0, 3),
+                    samples=sampler.samples,
+                    interval_ms=settings.profile_interval_ms,
+                    stacks=dict(sampler.stacks),
+                )
+            )
+
+
+async def require_admin(x_admin_token: str | None = Header(default=None)) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not _admin_token_ok(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+router = APIRouter(prefix="/admin/profiling", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+class ArmRequest(BaseModel):
+    # The route template as declared, e.g. "/admin/profiling/profiles/{profile_id}", not a concrete URL.
+    path: str
+    count: int = 1
+
+
+@router.post("/arm")
+async def arm_profiler(payload: ArmRequest):
+    if payload.count < 1:
+        raise HTTPException(status_code=400, detail="count must be at least 1")
+    state.arm(payload.path, min(payload.count, 1000))
+    return {"status": "ok", "armed": state.armed}
+
+
+@router.delete("/arm")
+async def disarm_profiler(path: str | None = None):
+    state.disarm(path)
+    return {"status": "ok", "armed": state.armed}
+
+
+@router.get("/profiles")
+async def list_profiles():
+    return {
+        "armed": state.armed,
+        "profiles": [
+            {
+                "id": p.id,
+                "method": p.method,
+                "path": p.path,
+                "route": p.route,
+                "status": p.status,
+                "started_at": p.started_at,
+                "duration_ms": p.duration_ms,
+                "samples": p.samples,
+                "interval_ms": p.interval_ms,
+            }
+            for p in reversed(state.profiles)
+        ],
+    }
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def download_profile(profile_id: int):
+    profile = state.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile.folded(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.folded"'},
+    )
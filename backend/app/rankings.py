@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .catalog import ALBUM_COLUMNS, ALBUM_FIELDS, RankingRow, album_catalog
+from .core.elo import elo_to_100
+from .changes import CHANGE_LOG_VERSIONS, OldState
+from .exclusions import get_exclusions
+from .models import EloScore, RankingChange, User
+
+RANKING_COLUMNS = ALBUM_COLUMNS + (EloScore.elo, EloScore.comparisons_count)
+
+
+def choose_canonical_album(a, b):
+    # Prefer album with spotify_id, else with any cover_url, else newer year, else higher id for stability.
+    if bool(a.spotify_id) != bool(b.spotify_id):
+        return a if a.spotify_id else b
+    if bool(a.cover_url) != bool(b.cover_url):
+        return a if a.cover_url else b
+    if (a.year or 0) != (b.year or 0):
+        return a if (a.year or 0) >= (b.year or 0) else b
+    return a if a.id >= b.id else b
+
+
+def album_key(row) -> Tuple[str, str]:
+    """Logical album identity used to group duplicates in the rankings."""
+    return (row.title.strip().lower(), row.artist.strip().lower())
+
+
+def album_dict(row) -> Dict[str, Any]:
+    return {name: getattr(row, name) for name in ALBUM_FIELDS}
+
+
+def merge_ranking_rows(rows: Iterable) -> List[Dict[str, Any]]:
+    """Group rows of RANKING_COLUMNS by logical album and merge their Elo, best first.
+
+    Rows only need attribute access (SQLAlchemy ``Row`` objects work), and the result is plain
+    dicts shaped like ``RankingEntry`` so it can be encoded without model validation.
+    """
+    groups: Dict[Tuple[str, str], List] = {}
+    for row in rows:
+        key = album_key(row)
+        existing = groups.get(key)
+        if existing and any(r.id == row.id for r in existing):
+            continue
+        groups.setdefault(key, []).append(row)
+
+    items: List[Dict[str, Any]] = []
+    for entries in groups.values():
+        # Merge Elo within this logical album group.
+        total_weighted_elo = 0.0
+        total_weight = 0
+        total_comparisons = 0
+        canonical = None
+
+        for row in entries:
+            weight = max(1, row.comparisons_count)
+            total_weighted_elo += row.elo * weight
+            total_weight += weight
+            total_comparisons += row.comparisons_count
+            canonical = row if canonical is None else choose_canonical_album(canonical, row)
+
+        merged_elo = total_weighted_elo / total_weight if total_weight > 0 else 1500.0
+        items.append(
+            {
+                "album": album_dict(canonical),
+                "elo": merged_elo,
+                "rating_100": elo_to_100(merged_elo),
+                "comparisons_count": total_comparisons,
+            }
+        )
+
+    items.sort(key=lambda x: x["elo"], reverse=True)
+    return items
+
+
+async def load_ranking_rows(db: AsyncSession, user_id: int) -> List[RankingRow]:
+    """Rows shaped like RANKING_COLUMNS for every rated, non-excluded album of a user, by album id.
+
+    Only the Elo scores come from the database; album fields come from the in-process catalog.
+    """
+    excluded = await get_exclusions(db, user_id)
+    res = await db.execute(
+        select(EloScore.album_id, EloScore.elo, EloScore.comparisons_count)
+        .where(EloScore.user_id == user_id)
+        .order_by(EloScore.album_id)
+    )
+    scores = [row for row in res.all() if row.album_id not in excluded]
+    albums = await album_catalog.lookup(db, [row.album_id for row in scores])
+    return [
+        RankingRow(albums[album_id], elo, count) for album_id, elo, count in scores if album_id in albums
+    ]
+
+
+def _ranked(rows: Iterable) -> Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]]:
+    return {
+        album_key(SimpleNamespace(**item["album"])): (rank, item)
+        for rank, item in enumerate(merge_ranking_rows(sorted(rows, key=lambda row: row.id)), start=1)
+    }
+
+
+async def build_ranking_changes(db: AsyncSession, user: User, since: int) -> Dict[str, Any]:
+    """Entries whose merged Elo or rank differ between version ``since`` and now.
+
+    The previous ranking is rebuilt from the current rows by restoring each changed album's
+    earliest logged state after ``since``; both sides are merged exactly like ``/rankings``.
+    """
+    version = user.data_version or 0
+    if since == version:
+        return {"version": version, "full": False, "items": [], "removed": []}
+
+    rows = await load_ranking_rows(db, user.id)
+    full = since > version or since < version - CHANGE_LOG_VERSIONS
+    old_states: Dict[int, OldState] = {}
+    if not full:
+        res = await db.execute(
+            select(RankingChange.album_id, RankingChange.old_elo, RankingChange.old_comparisons_count)
+            .where(RankingChange.user_id == user.id, RankingChange.version > since)
+            .order_by(RankingChange.version, RankingChange.id)
+        )
+        for album_id, old_elo, old_count in res.all():
+            if album_id is None:
+                full = True
+                break
+            if album_id not in old_states:
+                old_states[album_id] = (old_elo, old_count or 0) if old_elo is not None else None
+
+    current = _ranked(rows)
+    if full:
+        items = [{**item, "rank": rank} for rank, item in current.values()]
+        return {"version": version, "full": True, "items": items, "removed": []}
+
+    by_id: Dict[int, Any] = {row.id: row for row in rows}
+    missing = [album_id for album_id, state in old_states.items() if state and album_id not in by_id]
+    if missing:
+        by_id.update(await album_catalog.lookup(db, missing))
+
+    old_rows: List = [row for row in rows if row.id not in old_states]
+    for album_id, state in old_states.items():
+        if state is not None and album_id in by_id:
+            album = by_id[album_id]
+            old_rows.append(RankingRow(album, state[0], state[1]))
+    previous = _ranked(old_rows)
+
+    items = []
+    for key, (rank, item) in current.items():
+        before = previous.get(key)
+        if (
+            before is None
+            or before[0] != rank
+            or before[1]["elo"] != item["elo"]
+            or before[1]["album"]["id"] != item["album"]["id"]
+        ):
+            items.append({**item, "rank": rank})
+    items.sort(key=lambda entry: entry["rank"])
+    removed = [item["album"]["id"] for key, (_, item) in previous.items() if key not in current]
+    return {"version": version, "full": False, "items": items, "removed": removed}
+
+
+__all__ = [
+    "ALBUM_FIELDS",
+    "ALBUM_COLUMNS",
+    "RANKING_COLUMNS",
+    "choose_canonical_album",
+    "album_key",
+    "album_dict",
+    "merge_ranking_rows",
+    "load_ranking_rows",
+    "build_ranking_changes",
+]
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from .core.config import settings
+from .db import SessionLocal, engine, get_db
+from .fastjson import FastJSONResponse
+from .models import (
+    Album,
+    EloScore,
+    User,
+    UserAlbum,
+    UserAlbumExclusion,
+    UserRecommendation,
+    UserRecommendationState,
+)
+from .rankings import ALBUM_COLUMNS, album_dict
+from .schemas import RecommendationsResponse
+from .spotify import require_spotify_user
+
+logger = logging.getLogger(__name__)
+
+FACTORS = 32
+OVERSAMPLE = 10
+POWER_ITERATIONS = 4
+# Recommendations stored per user; the endpoint serves a prefix of these.
+TOP_N = 100
+MAX_LIMIT = 50
+# Cap on nnz x factors floats materialised at once by the sparse products.
+PRODUCT_CHUNK_NNZ = 250_000
+WRITE_BATCH_USERS = 200
+
+
+def _numpy():
+    try:
+        import numpy  # type: ignore
+    except Exception:  # pragma: no cover - optional dependency
+        raise RuntimeError("Recommendations need numpy installed on the server.")
+    return numpy
+
+
+class SparseMatrix:
+    """Row- and column-sorted copies of a COO matrix with the two products randomized SVD needs.
+
+    Products reduce contiguous segments with ``np.add.reduceat`` in bounded chunks, so memory stays
+    proportional to the chunk size rather than to nnz x factors.
+    """
+
+    def __init__(self, rows, cols, vals, shape: Tuple[int, int]) -> None:
+        np = _numpy()
+        self.shape = shape
+        self._by_row = self._segments(np, rows, cols, vals)
+        self._by_col = self._segments(np, cols, rows, vals)
+
+    @staticmethod
+    def _segments(np, major, minor, vals):
+        order = np.argsort(major, kind="stable")
+        major, minor, vals = major[order], minor[order], vals[order]
+        starts = np.flatnonzero(np.r_[True, major[1:] != major[:-1]]) if len(major) else np.zeros(0, dtype=np.int64)
+        return major[starts], starts, minor, vals
+
+    @staticmethod
+    def _product(np, segments, X, n_out: int):
+        ids, starts, minor, vals = segments
+        out = np.zeros((n_out, X.shape[1]), dtype=X.dtype)
+        if not len(ids):
+            return out
+        bounds = np.r_[starts, len(minor)]
+        i = 0
+        while i < len(ids):
+            # Take whole segments until the chunk holds roughly PRODUCT_CHUNK_NNZ entries.
+            j = int(np.searchsorted(bounds, bounds[i] + PRODUCT_CHUNK_NNZ, side="right")) - 1
+            j = min(max(j, i + 1), len(ids))
+            lo, hi = bounds[i], bounds[j]
+            block = vals[lo:hi, None] * X[minor[lo:hi]]
+            out[ids[i:j]] = np.add.reduceat(block, starts[i:j] - lo, axis=0)
+            i = j
+        return out
+
+    def dot(self, X):
+        return self._product(_numpy(), self._by_row, X, self.shape[0])
+
+    def tdot(self, Y):
+        return self._product(_numpy(), self._by_col, Y, self.shape[1])
+
+
+def randomized_svd(matrix: SparseMatrix, k: int, seed: int = 0):
+    """Top-``k`` singular values and right singular vectors (Halko et al. randomized range finder)."""
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    width = min(k + OVERSAMPLE, min(matrix.shape))
+    Y = matrix.dot(rng.standard_normal((matrix.shape[1], width)).astype(np.float32))
+    for _ in range(POWER_ITERATIONS):
+        Q, _ = np.linalg.qr(Y)
+        Z, _ = np.linalg.qr(matrix.tdot(Q))
+        Y = matrix.dot(Z)
+    Q, _ = np.linalg.qr(Y)
+    B = matrix.tdot(Q).T
+    _, s, vt = np.linalg.svd(B, full_matrices=False)
+    return s[:k], vt[:k].T.astype(np.float32)
+
+
+@dataclass
+class Ratings:
+    """Mean-centred 0-100 ratings as parallel numpy arrays, sorted by user."""
+
+    user_ids: Any
+    album_ids: Any
+    values: Any
+
+
+def centre_ratings(user_ids: Sequence[int], album_ids: Sequence[int], elos: Sequence[float]) -> Ratings:
+    np = _numpy()
+    users = np.asarray(user_ids, dtype=np.int64)
+    albums = np.asarray(album_ids, dtype=np.int64)
+    # Vectorised core.elo.elo_to_100.
+    x = (np.asarray(elos, dtype=np.float64) - 1500.0) / 120.0
+    ratings = np.clip(np.round(50.0 + 45.0 * (x / (1.0 + np.abs(x))), 1), 0.0, 100.0)
+    order = np.argsort(users, kind="stable")
+    users, albums, ratings = users[order], albums[order], ratings[order]
+    if len(users):
+        _, inverse, counts = np.unique(users, return_inverse=True, return_counts=True)
+        means = np.bincount(inverse, weights=ratings) / counts
+        ratings = (ratings - means[inverse]) / 50.0
+    return Ratings(users, albums, ratings.astype(np.float32))
+
+
+@dataclass
+class Model:
+    model_id: int
+    # Sorted album ids, their item factors (albums x k) and rater counts for the cold-start fallback.
+    album_ids: Any
+    factors: Any
+    popularity: Any
+
+    def save(self, path: str) -> None:
+        np = _numpy()
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, model_id=self.model_id, album_ids=self.album_ids, factors=self.factors, popularity=self.popularity)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Model"]:
+        if not os.path.exists(path):
+            return None
+        np = _numpy()
+        with np.load(path) as data:
+            return cls(int(data["model_id"]), data["album_ids"], data["factors"], data["popularity"])
+
+
+def fit(ratings: Ratings, k: int = FACTORS, seed: int = 0) -> Model:
+    """Factorise the user x album matrix; the item factors V give scores V @ (V_u^T r_u)."""
+    np = _numpy()
+    album_ids, cols = np.unique(ratings.album_ids, return_inverse=True)
+    user_ids, rows = np.unique(ratings.user_ids, return_inverse=True)
+    popularity = np.bincount(cols, minlength=len(album_ids)).astype(np.float32)
+    k = max(1, min(k, len(user_ids) - 1, len(album_ids) - 1))
+    if len(user_ids) < 2 or len(album_ids) < 2:
+        factors = np.zeros((len(album_ids), 1), dtype=np.float32)
+    else:
+        matrix = SparseMatrix(rows, cols, ratings.values, (len(user_ids), len(album_ids)))
+        _, factors = randomized_svd(matrix, k, seed)
+    return Model(int(time.time()), album_ids, factors, popularity)
+
+
+def _positions(sorted_ids, ids):
+    """Indexes into ``sorted_ids`` of the ``ids`` it contains, and the mask of which ones did."""
+    np = _numpy()
+    pos = np.searchsorted(sorted_ids, ids)
+    present = pos < len(sorted_ids)
+    present[present] = sorted_ids[pos[present]] == ids[present]
+    return pos[present], present
+
+
+def recommend(model: Model, album_ids, values, known: Set[int], n: int = TOP_N) -> List[Tuple[int, float]]:
+    """Top-``n`` unseen albums for one user's centred ratings, falling back to popularity."""
+    np = _numpy()
+    idx, present = _positions(model.album_ids, album_ids)
+    values = values[present]
+    if len(idx) and np.any(values):
+        scores = model.factors @ (model.factors[idx].T @ values)
+    else:
+        scores = model.popularity / max(float(model.popularity.max(initial=0.0)), 1.0)
+    scores = scores.astype(np.float64, copy=True)
+    if known:
+        pos, _ = _positions(model.album_ids, np.fromiter(known, dtype=np.int64, count=len(known)))
+        scores[pos] = -np.inf
+    n = min(n, int(np.isfinite(scores).sum()))
+    if n <= 0:
+        return []
+    top = np.argpartition(-scores, n - 1)[:n]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(int(model.album_ids[i]), float(scores[i])) for i in top]
+
+
+async def _load_ratings(db: AsyncSession, user_ids: Optional[Iterable[int]] = None) -> Ratings:
+    stmt = select(EloScore.user_id, EloScore.album_id, EloScore.elo).where(EloScore.comparisons_count > 0)
+    if user_ids is not None:
+        stmt = stmt.where(EloScore.user_id.in_(list(user_ids)))
+    users: List[int] = []
+    albums: List[int] = []
+    elos: List[float] = []
+    result = await db.stream(stmt.execution_options(yield_per=10_000))
+    async for partition in result.partitions(10_000):
+        for user_id, album_id, elo in partition:
+            users.append(user_id)
+            albums.append(album_id)
+            elos.append(elo)
+    return centre_ratings(users, albums, elos)
+
+
+async def _known_albums(db: AsyncSession, user_ids: List[int]) -> Dict[int, Set[int]]:
+    known: Dict[int, Set[int]] = {user_id: set() for user_id in user_ids}
+    for model in (UserAlbum, UserAlbumExclusion, EloScore):
+        res = await db.execute(select(model.user_id, model.album_id).where(model.user_id.in_(user_ids)))
+        for user_id, album_id in res.all():
+            known[user_id].add(album_id)
+    return known
+
+
+async def _stale_users(db: AsyncSession, model_id: int, full: bool) -> List[Tuple[int, int]]:
+    state = UserRecommendationState
+    stmt = select(User.id, User.data_version).outerjoin(state, state.user_id == User.id)
+    if not full:
+        stmt = stmt.where(
+            (state.user_id.is_(None)) | (state.data_version != User.data_version) | (state.model_id != model_id)
+        )
+    res = await db.execute(stmt.order_by(User.id))
+    return [(user_id, version or 0) for user_id, version in res.all()]
+
+
+async def run_job(
+    bind: AsyncEngine = engine,
+    refit: bool = False,
+    model_path: Optional[str] = None,
+    log: Callable[[str], None] = logger.info,
+) -> Dict[str, int]:
+    """Refresh stored recommendations for users whose data changed since their last run.
+
+    The item factors are refitted from every user's ratings when ``refit`` is set or no model
+    exists yet; otherwise the saved model is reused and only changed users are folded in.
+    """
+    np = _numpy()
+    model_path = model_path or settings.recommendation_model_path
+    model = None if refit else Model.load(model_path)
+    async with SessionLocal(bind=bind) as db:
+        if model is None:
+            ratings = await _load_ratings(db)
+            log(f"fitting on {len(ratings.values)} ratings")
+            model = await asyncio.to_thread(fit, ratings)
+            model.save(model_path)
+            refit = True
+
+        stale = await _stale_users(db, model.model_id, refit)
+        log(f"model {model.model_id}: {len(model.album_ids)} albums, {len(stale)} users to refresh")
+        for start in range(0, len(stale), WRITE_BATCH_USERS):
+            batch = stale[start : start + WRITE_BATCH_USERS]
+            user_ids = [user_id for user_id, _ in batch]
+            ratings = await _load_ratings(db, user_ids)
+            known = await _known_albums(db, user_ids)
+            bounds = np.searchsorted(ratings.user_ids, np.asarray(user_ids + [user_ids[-1] + 1], dtype=np.int64))
+
+            def compute() -> Dict[int, List[Tuple[int, float]]]:
+                out = {}
+                for i, user_id in enumerate(user_ids):
+                    lo, hi = bounds[i], bounds[i + 1]
+                    out[user_id] = recommend(model, ratings.album_ids[lo:hi], ratings.values[lo:hi], known[user_id])
+                return out
+
+            results = await asyncio.to_thread(compute)
+            now = datetime.utcnow()
+            await db.execute(delete(UserRecommendation).where(UserRecommendation.user_id.in_(user_ids)))
+            await db.execute(delete(UserRecommendationState).where(UserRecommendationState.user_id.in_(user_ids)))
+            rows = [
+                {"user_id": user_id, "album_id": album_id, "score": score, "rank": rank}
+                for user_id, recs in results.items()
+                for rank, (album_id, score) in enumerate(recs, start=1)
+            ]
+            if rows:
+                await db.execute(insert(UserRecommendation), rows)
+            await db.execute(
+                insert(UserRecommendationState),
+                [
+                    {"user_id": user_id, "data_version": version, "model_id": model.model_id, "computed_at": now}
+                    for user_id, version in batch
+                ],
+            )
+            await db.commit()
+    return {"model_id": model.model_id, "albums": len(model.album_ids), "users": len(stale)}
+
+
+async def run_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            summary = await run_job()
+            logger.info("recommendations refreshed: %s", summary)
+        except Exception:  # pragma: no cover - keep the loop alive across transient errors
+            logger.exception("recommendation refresh failed")
+
+
+router = APIRouter(tags=["recommendations"])
+
+
+@router.get("/recommendations", response_model=RecommendationsResponse)
+async def get_recommendations(
+    limit: int = Query(20, ge=1, le=MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+):
+    rec = UserRecommendation
+    # Albums added to the library or rated since the last job run are dropped at read time.
+    seen = [
+        exists().where(model.user_id == user.id, model.album_id == rec.album_id)
+        for model in (UserAlbum, UserAlbumExclusion, EloScore)
+    ]
+    res = await db.execute(
+        select(*ALBUM_COLUMNS, rec.score, rec.rank)
+        .join(rec, rec.album_id == Album.id)
+        .where(rec.user_id == user.id, *(~s for s in seen))
+        .order_by(rec.rank)
+        .limit(limit)
+    )
+    state = await db.get(UserRecommendationState, user.id)
+    items = [{"album": album_dict(row), "score": round(row.score, 4)} for row in res.all()]
+    return FastJSONResponse({"items": items, "computed_at": state.computed_at if state else None})
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.recommendations", description="Refresh precomputed album recommendations."
+    )
+    parser.add_argument("--refit", action="store_true", help="refit the factor model from all ratings first")
+    args = parser.parse_args(argv)
+    summary = asyncio.run(run_job(refit=args.refit, log=print))
+    print(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+import random
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+DEFAULT_K = 25
+MAX_K = 500
+DEFAULT_CONFIDENCE = 0.95
+# Rating error of an album with few votes; it narrows with the square root of its comparisons until
+# it reaches the noise Elo keeps at the lowest K tier. Both fitted on simulated voters.
+ELO_SIGMA = 500.0
+SIGMA_FLOOR = 30.0
+# Upper bound on the updates a stability check replays; the change log keeps at most this many.
+MAX_STABLE_UPDATES = 1_000
+
+
+def _numpy():
+    try:
+        import numpy  # type: ignore
+    except ImportError as exc:  # pragma: no cover - numpy is a declared dependency
+        raise RuntimeError("Top-K refinement needs numpy installed on the server.") from exc
+    return numpy
+
+
+@dataclass
+class Boundary:
+    """Where the K-th rank boundary sits and which albums may still cross it."""
+
+    k: int
+    confidence: float
+    threshold: Optional[float]
+    # Indices into the ranking (best first) whose interval contains the threshold, nearest first.
+    uncertain: List[int]
+    # Sampling weight per uncertain index: the normal density of its distance to the threshold.
+    weights: List[float]
+    # Latest consecutive rating updates that left the top-K membership unchanged, and how many
+    # must in a row at this confidence (see ``required_updates``).
+    stable_updates: int = 0
+    required: int = 0
+
+    @property
+    def converged(self) -> bool:
+        # Intervals stop narrowing at SIGMA_FLOOR, so albums rated within a few floors of each
+        # other always straddle; a membership that has held long enough settles them instead.
+        return not self.uncertain or (self.required > 0 and self.stable_updates >= self.required)
+
+
+def find_boundary(
+    elos: Sequence[float], counts: Sequence[int], k: int, confidence: float = DEFAULT_CONFIDENCE
+) -> Boundary:
+    """Albums whose ``confidence`` interval straddles the midpoint between ranks K and K+1.
+
+    ``elos`` must be sorted best first. Each album's interval is its Elo +/- z * sigma, with
+    sigma = max(ELO_SIGMA / sqrt(1 + comparisons), SIGMA_FLOOR); once none contains the threshold,
+    every album is on its side of the boundary at that confidence and the top K is settled.
+    """
+    if len(elos) <= k:
+        return Boundary(k, confidence, None, [], [])
+    np = _numpy()
+    elo = np.asarray(elos, dtype=np.float64)
+    sigma = np.maximum(ELO_SIGMA / np.sqrt(1.0 + np.asarray(counts, dtype=np.float64)), SIGMA_FLOOR)
+    threshold = float((elo[k - 1] + elo[k]) / 2.0)
+    margin = np.abs(elo - threshold) / sigma
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    uncertain = np.flatnonzero(margin < z)
+    uncertain = uncertain[np.argsort(margin[uncertain], kind="stable")]
+    weights = np.exp(-0.5 * margin[uncertain] ** 2)
+    return Boundary(k, confidence, threshold, uncertain.tolist(), weights.tolist(), 0, required_updates(confidence))
+
+
+def required_updates(confidence: float) -> int:
+    """Unchanged updates in a row after which the top K counts as settled at ``confidence``.
+
+    If each update still changed the membership with probability 1 - confidence, a run of n
+    unchanged ones would have probability confidence ** n; n is the smallest run for which that
+    drops to 1 - confidence.
+    """
+    return min(math.ceil(math.log(1.0 - confidence) / math.log(confidence)), MAX_STABLE_UPDATES)
+
+
+def stable_updates(
+    elos: Mapping[int, float], history: Sequence[Mapping[int, Optional[float]]], k: int
+) -> int:
+    """How many of the latest updates, newest first, left the top-K album ids unchanged.
+
+    ``elos`` is the current album id -> Elo; each ``history`` entry maps the album ids one update
+    touched to their Elo before it, None where the album was not ranked. Replay stops at the first
+    update that moved an album across the K-th rank.
+    """
+    if len(elos) <= k or not history:
+        return 0
+    np = _numpy()
+    index = {album_id: i for i, album_id in enumerate(elos)}
+    values = np.fromiter(elos.values(), dtype=np.float64, count=len(elos))
+
+    def top():
+        ranked = values[np.isfinite(values)]
+        if len(ranked) <= k:
+            return None
+        kth = np.partition(ranked, len(ranked) - k)[len(ranked) - k]
+        return frozenset(np.flatnonzero(values >= kth).tolist())
+
+    current = top()
+    stable = 0
+    for step in history:
+        for album_id, old in step.items():
+            i = index.get(album_id)
+            if i is None:
+                # Rated since, and no longer ranked now (excluded): irrelevant to either side.
+                if old is None:
+                    continue
+                index[album_id] = i = len(values)
+                values = np.append(values, -np.inf)
+            values[i] = -np.inf if old is None else old
+        if top() != current:
+            break
+        stable += 1
+    return stable
+
+
+def pick_pair(
+    boundary: Boundary,
+    elos: Sequence[float],
+    rng: random.Random = random,
+    implied: Optional[Callable[[int, int], bool]] = None,
+) -> Optional[Tuple[int, int]]:
+    """Two ranking indices to duel next, or None once the boundary has converged.
+
+    The first album is drawn from the uncertain set, favouring those closest to the threshold; its
+    opponent is the nearest-rated album on the other side of the boundary, so every vote tests the
+    top-K membership directly. ``implied(i, j)`` lets callers skip pairs already settled.
+    """
+    if boundary.converged:
+        return None
+    first = rng.choices(boundary.uncertain, weights=boundary.weights)[0]
+    above = elos[first] > boundary.threshold
+    others = [i for i in range(len(elos)) if i != first and (elos[i] > boundary.threshold) != above]
+    if not others:
+        others = [i for i in range(len(elos)) if i != first]
+    others.sort(key=lambda i: abs(elos[i] - elos[first]))
+    for other in others:
+        if implied is None or not implied(first, other):
+            return first, other
+    return first, others[0]
+
+
+def progress(boundary: Boundary) -> Dict[str, Any]:
+    return {
+        "k": boundary.k,
+        "confidence": boundary.confidence,
+        "boundary_elo": round(boundary.threshold, 1) if boundary.threshold is not None else None,
+        "uncertain_albums": len(boundary.uncertain),
+        "stable_updates": boundary.stable_updates,
+        "converged": boundary.converged,
+    }
+
+
+__all__ = [
+    "DEFAULT_K",
+    "MAX_K",
+    "DEFAULT_CONFIDENCE",
+    "Boundary",
+    "find_boundary",
+    "required_updates",
+    "stable_updates",
+    "pick_pair",
+    "progress",
+]
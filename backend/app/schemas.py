@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from .core.elo import elo_to_100
 
@@ -36,16 +36,61 @@ class ComparePairAlbum(AlbumBase):
     comparisons_count: int
 
 
+class PlacementProgress(BaseModel):
+    # Unrated album being binary-searched into the ranking; the other album is the midpoint probe.
+    album_id: int
+    probes: int
+    remaining_probes: int
+    pending_albums: int
+
+
+class TopKProgress(BaseModel):
+    k: int
+    confidence: float
+    # Elo midway between ranks K and K+1; None while the ranking has K albums or fewer.
+    boundary_elo: Optional[float] = None
+    # Albums whose confidence interval still straddles the boundary; 0 means the top K is settled.
+    uncertain_albums: int
+    # Latest updates in a row that left the top-K membership unchanged; enough of them also settle it.
+    stable_updates: int = 0
+    converged: bool
+
+
 class ComparePair(BaseModel):
     album_a: ComparePairAlbum
     album_b: ComparePairAlbum
     total_comparisons: int
+    # Set only for ?mode=placement pairs; submit those with mode "placement".
+    placement: Optional[PlacementProgress] = None
+    # Set only for ?mode=topk; once converged the pair is a random one.
+    refinement: Optional[TopKProgress] = None
+
+
+class CompareMeta(BaseModel):
+    total_comparisons: int
+    rated_albums: int
+    library_albums: int
+    data_version: int
+
+
+class ResolvedPairs(BaseModel):
+    # Albums that appear in at least one decided vote, and the pairs among them.
+    albums: int
+    total_pairs: int
+    # Pairs whose order is known directly or by transitivity.
+    resolved_pairs: int
+    resolved_fraction: float
+    # Votes that went against an order already implied by earlier votes.
+    contradictions: int
 
 
 class CompareSubmit(BaseModel):
     album_a_id: int
     album_b_id: int
     winner_album_id: Optional[int] = None
+    mode: str = Field("random", pattern="^(random|placement)$")
+    # Client-generated id (e.g. a UUID); resubmitting the same id is acknowledged without a second vote.
+    vote_id: Optional[str] = Field(None, min_length=1, max_length=64)
 
 
 class RankingEntry(BaseModel):
@@ -59,13 +104,113 @@ class RankingsResponse(BaseModel):
     items: list[RankingEntry]
 
 
+class RankingChange(RankingEntry):
+    rank: int
+
+
+class RankingChangesResponse(BaseModel):
+    version: int
+    # True when the delta could not be computed and ``items`` is the whole leaderboard.
+    full: bool
+    items: list[RankingChange]
+    removed: list[int]
+
+
+class CommunityEntry(BaseModel):
+    rank: int
+    album: AlbumBase
+    # Mean rating pulled toward 50 for albums with few raters; the leaderboard is ordered by it.
+    community_rating: float
+    mean_rating: float
+    raters: int
+    stddev: float
+    # Share of community_rating that comes from actual ratings rather than the prior (0-1).
+    confidence: float
+
+
+class CommunityRankingsResponse(BaseModel):
+    items: list[CommunityEntry]
+    total: int
+    offset: int
+    limit: int
+
+
+class Recommendation(BaseModel):
+    album: AlbumBase
+    score: float
+
+
+class RecommendationsResponse(BaseModel):
+    items: list[Recommendation]
+    computed_at: Optional[datetime] = None
+
+
+class AlbumSearchResult(BaseModel):
+    album: AlbumBase
+    score: float
+    # Your Elo for the album; None when you have not rated it yet.
+    elo: Optional[float] = None
+    comparisons_count: int = 0
+    in_library: bool
+    excluded: bool
+
+
+class AlbumSearchResponse(BaseModel):
+    items: list[AlbumSearchResult]
+
+
+class ImportSyncStateOut(BaseModel):
+    source: str
+    account: Optional[str] = None
+    last_synced_at: Optional[datetime] = None
+    last_imported: int = 0
+
+
+class ImportSyncStatesResponse(BaseModel):
+    items: list[ImportSyncStateOut]
+
+
+class GenreCount(BaseModel):
+    name: str
+    albums: int
+
+
+class GenresResponse(BaseModel):
+    items: list[GenreCount]
+
+
 class ExcludeAlbumRequest(BaseModel):
     album_id: int
 
 
+class ExcludeAlbumsRequest(BaseModel):
+    album_ids: list[int]
+
+
+class FacetStat(BaseModel):
+    value: str
+    library_albums: int
+    rated_albums: int
+    wins: int
+    losses: int
+    draws: int
+    win_rate: Optional[float] = None
+
+
 class StatsResponse(BaseModel):
     total_albums: int
     total_comparisons: int
+    library_albums: int = 0
+    draws: int = 0
+    comparisons_last_7_days: int = 0
+    comparisons_last_30_days: int = 0
+    comparisons_per_day: float = 0.0
+    mean_abs_elo_change: Optional[float] = None
+    convergence: Optional[float] = None
+    last_comparison_at: Optional[datetime] = None
+    by_year: list[FacetStat] = []
+    by_artist: list[FacetStat] = []
+    by_source: list[FacetStat] = []
 
 
 class UserOut(BaseModel):
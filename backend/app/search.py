@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import math
+import re
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .catalog import AlbumCatalog, AlbumRecord, album_catalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Share of the query's trigrams an album must contain to be scored at all; one typo in a short
+# word costs up to three trigrams, so half still lets it through.
+MIN_OVERLAP = 0.5
+# Albums re-scored exactly (prefix bonus, stale postings) after the vectorized first pass.
+MAX_CANDIDATES = 200
+PREFIX_BONUS = 0.5
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def _numpy():
+    try:
+        import numpy  # type: ignore
+    except ImportError as exc:  # pragma: no cover - numpy is a declared dependency
+        raise RuntimeError("Album search needs numpy installed on the server.") from exc
+    return numpy
+
+
+def normalize(text: str) -> List[str]:
+    """Lower-case words in any script: combining marks stripped, punctuation as separators."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    # Recompose what the marks did not cover, e.g. Hangul syllables split into jamo.
+    folded = unicodedata.normalize("NFC", stripped).lower()
+    return [word for word in _NON_WORD.split(folded) if word]
+
+
+def word_trigrams(word: str, complete: bool = True) -> List[str]:
+    """Trigrams of one word padded like pg_trgm ("  ab", "ab "); a word still being typed has no end."""
+    padded = "  " + word + (" " if complete else "")
+    return [padded[i : i + 3] for i in range(len(padded) - 2)]
+
+
+def trigrams(words: List[str], last_complete: bool = True) -> Set[str]:
+    grams: Set[str] = set()
+    for i, word in enumerate(words):
+        grams.update(word_trigrams(word, last_complete or i < len(words) - 1))
+    return grams
+
+
+def _album_words(record: AlbumRecord) -> List[str]:
+    return normalize(record.title) + normalize(record.artist)
+
+
+def _index_records(records: List[Tuple[int, AlbumRecord]]) -> Tuple[Dict[str, array], array]:
+    """Posting lists and trigram counts for a snapshot of the catalog; touches no shared state."""
+    postings: Dict[str, array] = {}
+    sizes = array("q", [0]) * (records[-1][0] + 1 if records else 0)
+    for position, record in records:
+        grams = trigrams(_album_words(record))
+        sizes[position] = len(grams)
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("q")
+            posting.append(position)
+    return postings, sizes
+
+
+class SearchIndex:
+    """Trigram inverted index over album title and artist, keyed by catalog position.
+
+    Posting lists only grow: an edited album gets postings for its new trigrams, and stale ones
+    are weeded out when candidates are scored against the album's current text. A first pass
+    ranks every album from its posting hits with numpy; only the best ``MAX_CANDIDATES`` are
+    re-scored in Python.
+    """
+
+    def __init__(self, catalog: AlbumCatalog) -> None:
+        self.catalog = catalog
+        self._postings: Dict[str, array] = {}
+        # Trigram count of each position's current text, for the first-pass score.
+        self._sizes = array("q")
+        self.built = False
+        # Catalog changes seen while a background build runs, replayed once it is installed.
+        self._pending: Optional[List[Tuple[int, Optional[AlbumRecord], Optional[AlbumRecord]]]] = None
+        self._build_lock = asyncio.Lock()
+        catalog.add_listener(self._on_change)
+
+    def _add(self, position: int, grams: Set[str], size: int) -> None:
+        if position >= len(self._sizes):
+            self._sizes.extend([0] * (position + 1 - len(self._sizes)))
+        self._sizes[position] = size
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array("q")
+            postings.append(position)
+
+    def _on_change(self, position: int, old: Optional[AlbumRecord], new: Optional[AlbumRecord]) -> None:
+        if self._pending is not None:
+            self._pending.append((position, old, new))
+        if not self.built or new is None:
+            return
+        grams = trigrams(_album_words(new))
+        size = len(grams)
+        if old is not None:
+            grams -= trigrams(_album_words(old))
+        self._add(position, grams, size)
+
+    def build(self) -> None:
+        self._postings, self._sizes = _index_records(list(self.catalog.records()))
+        self.built = True
+
+    async def build_async(self) -> None:
+        """Build off the event loop from a snapshot, then replay changes made in the meantime."""
+        async with self._build_lock:
+            if self.built:
+                return
+            records = list(self.catalog.records())
+            self._pending = pending = []
+            try:
+                self._postings, self._sizes = await asyncio.to_thread(_index_records, records)
+            finally:
+                self._pending = None
+            self.built = True
+            for position, old, new in pending:
+                self._on_change(position, old, new)
+
+    def search(
+        self, query: str, limit: int = DEFAULT_LIMIT, allowed: Optional[Set[int]] = None
+    ) -> List[Tuple[float, AlbumRecord]]:
+        """Best ``limit`` (score, album) matches, restricted to album ids in ``allowed`` if given.
+
+        The last query word counts as a prefix, since it may still be being typed. The score is the
+        share of query trigrams the album contains, plus a bonus when every query word starts a word
+        of the album, plus a small term favouring albums whose text is mostly the query.
+        """
+        words = normalize(query)
+        if not words:
+            return []
+        np = _numpy()
+        grams = trigrams(words, last_complete=query[-1:].isspace())
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return []
+        # The arrays are viewed, not copied, and nothing appends to them before this returns.
+        hits = np.bincount(np.concatenate([np.frombuffer(postings, dtype=np.int64) for postings in lists]))
+        if allowed is not None:
+            mask = np.zeros(len(hits), dtype=bool)
+            positions = [self.catalog.position(album_id) for album_id in allowed]
+            positions = [p for p in positions if p is not None and p < len(hits)]
+            mask[positions] = True
+            hits = np.where(mask, hits, 0)
+        need = max(1, math.ceil(len(grams) * MIN_OVERLAP))
+        candidates = np.flatnonzero(hits >= need)
+        if len(candidates) > MAX_CANDIDATES:
+            # First pass on counts alone; hits only overstate the shared trigrams for edited albums.
+            shared = hits[candidates]
+            sizes = np.frombuffer(self._sizes, dtype=np.int64)[candidates]
+            rough = shared / len(grams) + 0.1 * shared / np.maximum(sizes, 1)
+            candidates = candidates[np.argpartition(rough, -MAX_CANDIDATES)[-MAX_CANDIDATES:]]
+
+        scored: List[Tuple[float, int, AlbumRecord]] = []
+        for position in candidates.tolist():
+            record = self.catalog.at(position)
+            if record is None:
+                continue
+            album_words = _album_words(record)
+            album_grams = trigrams(album_words)
+            shared = len(grams & album_grams)
+            if shared < need:
+                continue
+            score = shared / len(grams) + 0.1 * shared / len(album_grams)
+            if all(any(word.startswith(q) for word in album_words) for q in words):
+                score += PREFIX_BONUS
+            scored.append((score, -record.id, record))
+        best = heapq.nlargest(limit, scored, key=lambda item: (item[0], item[1]))
+        return [(round(score, 4), record) for score, _, record in best]
+
+
+search_index = SearchIndex(album_catalog)
+
+
+async def ensure_search_index(db: AsyncSession) -> SearchIndex:
+    await album_catalog.ensure(db)
+    if not search_index.built:
+        await search_index.build_async()
+    return search_index
+
+
+async def warm_search_index() -> None:
+    """Load the catalog and build the index at startup, so the first keystroke does not pay for it."""
+    from .db import SessionLocal
+
+    try:
+        async with SessionLocal() as db:
+            await ensure_search_index(db)
+    except Exception:  # pragma: no cover - the first search builds it instead
+        logger.exception("album search index warm-up failed")
+
+
+__all__ = [
+    "DEFAULT_LIMIT",
+    "MAX_LIMIT",
+    "normalize",
+    "trigrams",
+    "SearchIndex",
+    "search_index",
+    "ensure_search_index",
+    "warm_search_index",
+]
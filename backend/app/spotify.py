@@ -1,19 +1,23 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import time
 from typing import Any, Dict, List
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import RedirectResponse
-from sqlalchemy import select
+from sqlalchemy import func, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .core.config import settings
 from .db import get_db
+from .http_client import outbound_client
 from .models import User, Album, UserAlbum, SpotifyToken
-from .aoty import import_aoty_user_albums
+from .stats import record_library_albums
+from .sync import get_sync_state, save_sync_state
+from .versioning import bump_data_version
 import jwt
 
 router = APIRouter(prefix="/auth/spotify", tags=["spotify"])
@@ -56,7 +60,7 @@ async def spotify_callback(code: str, db: AsyncSession = Depends(get_db)):
         "redirect_uri": redirect_uri,
     }
 
-    async with httpx.AsyncClient() as client:
+    async with outbound_client("spotify") as client:
         resp = await client.post(SPOTIFY_TOKEN_URL, data=data, auth=auth)
     if resp.status_code != 200:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Spotify auth failed")
@@ -66,7 +70,7 @@ async def spotify_callback(code: str, db: AsyncSession = Depends(get_db)):
     refresh_token = token_data.get("refresh_token")
     expires_in = token_data.get("expires_in", 3600)
 
-    async with httpx.AsyncClient() as client:
+    async with outbound_client("spotify") as client:
         me_resp = await client.get(
             f"{SPOTIFY_API_BASE}/me",
             headers={"Authorization": f"Bearer {access_token}"},
@@ -140,7 +144,7 @@ import_router = APIRouter(prefix="/import/spotify", tags=["spotify-import"])
 
 
 async def _spotify_get(access_token: str, path: str, params: Dict[str, Any] | None = None) -> Dict[str, Any]:
-    async with httpx.AsyncClient() as client:
+    async with outbound_client("spotify") as client:
         r = await client.get(
             f"{SPOTIFY_API_BASE}{path}",
             headers={"Authorization": f"Bearer {access_token}"},
@@ -152,125 +156,320 @@ async def _spotify_get(access_token: str, path: str, params: Dict[str, Any] | No
 
 
 MIN_TRACKS_FOR_ALBUM = 6
+# Spotify's largest page for library and top-item endpoints.
+PAGE_LIMIT = 50
+# /me/top/tracks ranks roughly a hundred tracks per time range, so two pages cover it.
+TOP_TRACK_PAGES = 2
+TOP_TRACK_RANGE = "medium_term"
+# Rows per IN (...) lookup while linking a batch of albums.
+LINK_BATCH = 500
 
 
-async def _upsert_album_from_spotify(db: AsyncSession, user: User, item: Dict[str, Any]) -> None:
+def _album_fields(item: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Album columns from a Spotify album, or an object carrying one; None for singles, EPs and short releases."""
     album = item["album"] if "album" in item else item
 
     album_type = (album.get("album_type") or "").lower()
     if album_type != "album":
-        return
+        return None
 
     total_tracks = album.get("total_tracks") or 0
     if total_tracks and total_tracks < MIN_TRACKS_FOR_ALBUM:
-        return
+        return None
 
-    spotify_id = album["id"]
-    title = album["name"]
-    artist = ", ".join(a["name"] for a in album.get("artists", []))
-    year = int(album["release_date"][:4]) if album.get("release_date") else None
-    cover_url = None
     images = album.get("images") or []
-    if images:
-        cover_url = images[0]["url"]
-
-    # Prefer existing album with this spotify_id, otherwise match by title/artist/year, otherwise create.
-    res = await db.execute(select(Album).where(Album.spotify_id == spotify_id))
-    existing = res.scalar_one_or_none()
-    if not existing:
-        q = select(Album).where(
-            Album.title.ilike(title),
-            Album.artist.ilike(artist),
+    return {
+        "spotify_id": album["id"],
+        "title": album["name"],
+        "artist": ", ".join(a["name"] for a in album.get("artists", [])),
+        "year": int(album["release_date"][:4]) if album.get("release_date") else None,
+        "cover_url": images[0]["url"] if images else None,
+    }
+
+
+def _name_key(title: str, artist: str) -> tuple[str, str]:
+    return (title.casefold(), artist.casefold())
+
+
+async def _library_spotify_ids(db: AsyncSession, user_id: int) -> set[str]:
+    """Spotify ids of albums the user already has, so imports skip them without lookups."""
+    res = await db.execute(
+        select(Album.spotify_id)
+        .join(UserAlbum, UserAlbum.album_id == Album.id)
+        .where(UserAlbum.user_id == user_id, Album.spotify_id.is_not(None))
+    )
+    return set(res.scalars().all())
+
+
+async def _link_spotify_albums(db: AsyncSession, user: User, albums: List[Dict[str, Any]]) -> List[Album]:
+    """Upsert albums parsed by ``_album_fields`` and link them to the user; returns the newly linked ones.
+
+    Matches an existing row by ``spotify_id``, then by title, artist and year ignoring case, else
+    creates one. Each step is one query for the whole batch rather than one per album.
+    """
+    if not albums:
+        return []
+    by_spotify_id: Dict[str, Album] = {}
+    ids = [a["spotify_id"] for a in albums]
+    for start in range(0, len(ids), LINK_BATCH):
+        res = await db.execute(select(Album).where(Album.spotify_id.in_(ids[start : start + LINK_BATCH])))
+        by_spotify_id.update((album.spotify_id, album) for album in res.scalars().all())
+
+    misses = [a for a in albums if a["spotify_id"] not in by_spotify_id]
+    by_name: Dict[tuple[str, str], List[Album]] = {}
+    titles = sorted({a["title"] for a in misses})
+    for start in range(0, len(titles), LINK_BATCH):
+        # Lowered by the database on both sides, as ilike does: SQLite's lower() only folds ASCII,
+        # so lowering the titles in Python would miss stored ones like "Ágætis Byrjun".
+        chunk = [func.lower(title) for title in titles[start : start + LINK_BATCH]]
+        res = await db.execute(select(Album).where(func.lower(Album.title).in_(chunk)))
+        for album in res.scalars().all():
+            by_name.setdefault(_name_key(album.title, album.artist), []).append(album)
+
+    resolved: List[Album] = []
+    created: List[Album] = []
+    for fields in albums:
+        album = by_spotify_id.get(fields["spotify_id"])
+        if album is None:
+            candidates = by_name.get(_name_key(fields["title"], fields["artist"]), [])
+            album = next((a for a in candidates if fields["year"] is None or a.year == fields["year"]), None)
+        if album is None:
+            album = Album(
+                spotify_id=fields["spotify_id"],
+                title=fields["title"],
+                artist=fields["artist"],
+                year=fields["year"],
+                cover_url=fields["cover_url"],
+                source="spotify",
+                cover_provider="spotify",
+            )
+            created.append(album)
+            # A second release of the same album later in the batch resolves to this row.
+            by_name.setdefault(_name_key(fields["title"], fields["artist"]), []).append(album)
+        else:
+            if not album.spotify_id:
+                album.spotify_id = fields["spotify_id"]
+            if fields["cover_url"] and not album.cover_url:
+                album.cover_url = fields["cover_url"]
+                album.cover_provider = "spotify"
+        resolved.append(album)
+    if created:
+        # Through the session rather than a bulk insert, so the album catalog sees them.
+        db.add_all(created)
+        await db.flush()
+
+    album_ids = list({album.id for album in resolved})
+    linked_ids: set[int] = set()
+    for start in range(0, len(album_ids), LINK_BATCH):
+        res = await db.execute(
+            select(UserAlbum.album_id).where(
+                UserAlbum.user_id == user.id, UserAlbum.album_id.in_(album_ids[start : start + LINK_BATCH])
+            )
         )
-        if year is not None:
-            q = q.where(Album.year == year)
-        res = await db.execute(q)
-        existing = res.scalars().first()
-
-    if not existing:
-        existing = Album(
-            spotify_id=spotify_id,
-            title=title,
-            artist=artist,
-            year=year,
-            cover_url=cover_url,
-            source="spotify",
-            cover_provider="spotify",
+        linked_ids.update(res.scalars().all())
+
+    linked: List[Album] = []
+    for album in resolved:
+        if album.id in linked_ids:
+            continue
+        linked_ids.add(album.id)
+        linked.append(album)
+    if linked:
+        await db.execute(
+            insert(UserAlbum),
+            [{"user_id": user.id, "album_id": album.id, "added_from": "spotify"} for album in linked],
         )
-        db.add(existing)
-        await db.flush()
-    else:
-        if not existing.spotify_id:
-            existing.spotify_id = spotify_id
-        if cover_url and not existing.cover_url:
-            existing.cover_url = cover_url
-            existing.cover_provider = "spotify"
-
-    link_res = await db.execute(
-        select(UserAlbum).where(UserAlbum.user_id == user.id, UserAlbum.album_id == existing.id)
-    )
-    link = link_res.scalar_one_or_none()
-    if not link:
-        db.add(UserAlbum(user_id=user.id, album_id=existing.id, added_from="spotify"))
+    return linked
 
 
-@import_router.post("/top-albums")
-async def import_top_albums(
-    db: AsyncSession = Depends(get_db),
-    user: User = Depends(require_spotify_user),
-    max_albums: int | None = None,
-):
+async def _fresh_access_token(db: AsyncSession, st: SpotifyToken) -> str:
+    """The user's access token, refreshed first when it is about to expire."""
+    if st.expires_at > int(time.time()) + 60:
+        return st.access_token
+    if not st.refresh_token:
+        raise HTTPException(status_code=400, detail="Spotify token expired and no refresh token available.")
+    await get_spotify_client()
+    async with outbound_client("spotify") as client:
+        r = await client.post(
+            SPOTIFY_TOKEN_URL,
+            data={"grant_type": "refresh_token", "refresh_token": st.refresh_token},
+            auth=(settings.spotify_client_id, settings.spotify_client_secret),  # type: ignore[arg-type]
+        )
+    if r.status_code != 200:
+        raise HTTPException(status_code=400, detail="Spotify token refresh failed; reconnect.")
+    data = r.json()
+    st.access_token = data["access_token"]
+    if data.get("refresh_token"):
+        st.refresh_token = data["refresh_token"]
+    st.expires_at = int(time.time()) + int(data.get("expires_in", 3600))
+    # Saved right away: Spotify may have rotated the refresh token, and the import could still fail.
+    await db.commit()
+    return st.access_token
+
+
+async def _get_page(
+    client: httpx.AsyncClient, access_token: str, path: str, params: Dict[str, Any]
+) -> Dict[str, Any] | None:
+    """One page of a Web API listing, waiting out rate limits; None when Spotify refuses it."""
+    while True:
+        r = await client.get(
+            f"{SPOTIFY_API_BASE}{path}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params=params,
+        )
+        if r.status_code == 429:
+            retry_after = int(r.headers.get("Retry-After", "1"))
+            await asyncio.sleep(min(retry_after, 5))
+            continue
+        if r.status_code != 200:
+            return None
+        return r.json()
+
+
+def _take_album(
+    found: Dict[str, Dict[str, Any]], library: set[str], item: Dict[str, Any], cap: int | None
+) -> bool:
+    """Queue the item's album unless it is filtered out, already owned or already queued; False once at the cap."""
+    if cap is not None and len(found) >= cap:
+        return False
+    fields = _album_fields(item)
+    if fields is not None and fields["spotify_id"] not in library:
+        found.setdefault(fields["spotify_id"], fields)
+    return True
+
+
+async def _sync_library(
+    db: AsyncSession,
+    user: User,
+    source: str,
+    path: str,
+    max_albums: int | None,
+    full: bool,
+    top_tracks: bool,
+) -> Dict[str, Any]:
+    """Collect new albums from a saved-items listing (and optionally top tracks), then link them in one batch.
+
+    Saved items are listed by ``added_at``, newest first, so everything past the newest
+    ``added_at`` seen by the previous complete sync was handled then; ``full`` ignores it.
+    Albums are de-duplicated by Spotify id and checked against the library in memory, so
+    ``max_albums`` caps distinct new albums and nothing touches the database until the walk ends.
+    """
     token_res = await db.execute(select(SpotifyToken).where(SpotifyToken.user_id == user.id))
     st = token_res.scalar_one_or_none()
     if not st:
         raise HTTPException(status_code=400, detail="No Spotify token; reconnect.")
-
-    if st.expires_at <= int(time.time()) and not st.refresh_token:
-        raise HTTPException(status_code=400, detail="Spotify token expired and no refresh token available.")
+    access_token = await _fresh_access_token(db, st)
 
     cap = None
     if max_albums is not None:
         cap = max(10, min(max_albums, 2000))
 
-    imported = 0
-    limit = 50
+    state = await get_sync_state(db, user.id, source)
+    watermark = state.watermark if state is not None and not full else None
+    newest = watermark
+    library = await _library_spotify_ids(db, user.id)
+    found: Dict[str, Dict[str, Any]] = {}
     offset = 0
+    # The walk is complete when it reaches the watermark or the end of the library.
+    complete = False
+    room = True
+
+    async with outbound_client("spotify") as client:
+        while room:
+            data = await _get_page(client, access_token, path, {"limit": PAGE_LIMIT, "offset": offset})
+            if data is None:
+                break
+            items = data.get("items", [])
+            if not items:
+                complete = True
+                break
 
-    while True:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(
-                f"{SPOTIFY_API_BASE}/me/tracks",
-                headers={"Authorization": f"Bearer {st.access_token}"},
-                params={"limit": limit, "offset": offset},
+            for wrapper in items:
+                added_at = wrapper.get("added_at") or ""
+                # ISO-8601 UTC timestamps compare correctly as strings.
+                if watermark and added_at and added_at < watermark:
+                    complete = True
+                    break
+                # Saved tracks wrap the album in the track; saved albums carry it directly.
+                item = wrapper.get("track") or wrapper
+                if "album" not in item:
+                    continue
+                room = _take_album(found, library, item, cap)
+                if not room:
+                    break
+                if added_at and (newest is None or added_at > newest):
+                    newest = added_at
+
+            if not room:
+                break
+            if complete or len(items) < PAGE_LIMIT:
+                complete = True
+                break
+            offset += PAGE_LIMIT
+
+        # Top tracks carry no added_at and never move the watermark; they fill in albums
+        # the user plays without having saved them.
+        for page in range(TOP_TRACK_PAGES if top_tracks else 0):
+            if cap is not None and len(found) >= cap:
+                break
+            data = await _get_page(
+                client,
+                access_token,
+                "/me/top/tracks",
+                {"limit": PAGE_LIMIT, "offset": page * PAGE_LIMIT, "time_range": TOP_TRACK_RANGE},
             )
+            items = (data or {}).get("items", [])
+            for track in items:
+                if not _take_album(found, library, track, cap):
+                    break
+            if len(items) < PAGE_LIMIT:
+                break
 
-        if r.status_code == 429:
-            retry_after = int(r.headers.get("Retry-After", "1"))
-            await httpx.AsyncClient().aclose()
-            time.sleep(min(retry_after, 5))
-            continue
+    linked = await _link_spotify_albums(db, user, list(found.values()))
+    await record_library_albums(db, user.id, linked)
+    await save_sync_state(db, user.id, source, imported=len(linked), watermark=newest, advance=complete)
+    await bump_data_version(db, user.id)
+    await db.commit()
+    return {
+        "status": "ok",
+        "imported": len(linked),
+        "source": "saved_albums" if top_tracks else "saved_tracks",
+        "max_albums": cap,
+        "incremental": watermark is not None,
+    }
 
-        if r.status_code != 200:
-            break
 
-        data = r.json()
-        items = data.get("items", [])
-        if not items:
-            break
+async def sync_saved_tracks(
+    db: AsyncSession, user: User, max_albums: int | None = None, full: bool = False
+) -> Dict[str, Any]:
+    """Import albums of the user's saved tracks, stopping at the last sync's watermark."""
+    return await _sync_library(db, user, "spotify", "/me/tracks", max_albums, full, top_tracks=False)
 
-        for wrapper in items:
-            if cap is not None and imported >= cap:
-                break
-            track = wrapper.get("track") or {}
-            if not track:
-                continue
-            await _upsert_album_from_spotify(db, user, track)
-            imported += 1
 
-        if len(items) < limit or (cap is not None and imported >= cap):
-            break
+async def sync_saved_albums(
+    db: AsyncSession, user: User, max_albums: int | None = None, full: bool = False
+) -> Dict[str, Any]:
+    """Import the user's saved albums, stopping at the last sync's watermark, plus albums of their top tracks.
 
-        offset += limit
+    A page of saved albums is fifty albums where a page of saved tracks is often a handful,
+    so this reaches the same library in far fewer calls.
+    """
+    return await _sync_library(db, user, "spotify_albums", "/me/albums", max_albums, full, top_tracks=True)
 
-    await db.commit()
-    return {"status": "ok", "imported": imported, "source": "saved_tracks", "max_albums": cap}
+
+@import_router.post("/top-albums")
+async def import_top_albums(
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_spotify_user),
+    max_albums: int | None = None,
+    full: bool = False,
+    mode: str = Query("tracks", pattern="^(tracks|albums)$"),
+):
+    """Import albums from saved tracks, or with ``mode=albums`` from saved albums and top tracks.
+
+    Later calls only fetch items saved since the previous one unless ``full``; ``max_albums``
+    caps the distinct albums added.
+    """
+    if mode == "albums":
+        return await sync_saved_albums(db, user, max_albums, full)
+    return await sync_saved_tracks(db, user, max_albums, full)
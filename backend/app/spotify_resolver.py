@@ -1,44 +1,159 @@
 from __future__ import annotations
 
-import os
-from typing import Optional
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
 
 import httpx
 
 from .core.config import settings
+from .http_client import outbound_client
+
+logger = logging.getLogger(__name__)
 
 SPOTIFY_API_BASE = "https://api.spotify.com/v1"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+# Spotify's limits for the multi-id endpoints.
+ALBUMS_PER_CALL = 20
+ARTISTS_PER_CALL = 50
+# Artist genres kept in memory; enough for a large catalog's distinct artists.
+ARTIST_CACHE_SIZE = 50_000
+# Longest Retry-After honoured on a 429 before giving up on the call.
+MAX_RETRY_WAIT = 30.0
+MAX_ATTEMPTS = 3
+
+
+class SpotifyAppClient:
+    """App-level (client credentials) Spotify access shared by cover lookups and genre enrichment.
+
+    One connection pool and one token serve every call instead of a token request per lookup.
+    Artist genres are cached by artist id and by searched name, so albums by the same artist
+    cost one request between them.
+    """
+
+    def __init__(self) -> None:
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+        self._artist_genres: Dict[str, List[str]] = {}
+        self._name_genres: Dict[str, Optional[List[str]]] = {}
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.spotify_client_id and settings.spotify_client_secret)
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = outbound_client("spotify", timeout=10.0)
+        return self._client
+
+    async def _access_token(self) -> Optional[str]:
+        async with self._token_lock:
+            if self._token is None or time.time() > self._token_expires - 60:
+                resp = await self._http().post(
+                    SPOTIFY_TOKEN_URL,
+                    data={"grant_type": "client_credentials"},
+                    auth=(settings.spotify_client_id, settings.spotify_client_secret),  # type: ignore[arg-type]
+                )
+                if resp.status_code != 200:
+                    return None
+                data = resp.json()
+                self._token = data.get("access_token")
+                self._token_expires = time.time() + float(data.get("expires_in", 3600))
+            return self._token
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """GET an API path; None when Spotify is not configured or answers with an error."""
+        if not self.configured:
+            return None
+        for _ in range(MAX_ATTEMPTS):
+            token = await self._access_token()
+            if token is None:
+                return None
+            resp = await self._http().get(
+                f"{SPOTIFY_API_BASE}{path}", params=params, headers={"Authorization": f"Bearer {token}"}
+            )
+            if resp.status_code == 200:
+                return resp.json()
+            if resp.status_code == 401:
+                self._token = None
+                continue
+            if resp.status_code == 429:
+                wait = float(resp.headers.get("Retry-After", "1"))
+                if wait > MAX_RETRY_WAIT:
+                    break
+                await asyncio.sleep(wait)
+                continue
+            break
+        logger.warning("Spotify %s failed with %s", path, resp.status_code)
+        return None
 
+    async def album_artist_ids(self, spotify_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Artist ids of each album, through the multi-album endpoint."""
+        ids = list(dict.fromkeys(spotify_ids))
+        found: Dict[str, List[str]] = {}
+        for start in range(0, len(ids), ALBUMS_PER_CALL):
+            data = await self.get("/albums", {"ids": ",".join(ids[start : start + ALBUMS_PER_CALL])})
+            for album in (data or {}).get("albums") or []:
+                if album:
+                    found[album["id"]] = [a["id"] for a in album.get("artists") or [] if a.get("id")]
+        return found
+
+    def _cache_artist(self, artist_id: str, genres: List[str]) -> None:
+        if len(self._artist_genres) >= ARTIST_CACHE_SIZE:
+            # Dicts keep insertion order, so this drops the oldest entry.
+            del self._artist_genres[next(iter(self._artist_genres))]
+        self._artist_genres[artist_id] = genres
+
+    async def artist_genres(self, artist_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Genres of each artist, fetching only the ones not cached through the multi-artist endpoint."""
+        ids = list(dict.fromkeys(artist_ids))
+        missing = [artist_id for artist_id in ids if artist_id not in self._artist_genres]
+        for start in range(0, len(missing), ARTISTS_PER_CALL):
+            data = await self.get("/artists", {"ids": ",".join(missing[start : start + ARTISTS_PER_CALL])})
+            for artist in (data or {}).get("artists") or []:
+                if artist:
+                    self._cache_artist(artist["id"], list(artist.get("genres") or []))
+        return {artist_id: self._artist_genres[artist_id] for artist_id in ids if artist_id in self._artist_genres}
+
+    async def search_artist_genres(self, name: str) -> Optional[List[str]]:
+        """Genres of the artist called ``name``, for albums imported without a Spotify id.
+
+        None when the search failed; an empty list when no artist has exactly that name.
+        """
+        key = name.strip().lower()
+        if key in self._name_genres:
+            return self._name_genres[key]
+        data = await self.get("/search", {"q": f'artist:"{name}"', "type": "artist", "limit": 5})
+        if data is None:
+            return None
+        genres: List[str] = []
+        for artist in (data.get("artists") or {}).get("items") or []:
+            if (artist.get("name") or "").strip().lower() == key:
+                genres = list(artist.get("genres") or [])
+                self._cache_artist(artist["id"], genres)
+                break
+        if len(self._name_genres) >= ARTIST_CACHE_SIZE:
+            del self._name_genres[next(iter(self._name_genres))]
+        self._name_genres[key] = genres
+        return genres
 
-async def fetch_spotify_album_cover(spotify_id: str) -> Optional[str]:
-    if not settings.spotify_client_id or not settings.spotify_client_secret:
-        return None
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-    client_id = settings.spotify_client_id
-    client_secret = settings.spotify_client_secret
 
-    try:
-        async with httpx.AsyncClient() as client:
-            auth_resp = await client.post(
-                "https://accounts.spotify.com/api/token",
-                data={"grant_type": "client_credentials"},
-                auth=(client_id, client_secret),
-            )
-        if auth_resp.status_code != 200:
-            return None
-        access_token = auth_resp.json().get("access_token")
-        if not access_token:
-            return None
+spotify_app = SpotifyAppClient()
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{SPOTIFY_API_BASE}/albums/{spotify_id}",
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
-        if resp.status_code != 200:
-            return None
 
-        data = resp.json()
+async def fetch_spotify_album_cover(spotify_id: str) -> Optional[str]:
+    try:
+        data = await spotify_app.get(f"/albums/{spotify_id}")
+        if not data:
+            return None
         images = data.get("images") or []
         if images:
             return images[0].get("url")
@@ -49,36 +164,11 @@ async def fetch_spotify_album_cover(spotify_id: str) -> Optional[str]:
 
 
 async def search_spotify_album_cover(title: str, artist: str, year: Optional[int]) -> Optional[str]:
-    if not settings.spotify_client_id or not settings.spotify_client_secret:
-        return None
-
-    client_id = settings.spotify_client_id
-    client_secret = settings.spotify_client_secret
-
     try:
-        async with httpx.AsyncClient() as client:
-            auth_resp = await client.post(
-                "https://accounts.spotify.com/api/token",
-                data={"grant_type": "client_credentials"},
-                auth=(client_id, client_secret),
-            )
-        if auth_resp.status_code != 200:
-            return None
-        access_token = auth_resp.json().get("access_token")
-        if not access_token:
-            return None
-
         query = f"album:{title} artist:{artist}"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{SPOTIFY_API_BASE}/search",
-                params={"q": query, "type": "album", "limit": 5},
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
-        if resp.status_code != 200:
+        data = await spotify_app.get("/search", {"q": query, "type": "album", "limit": 5})
+        if not data:
             return None
-
-        data = resp.json()
         items = (data.get("albums") or {}).get("items") or []
         if not items:
             return None
@@ -91,3 +181,6 @@ async def search_spotify_album_cover(title: str, artist: str, year: Optional[int
         return None
 
     return None
+
+
+__all__ = ["SpotifyAppClient", "spotify_app", "fetch_spotify_album_cover", "search_spotify_album_cover"]
@@ -0,0 +1,586 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .archive import from_micros, to_micros, user_archive
+from .exclusions import get_exclusions
+from .models import (
+    Album,
+    Comparison,
+    EloScore,
+    UserAlbum,
+    UserDailyComparisons,
+    UserFacetStats,
+    UserStats,
+)
+from .schemas import FacetStat, StatsResponse
+
+# Smoothing for the moving average of Elo movement per vote, and the largest possible
+# per-vote movement (the top K-factor) used to turn it into a 0-1 convergence score.
+DELTA_EMA_ALPHA = 0.05
+MAX_VOTE_DELTA = 40.0
+TOP_ARTISTS = 20
+VELOCITY_WINDOW_DAYS = 30
+FACET_LOOKUP_BATCH = 500
+
+FacetKey = Tuple[str, str]
+
+
+def album_facets(year: Optional[int], artist: Optional[str], source: Optional[str]) -> List[FacetKey]:
+    return [
+        ("year", str(year) if year else "unknown"),
+        ("artist", (artist or "").strip() or "unknown"),
+        ("source", source or "unknown"),
+    ]
+
+
+def _day(ts: datetime) -> str:
+    return ts.date().isoformat()
+
+
+FACET_FIELDS = ("library_albums", "rated_albums", "wins", "losses", "draws")
+
+
+async def _apply_facet_deltas(
+    db: AsyncSession, user_id: int, deltas: Dict[FacetKey, Dict[str, int]], fresh: bool = False
+) -> None:
+    """Add ``deltas`` to the user's facet rows, creating the missing ones.
+
+    Each facet is one ``UPDATE ... SET col = col + CASE value ...`` over its values, so a vote
+    costs three statements whether or not the rows were loaded. ``fresh`` skips the update when
+    the caller has just deleted every row.
+    """
+    by_facet: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(dict)
+    for (facet, value), fields in deltas.items():
+        by_facet[facet][value] = fields
+
+    for facet, values in by_facet.items():
+        names = list(values)
+        for start in range(0, len(names), FACET_LOOKUP_BATCH):
+            chunk = names[start : start + FACET_LOOKUP_BATCH]
+            missing = set(chunk)
+            if not fresh:
+                assignments = {}
+                for field in FACET_FIELDS:
+                    whens = [(v, values[v][field]) for v in chunk if values[v].get(field)]
+                    if whens:
+                        column = getattr(UserFacetStats, field)
+                        assignments[field] = column + case(
+                            dict(whens), value=UserFacetStats.value, else_=0
+                        )
+                if not assignments:
+                    continue
+                where = (
+                    UserFacetStats.user_id == user_id,
+                    UserFacetStats.facet == facet,
+                    UserFacetStats.value.in_(chunk),
+                )
+                res = await db.execute(
+                    update(UserFacetStats)
+                    .where(*where)
+                    .values(**assignments)
+                    .execution_options(synchronize_session=False)
+                )
+                if res.rowcount == len(chunk):
+                    continue
+                found = await db.execute(select(UserFacetStats.value).where(*where))
+                missing.difference_update(found.scalars().all())
+            db.add_all(
+                UserFacetStats(
+                    user_id=user_id,
+                    facet=facet,
+                    value=value,
+                    **{field: values[value].get(field, 0) for field in FACET_FIELDS},
+                )
+                for value in chunk
+                if value in missing
+            )
+
+
+async def _count(db: AsyncSession, stmt) -> int:
+    res = await db.execute(stmt)
+    return res.scalar_one() or 0
+
+
+async def _shift_stats(db: AsyncSession, user_id: int, **values) -> bool:
+    """Apply ``values``, usually ``column + delta`` expressions, to the user's stats row in one UPDATE.
+
+    Increments from concurrent votes cannot conflict the way flushed copies of the row do; the
+    version still moves, so a rebuild holding an older copy fails rather than overwriting them.
+    Copies loaded in this session are expired. False when the user has no stats row yet.
+    """
+    res = await db.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values(version=UserStats.version + 1, updated_at=datetime.utcnow(), **values)
+        .execution_options(synchronize_session="fetch")
+    )
+    return res.rowcount > 0
+
+
+async def _excluded_counts(db: AsyncSession, user_id: int) -> tuple[int, int]:
+    excluded = list(await get_exclusions(db, user_id))
+    if not excluded:
+        return 0, 0
+    rated = await _count(
+        db,
+        select(func.count()).select_from(EloScore).where(
+            EloScore.user_id == user_id, EloScore.album_id.in_(excluded)
+        ),
+    )
+    archive = user_archive(user_id)
+    comparisons = await _count(
+        db,
+        select(func.count()).select_from(Comparison).where(
+            Comparison.user_id == user_id,
+            Comparison.id > archive.last_id,
+            or_(Comparison.album_a_id.in_(excluded), Comparison.album_b_id.in_(excluded)),
+        ),
+    )
+    return rated, comparisons + archive.touching(excluded)
+
+
+async def rebuild_user_stats(db: AsyncSession, user_id: int) -> UserStats:
+    """Recompute a user's aggregates from history. Used to backfill and reconcile only.
+
+    Archived comparisons are folded in from their segments; the queries cover the hot rows.
+    """
+    await db.flush()
+    await db.execute(delete(UserFacetStats).where(UserFacetStats.user_id == user_id))
+    await db.execute(delete(UserDailyComparisons).where(UserDailyComparisons.user_id == user_id))
+
+    stats = await db.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(user_id=user_id)
+        db.add(stats)
+
+    stats.library_albums = await _count(
+        db, select(func.count()).select_from(UserAlbum).where(UserAlbum.user_id == user_id)
+    )
+    stats.rated_albums = await _count(
+        db, select(func.count()).select_from(EloScore).where(EloScore.user_id == user_id)
+    )
+    archive = user_archive(user_id)
+    hot = (Comparison.user_id == user_id) & (Comparison.id > archive.last_id)
+    archived_winners = archive.column("winner")
+    archived_times = archive.column("created_at")
+    stats.total_comparisons = len(archived_winners) + await _count(
+        db, select(func.count()).select_from(Comparison).where(hot)
+    )
+    stats.draws = int((archived_winners == 0).sum()) + await _count(
+        db,
+        select(func.count()).select_from(Comparison).where(hot, Comparison.winner_album_id.is_(None)),
+    )
+    stats.excluded_rated_albums, stats.excluded_comparisons = await _excluded_counts(db, user_id)
+    last_res = await db.execute(select(func.max(Comparison.created_at)).where(hot))
+    last_at = [at for at in (last_res.scalar_one(),) if at is not None]
+    if len(archived_times):
+        # Imported history can be older than votes already archived, so compare both.
+        last_at.append(from_micros(archived_times.max()))
+    stats.last_comparison_at = max(last_at, default=None)
+    stats.recent_abs_delta = None
+    stats.updated_at = datetime.utcnow()
+
+    since = datetime.utcnow() - timedelta(days=VELOCITY_WINDOW_DAYS)
+    day_res = await db.execute(select(Comparison.created_at).where(hot, Comparison.created_at >= since))
+    daily: Dict[str, int] = defaultdict(int)
+    for (created_at,) in day_res.all():
+        daily[_day(created_at)] += 1
+    for micros in archived_times[archived_times >= to_micros(since)].tolist():
+        daily[_day(from_micros(micros))] += 1
+    for day, count in daily.items():
+        db.add(UserDailyComparisons(user_id=user_id, day=day, comparisons=count))
+
+    facet_cols = (Album.year, Album.artist, Album.source)
+    deltas: Dict[FacetKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def fold(rows: Iterable, field: str) -> None:
+        for year, artist, source, count in rows:
+            for key in album_facets(year, artist, source):
+                deltas[key][field] += count
+
+    res = await db.execute(
+        select(*facet_cols, func.count())
+        .select_from(UserAlbum)
+        .join(Album, Album.id == UserAlbum.album_id)
+        .where(UserAlbum.user_id == user_id)
+        .group_by(*facet_cols)
+    )
+    fold(res.all(), "library_albums")
+
+    res = await db.execute(
+        select(*facet_cols, func.count())
+        .select_from(EloScore)
+        .join(Album, Album.id == EloScore.album_id)
+        .where(EloScore.user_id == user_id)
+        .group_by(*facet_cols)
+    )
+    fold(res.all(), "rated_albums")
+
+    res = await db.execute(
+        select(*facet_cols, func.count())
+        .select_from(Comparison)
+        .join(Album, Album.id == Comparison.winner_album_id)
+        .where(hot)
+        .group_by(*facet_cols)
+    )
+    fold(res.all(), "wins")
+
+    # Every appearance that was neither a win nor a draw is a loss.
+    is_draw = case((Comparison.winner_album_id.is_(None), 1), else_=0)
+    for side in (Comparison.album_a_id, Comparison.album_b_id):
+        res = await db.execute(
+            select(*facet_cols, func.count(), func.sum(is_draw))
+            .select_from(Comparison)
+            .join(Album, Album.id == side)
+            .where(hot)
+            .group_by(*facet_cols)
+        )
+        for year, artist, source, appearances, draws in res.all():
+            for key in album_facets(year, artist, source):
+                deltas[key]["losses"] += appearances - (draws or 0)
+                deltas[key]["draws"] += draws or 0
+
+    outcomes = archive.outcomes()
+    album_ids = sorted(outcomes)
+    for start in range(0, len(album_ids), FACET_LOOKUP_BATCH):
+        res = await db.execute(
+            select(Album.id, *facet_cols).where(Album.id.in_(album_ids[start : start + FACET_LOOKUP_BATCH]))
+        )
+        for album_id, year, artist, source in res.all():
+            appearances, wins, draws = outcomes[album_id]
+            for key in album_facets(year, artist, source):
+                deltas[key]["wins"] += wins
+                deltas[key]["losses"] += appearances - draws
+                deltas[key]["draws"] += draws
+    for fields in deltas.values():
+        fields["losses"] -= fields["wins"]
+
+    await _apply_facet_deltas(db, user_id, deltas, fresh=True)
+    return stats
+
+
+async def record_comparison(
+    db: AsyncSession,
+    user_id: int,
+    album_a: Album,
+    album_b: Album,
+    winner_album_id: Optional[int],
+    new_album_ids: Iterable[int],
+    abs_delta: Optional[float],
+) -> None:
+    """Fold one vote into the user's aggregates. Call after the Comparison row is added.
+
+    ``abs_delta`` is None for votes that moved no Elo (placement probes); they leave the
+    convergence average alone.
+    """
+    now = datetime.utcnow()
+    new_album_ids = set(new_album_ids)
+    excluded = await get_exclusions(db, user_id)
+
+    values = {
+        "total_comparisons": UserStats.total_comparisons + 1,
+        "rated_albums": UserStats.rated_albums + len(new_album_ids),
+        "last_comparison_at": now,
+    }
+    if winner_album_id is None:
+        values["draws"] = UserStats.draws + 1
+    if album_a.id in excluded or album_b.id in excluded:
+        values["excluded_comparisons"] = UserStats.excluded_comparisons + 1
+    excluded_new = sum(1 for album_id in new_album_ids if album_id in excluded)
+    if excluded_new:
+        values["excluded_rated_albums"] = UserStats.excluded_rated_albums + excluded_new
+    if abs_delta is not None:
+        values["recent_abs_delta"] = case(
+            (UserStats.recent_abs_delta.is_(None), abs_delta),
+            else_=UserStats.recent_abs_delta + DELTA_EMA_ALPHA * (abs_delta - UserStats.recent_abs_delta),
+        )
+    if not await _shift_stats(db, user_id, **values):
+        # The rebuild sees the pending vote through autoflush, so there is nothing left to add.
+        await rebuild_user_stats(db, user_id)
+        return
+
+    day_res = await db.execute(
+        update(UserDailyComparisons)
+        .where(UserDailyComparisons.user_id == user_id, UserDailyComparisons.day == _day(now))
+        .values(comparisons=UserDailyComparisons.comparisons + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if day_res.rowcount == 0:
+        db.add(UserDailyComparisons(user_id=user_id, day=_day(now), comparisons=1))
+
+    deltas: Dict[FacetKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for album in (album_a, album_b):
+        if winner_album_id is None:
+            outcome = "draws"
+        elif winner_album_id == album.id:
+            outcome = "wins"
+        else:
+            outcome = "losses"
+        for key in album_facets(album.year, album.artist, album.source):
+            deltas[key][outcome] += 1
+            if album.id in new_album_ids:
+                deltas[key]["rated_albums"] += 1
+    await _apply_facet_deltas(db, user_id, deltas)
+
+
+async def forget_comparisons(
+    db: AsyncSession,
+    user_id: int,
+    votes: Iterable[Comparison],
+    albums: Dict[int, Album],
+    unrated_album_ids: Iterable[int],
+) -> None:
+    """Take undone votes back out of the user's aggregates, the reverse of ``record_comparison``.
+
+    ``unrated_album_ids`` are albums whose EloScore went away with the votes. The vote-movement
+    average cannot be unwound and is left as it was.
+    """
+    votes = list(votes)
+    unrated = set(unrated_album_ids)
+    excluded = await get_exclusions(db, user_id)
+    shifted = await _shift_stats(
+        db,
+        user_id,
+        total_comparisons=UserStats.total_comparisons - len(votes),
+        draws=UserStats.draws - sum(1 for vote in votes if vote.winner_album_id is None),
+        excluded_comparisons=UserStats.excluded_comparisons
+        - sum(1 for vote in votes if vote.album_a_id in excluded or vote.album_b_id in excluded),
+        rated_albums=UserStats.rated_albums - len(unrated),
+        excluded_rated_albums=UserStats.excluded_rated_albums
+        - sum(1 for album_id in unrated if album_id in excluded),
+        last_comparison_at=await _latest_comparison_at(db, user_id, exclude=[vote.id for vote in votes]),
+    )
+    if not shifted:
+        await rebuild_user_stats(db, user_id)
+        return
+
+    days: Dict[str, int] = defaultdict(int)
+    for vote in votes:
+        if vote.created_at is not None:
+            days[_day(vote.created_at)] -= 1
+    for day, delta in days.items():
+        await db.execute(
+            update(UserDailyComparisons)
+            .where(UserDailyComparisons.user_id == user_id, UserDailyComparisons.day == day)
+            .values(comparisons=UserDailyComparisons.comparisons + delta)
+            .execution_options(synchronize_session=False)
+        )
+    if days:
+        await db.execute(
+            delete(UserDailyComparisons).where(
+                UserDailyComparisons.user_id == user_id,
+                UserDailyComparisons.day.in_(list(days)),
+                UserDailyComparisons.comparisons <= 0,
+            )
+        )
+
+    deltas: Dict[FacetKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for vote in votes:
+        for album_id in (vote.album_a_id, vote.album_b_id):
+            album = albums.get(album_id)
+            if album is None:
+                continue
+            if vote.winner_album_id is None:
+                outcome = "draws"
+            elif vote.winner_album_id == album_id:
+                outcome = "wins"
+            else:
+                outcome = "losses"
+            for key in album_facets(album.year, album.artist, album.source):
+                deltas[key][outcome] -= 1
+    for album_id in unrated:
+        album = albums.get(album_id)
+        if album is not None:
+            for key in album_facets(album.year, album.artist, album.source):
+                deltas[key]["rated_albums"] -= 1
+    await _apply_facet_deltas(db, user_id, deltas)
+    # Drop rows left at zero, as a rebuild would not have them.
+    by_facet: Dict[str, List[str]] = defaultdict(list)
+    for facet, value in deltas:
+        by_facet[facet].append(value)
+    for facet, values in by_facet.items():
+        await db.execute(
+            delete(UserFacetStats).where(
+                UserFacetStats.user_id == user_id,
+                UserFacetStats.facet == facet,
+                UserFacetStats.value.in_(values),
+                UserFacetStats.library_albums == 0,
+                UserFacetStats.rated_albums == 0,
+                UserFacetStats.wins == 0,
+                UserFacetStats.losses == 0,
+                UserFacetStats.draws == 0,
+            )
+        )
+
+
+async def _latest_comparison_at(db: AsyncSession, user_id: int, exclude: List[int]) -> Optional[datetime]:
+    # Newest id first: an index walk, not a scan of the user's history.
+    res = await db.execute(
+        select(Comparison.created_at)
+        .where(Comparison.user_id == user_id, Comparison.id.not_in(exclude))
+        .order_by(Comparison.id.desc())
+        .limit(1)
+    )
+    latest = res.scalar_one_or_none()
+    archive = user_archive(user_id)
+    if latest is None and archive.segments:
+        latest = from_micros(archive.segments[-1].column("created_at").max())
+    return latest
+
+
+async def record_library_albums(db: AsyncSession, user_id: int, albums: Iterable[Album]) -> None:
+    """Count albums newly linked to a user's library. Call once per import batch."""
+    albums = list(albums)
+    if not albums:
+        return
+    if not await _shift_stats(db, user_id, library_albums=UserStats.library_albums + len(albums)):
+        await rebuild_user_stats(db, user_id)
+        return
+
+    deltas: Dict[FacetKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for album in albums:
+        for key in album_facets(album.year, album.artist, album.source):
+            deltas[key]["library_albums"] += 1
+    await _apply_facet_deltas(db, user_id, deltas)
+
+
+async def shift_exclusion_counts(
+    db: AsyncSession, user_id: int, album_ids: Iterable[int], excluded: Container[int], excluding: bool
+) -> None:
+    """Move the excluded counts for albums just excluded (or restored, when not ``excluding``).
+
+    Call in the transaction that changes the exclusions. ``excluded`` is the set as it was before
+    the change; a comparison whose other album stays excluded was counted already and is skipped.
+    Only the comparisons of ``album_ids`` are read. A user without a stats row is left alone, as
+    the first rebuild counts exclusions from scratch.
+    """
+    changed = sorted(set(album_ids))
+    if not changed:
+        return
+    changing = set(changed)
+    archive = user_archive(user_id)
+    rated = 0
+    comparisons: Dict[int, Tuple[int, int]] = {}
+    for start in range(0, len(changed), FACET_LOOKUP_BATCH):
+        chunk = changed[start : start + FACET_LOOKUP_BATCH]
+        rated += await _count(
+            db,
+            select(func.count()).select_from(EloScore).where(
+                EloScore.user_id == user_id, EloScore.album_id.in_(chunk)
+            ),
+        )
+        # One indexed lookup per side; a comparison between two changed albums is seen twice.
+        for side in (Comparison.album_a_id, Comparison.album_b_id):
+            res = await db.execute(
+                select(Comparison.id, Comparison.album_a_id, Comparison.album_b_id).where(
+                    Comparison.user_id == user_id, side.in_(chunk), Comparison.id > archive.last_id
+                )
+            )
+            comparisons.update((row.id, (row.album_a_id, row.album_b_id)) for row in res.all())
+
+    def still_excluded(album_id: int) -> bool:
+        return album_id not in changing and album_id in excluded
+
+    touched = sum(
+        1
+        for a, b in [*comparisons.values(), *archive.pairs_touching(changed)]
+        if not still_excluded(a) and not still_excluded(b)
+    )
+    sign = 1 if excluding else -1
+    await _shift_stats(
+        db,
+        user_id,
+        excluded_rated_albums=UserStats.excluded_rated_albums + sign * rated,
+        excluded_comparisons=UserStats.excluded_comparisons + sign * touched,
+    )
+
+
+def _facet_out(row: UserFacetStats) -> FacetStat:
+    decided = row.wins + row.losses + row.draws
+    return FacetStat(
+        value=row.value,
+        library_albums=row.library_albums,
+        rated_albums=row.rated_albums,
+        wins=row.wins,
+        losses=row.losses,
+        draws=row.draws,
+        win_rate=round((row.wins + 0.5 * row.draws) / decided, 4) if decided else None,
+    )
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> UserStats:
+    stats = await db.get(UserStats, user_id)
+    if stats is None:
+        stats = await rebuild_user_stats(db, user_id)
+        await db.commit()
+    return stats
+
+
+async def build_stats_response(db: AsyncSession, user_id: int) -> StatsResponse:
+    stats = await get_user_stats(db, user_id)
+
+    today = datetime.utcnow().date()
+    week_start = (today - timedelta(days=6)).isoformat()
+    month_start = (today - timedelta(days=VELOCITY_WINDOW_DAYS - 1)).isoformat()
+    day_res = await db.execute(
+        select(UserDailyComparisons.day, UserDailyComparisons.comparisons).where(
+            UserDailyComparisons.user_id == user_id, UserDailyComparisons.day >= month_start
+        )
+    )
+    last_30 = 0
+    last_7 = 0
+    for day, count in day_res.all():
+        last_30 += count
+        if day >= week_start:
+            last_7 += count
+
+    facets: Dict[str, List[FacetStat]] = {}
+    for facet, limit in (("year", None), ("source", None), ("artist", TOP_ARTISTS)):
+        q = (
+            select(UserFacetStats)
+            .where(UserFacetStats.user_id == user_id, UserFacetStats.facet == facet)
+            .order_by(
+                UserFacetStats.rated_albums.desc(),
+                UserFacetStats.library_albums.desc(),
+                UserFacetStats.value,
+            )
+        )
+        if limit:
+            q = q.limit(limit)
+        res = await db.execute(q)
+        facets[facet] = [_facet_out(row) for row in res.scalars().all()]
+    facets["year"].sort(key=lambda f: f.value)
+
+    ema = stats.recent_abs_delta
+    return StatsResponse(
+        total_albums=stats.rated_albums - stats.excluded_rated_albums,
+        total_comparisons=stats.total_comparisons - stats.excluded_comparisons,
+        library_albums=stats.library_albums,
+        draws=stats.draws,
+        comparisons_last_7_days=last_7,
+        comparisons_last_30_days=last_30,
+        comparisons_per_day=round(last_7 / 7.0, 2),
+        mean_abs_elo_change=round(ema, 2) if ema is not None else None,
+        convergence=round(max(0.0, 1.0 - ema / MAX_VOTE_DELTA), 3) if ema is not None else None,
+        last_comparison_at=stats.last_comparison_at,
+        by_year=facets["year"],
+        by_artist=facets["artist"],
+        by_source=facets["source"],
+    )
+
+
+__all__ = [
+    "album_facets",
+    "rebuild_user_stats",
+    "record_comparison",
+    "forget_comparisons",
+    "record_library_albums",
+    "shift_exclusion_counts",
+    "build_stats_response",
+]
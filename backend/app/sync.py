@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .core.config import settings
+from .db import SessionLocal
+from .models import ImportSyncState, User
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("spotify", "spotify_albums", "lastfm", "aoty")
+# Sync states handled per background sweep, oldest first; the rest wait for the next sweep.
+SWEEP_BATCH = 100
+
+
+async def get_sync_state(db: AsyncSession, user_id: int, source: str) -> Optional[ImportSyncState]:
+    res = await db.execute(
+        select(ImportSyncState).where(ImportSyncState.user_id == user_id, ImportSyncState.source == source)
+    )
+    return res.scalar_one_or_none()
+
+
+async def save_sync_state(
+    db: AsyncSession,
+    user_id: int,
+    source: str,
+    *,
+    imported: int,
+    watermark: Optional[str] = None,
+    account: Optional[str] = None,
+    advance: bool = True,
+) -> ImportSyncState:
+    """Record a finished import in the caller's transaction.
+
+    ``advance=False`` keeps the previous watermark: the run stopped early (a cap, an upstream
+    error) and items between the old watermark and where it stopped were never seen.
+    """
+    state = await get_sync_state(db, user_id, source)
+    if state is None:
+        state = ImportSyncState(user_id=user_id, source=source)
+        db.add(state)
+    if advance:
+        state.watermark = watermark
+        state.last_synced_at = datetime.utcnow()
+    if account is not None:
+        state.account = account
+    state.last_imported = imported
+    return state
+
+
+async def resync(user_id: int, source: str) -> Dict[str, Any]:
+    """Re-run one user's import from ``source`` incrementally, in its own session."""
+    # The importers import this module for their sync state.
+    from .aoty import import_aoty_user_albums
+    from .lastfm import sync_top_albums
+    from .spotify import sync_saved_albums, sync_saved_tracks
+
+    async with SessionLocal() as db:
+        user = await db.get(User, user_id)
+        state = await get_sync_state(db, user_id, source)
+        if user is None or state is None:
+            return {"status": "skipped"}
+        if source == "spotify":
+            return await sync_saved_tracks(db, user)
+        if source == "spotify_albums":
+            return await sync_saved_albums(db, user)
+        if source == "lastfm":
+            if not state.account:
+                return {"status": "skipped"}
+            return await sync_top_albums(db, user, state.account)
+        if source == "aoty":
+            if not state.account:
+                return {"status": "skipped"}
+            imported, seeded = await import_aoty_user_albums(db, user, state.account)
+            return {"status": "ok", "imported": imported, "seeded": seeded}
+    raise ValueError(f"unknown import source {source!r}")
+
+
+async def resync_due(max_age: float, log: Callable[[str], None] = logger.info) -> Dict[str, int]:
+    """Re-sync every (user, source) whose last sync is older than ``max_age`` seconds.
+
+    States that never finished a sync (a capped first import) are included, and go first.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    async with SessionLocal() as db:
+        res = await db.execute(
+            select(ImportSyncState.user_id, ImportSyncState.source)
+            .where(or_(ImportSyncState.last_synced_at.is_(None), ImportSyncState.last_synced_at < cutoff))
+            .order_by(ImportSyncState.last_synced_at.is_not(None), ImportSyncState.last_synced_at)
+            .limit(SWEEP_BATCH)
+        )
+        due = res.all()
+    summary = {"synced": 0, "failed": 0, "imported": 0}
+    for user_id, source in due:
+        try:
+            result = await resync(user_id, source)
+        except Exception as exc:
+            # Expired credentials or an upstream outage for one user must not stop the sweep.
+            log(f"re-sync of {source} for user {user_id} failed: {exc}")
+            summary["failed"] += 1
+            continue
+        summary["synced"] += 1
+        summary["imported"] += int(result.get("imported") or 0)
+    return summary
+
+
+async def resync_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            summary = await resync_due(interval)
+            if summary["synced"] or summary["failed"]:
+                logger.info("library re-sync: %s", summary)
+        except Exception:  # pragma: no cover - keep the loop alive across transient DB errors
+            logger.exception("library re-sync failed")
+
+
+async def sync_states(db: AsyncSession, user_id: int) -> List[Dict[str, Any]]:
+    res = await db.execute(
+        select(ImportSyncState).where(ImportSyncState.user_id == user_id).order_by(ImportSyncState.source)
+    )
+    return [
+        {
+            "source": state.source,
+            "account": state.account,
+            "last_synced_at": state.last_synced_at,
+            "last_imported": state.last_imported,
+        }
+        for state in res.scalars().all()
+    ]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.sync", description="Re-sync imported libraries from where their last import stopped."
+    )
+    parser.add_argument("--user", type=int, default=None, help="only this user id")
+    parser.add_argument("--source", choices=SOURCES, default=None, help="only this source")
+    parser.add_argument(
+        "--older-than",
+        type=float,
+        default=None,
+        help=f"seconds since the last sync (default IMPORT_SYNC_INTERVAL, {settings.import_sync_interval:g})",
+    )
+    args = parser.parse_args(argv)
+
+    async def run() -> Any:
+        if args.user is None:
+            max_age = args.older_than if args.older_than is not None else settings.import_sync_interval
+            return await resync_due(max_age, log=print)
+        sources: List[str] = [args.source] if args.source else list(SOURCES)
+        return {source: await resync(args.user, source) for source in sources}
+
+    print(asyncio.run(run()))
+    return 0
+
+
+__all__ = [
+    "SOURCES",
+    "get_sync_state",
+    "save_sync_state",
+    "resync",
+    "resync_due",
+    "resync_periodically",
+    "sync_states",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import User
+
+# Clients may keep a copy but must revalidate it; the ETag makes revalidation a version lookup.
+CACHE_CONTROL = "private, no-cache"
+
+
+async def bump_data_version(db: AsyncSession, user_ids: int | Iterable[int]) -> Optional[int]:
+    """Mark users' rankings/stats as changed. Call inside the transaction that changes them.
+
+    Returns the new version when given a single user id.
+    """
+    stmt = update(User).values(data_version=User.data_version + 1).execution_options(synchronize_session=False)
+    if isinstance(user_ids, int):
+        res = await db.execute(stmt.where(User.id == user_ids).returning(User.data_version))
+        return res.scalar_one_or_none()
+    ids = sorted(set(user_ids))
+    if ids:
+        await db.execute(stmt.where(User.id.in_(ids)))
+    return None
+
+
+def data_etag(kind: str, user: User, *extra: object) -> str:
+    parts = [kind, str(user.id), str(user.data_version or 0), *(str(e) for e in extra)]
+    return '"' + "-".join(parts) + '"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response when ``If-None-Match`` already names ``etag``, else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
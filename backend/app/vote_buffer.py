@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .core.elo import update_elo
+from .db import SessionLocal
+from .fastjson import dumps
+from .inference import invalidate_closure
+from .models import Album, EloScore
+from .schemas import CompareSubmit
+from .votes import apply_vote, vote_recorded
+
+logger = logging.getLogger(__name__)
+
+# Votes applied per database transaction when draining the log.
+FLUSH_BATCH = 500
+SEGMENT_PREFIX = "votes-"
+
+
+class VoteLog:
+    """Append-only vote log split into numbered segments, fsynced in groups.
+
+    Appends return once an fsync covering them has finished; appends that arrive while one is
+    running share the next (group commit). ``rotate`` closes the current segment so it can be
+    drained and deleted while new votes go to a fresh one.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = self.segments()
+        self._next = (int(existing[-1].stem[len(SEGMENT_PREFIX) :]) + 1) if existing else 1
+        self._lock = asyncio.Lock()
+        self._waiters: List[Tuple[asyncio.Future, Any]] = []
+        self._syncing: Optional[asyncio.Task] = None
+        self._open()
+
+    def segments(self) -> List[Path]:
+        return sorted(self.directory.glob(f"{SEGMENT_PREFIX}*.log"), key=lambda p: int(p.stem[len(SEGMENT_PREFIX) :]))
+
+    def _open(self) -> None:
+        self.path = self.directory / f"{SEGMENT_PREFIX}{self._next:08d}.log"
+        self._next += 1
+        self._file = open(self.path, "ab")
+
+    async def append(self, record: Dict[str, Any]) -> None:
+        self._file.write(dumps(record) + b"\n")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, self._file))
+        if self._syncing is None:
+            self._syncing = asyncio.create_task(self._sync())
+        await waiter
+
+    async def _sync(self) -> None:
+        try:
+            while self._waiters:
+                async with self._lock:
+                    waiters, self._waiters = self._waiters, []
+                    error: Optional[OSError] = None
+                    # A segment closed by ``rotate`` has already been fsynced.
+                    for fh in {fh for _, fh in waiters if not fh.closed}:
+                        try:
+                            fh.flush()
+                            await asyncio.to_thread(os.fsync, fh.fileno())
+                        except OSError as exc:
+                            error = exc
+                for waiter, _ in waiters:
+                    if error is not None:
+                        waiter.set_exception(error)
+                    else:
+                        waiter.set_result(None)
+        finally:
+            self._syncing = None
+
+    async def rotate(self) -> Path:
+        """Start a new segment and make the previous one durable; returns the previous path.
+
+        The swap happens before the first await, so callers can pair it atomically with taking
+        the records written so far.
+        """
+        closed, fh = self.path, self._file
+        self._open()
+        async with self._lock:
+            fh.flush()
+            await asyncio.to_thread(os.fsync, fh.fileno())
+            fh.close()
+        return closed
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_segment(path: Path) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, "rb") as fh:
+        for line in fh:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash mid-write was never acknowledged.
+                logger.warning("skipping unreadable vote log line in %s", path)
+    return records
+
+
+class VoteBuffer:
+    """Write-behind vote path: durable log + in-memory Elo, drained to the database in batches.
+
+    Only one process may own the log directory, and its working set is the source of truth for
+    the Elo shown between a vote and its flush, so run a single API worker with it enabled.
+    """
+
+    def __init__(self, directory: str, flush_interval: float) -> None:
+        self.log = VoteLog(directory)
+        self.flush_interval = flush_interval
+        # user_id -> album_id -> [elo, comparisons_count, prior_count]; loaded from the database on first use.
+        self._scores: Dict[int, Dict[int, List[float]]] = {}
+        self._known_albums: set = set()
+        self._vote_ids: Dict[int, set] = {}
+        self._pending_users: Dict[int, int] = {}
+        # Closed segments awaiting a flush, oldest first, with their records.
+        self._segments: List[Tuple[Path, List[Dict[str, Any]]]] = []
+        self._current: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _user_scores(self, db: AsyncSession, user_id: int) -> Dict[int, List[float]]:
+        scores = self._scores.get(user_id)
+        if scores is None:
+            res = await db.execute(
+                select(EloScore.album_id, EloScore.elo, EloScore.comparisons_count, EloScore.prior_count).where(
+                    EloScore.user_id == user_id
+                )
+            )
+            scores = {album_id: [elo, count or 0, prior or 0] for album_id, elo, count, prior in res.all()}
+            self._scores[user_id] = scores
+        return scores
+
+    async def submit(self, db: AsyncSession, user_id: int, payload: CompareSubmit) -> Dict[str, Any]:
+        """Log a vote durably and apply it to the working set; the database catches up on flush."""
+        seen = self._vote_ids.setdefault(user_id, set())
+        if payload.vote_id is not None and payload.vote_id in seen:
+            return {"status": "ok", "duplicate": True}
+        # ``seen`` forgets ids once they are flushed, so a late retry is caught by the database.
+        if await vote_recorded(db, user_id, payload.vote_id):
+            return {"status": "ok", "duplicate": True}
+        scores = await self._user_scores(db, user_id)
+        ids = (payload.album_a_id, payload.album_b_id)
+        unknown = [album_id for album_id in ids if album_id not in scores and album_id not in self._known_albums]
+        if unknown:
+            res = await db.execute(select(Album.id).where(Album.id.in_(unknown)))
+            found = set(res.scalars().all())
+            if len(found) != len(unknown):
+                raise HTTPException(status_code=404, detail="Albums not found")
+            self._known_albums.update(found)
+        if payload.winner_album_id is None:
+            score_a = 0.5
+        elif payload.winner_album_id in ids:
+            score_a = 1.0 if payload.winner_album_id == payload.album_a_id else 0.0
+        else:
+            raise HTTPException(status_code=400, detail="winner_album_id must be one of the compared albums or null")
+
+        if payload.vote_id is not None and payload.vote_id in seen:
+            # A retry of the same vote got here first while this one awaited the database.
+            return {"status": "ok", "duplicate": True}
+        # No awaits between reading and writing the working set, so concurrent votes cannot interleave.
+        a = scores.setdefault(payload.album_a_id, [1500.0, 0, 0])
+        b = scores.setdefault(payload.album_b_id, [1500.0, 0, 0])
+        a[0], b[0] = update_elo(a[0], b[0], score_a, a[1] + a[2], b[1] + b[2])
+        a[1] += 1
+        b[1] += 1
+        # Every logged vote gets an id so a replay after a crash mid-flush cannot apply it twice.
+        vote_id = payload.vote_id or uuid.uuid4().hex
+        seen.add(vote_id)
+        record = {
+            "user_id": user_id,
+            "album_a_id": payload.album_a_id,
+            "album_b_id": payload.album_b_id,
+            "winner_album_id": payload.winner_album_id,
+            "vote_id": vote_id,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        self._current.append(record)
+        self._pending_users[user_id] = self._pending_users.get(user_id, 0) + 1
+        try:
+            await self.log.append(record)
+        except OSError:
+            # Not durable, so not acknowledged: keep it out of the next flush if it is still queued,
+            # and rebuild this user's Elo from the database next time.
+            if record in self._current:
+                self._current.remove(record)
+                self._pending_users[user_id] -= 1
+            self._scores.pop(user_id, None)
+            raise
+        return {"status": "ok", "buffered": True}
+
+    def pending(self, user_id: int) -> bool:
+        return self._pending_users.get(user_id, 0) > 0
+
+    def working_elo(self, user_id: int, album_id: int) -> Optional[Tuple[float, int]]:
+        """Elo and comparison count including unflushed votes, if this process has loaded the user."""
+        entry = self._scores.get(user_id, {}).get(album_id)
+        return (entry[0], int(entry[1])) if entry is not None else None
+
+    def add_priors(self, user_id: int, priors: Dict[int, Tuple[float, int]]) -> None:
+        """Show ratings seeded by an import to a user already loaded into the working set."""
+        scores = self._scores.get(user_id)
+        if scores is not None:
+            for album_id, (elo, prior_count) in priors.items():
+                scores.setdefault(album_id, [elo, 0, prior_count])
+
+    async def _apply(self, records: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(records), FLUSH_BATCH):
+            async with SessionLocal() as db:
+                for record in records[start : start + FLUSH_BATCH]:
+                    payload = CompareSubmit(
+                        album_a_id=record["album_a_id"],
+                        album_b_id=record["album_b_id"],
+                        winner_album_id=record["winner_album_id"],
+                        vote_id=record["vote_id"],
+                    )
+                    try:
+                        async with db.begin_nested():
+                            await apply_vote(db, record["user_id"], payload, datetime.fromisoformat(record["created_at"]))
+                    except IntegrityError:
+                        # Already in the database: an earlier flush committed it before the crash.
+                        pass
+                    except HTTPException as exc:
+                        logger.warning("dropping buffered vote %s: %s", record["vote_id"], exc.detail)
+                await db.commit()
+
+    async def flush(self) -> int:
+        """Drain every closed segment plus the current one to the database. Returns votes applied."""
+        async with self._flush_lock:
+            if self._current:
+                # Taking the records and rotating the segment happen without an await in between.
+                records, self._current = self._current, []
+                self._segments.append((await self.log.rotate(), records))
+            applied = 0
+            while self._segments:
+                path, records = self._segments[0]
+                await self._apply(records)
+                path.unlink(missing_ok=True)
+                self._segments.pop(0)
+                applied += len(records)
+                for record in records:
+                    user_id = record["user_id"]
+                    # Flushed votes can land below ids a closure has already caught up past.
+                    invalidate_closure(user_id)
+                    self._pending_users[user_id] -= 1
+                    self._vote_ids.get(user_id, set()).discard(record["vote_id"])
+                    if not self._pending_users[user_id]:
+                        # Caught up: reload from the database next time, picking up other writers.
+                        del self._pending_users[user_id]
+                        self._scores.pop(user_id, None)
+            return applied
+
+    async def settle(self) -> None:
+        """Flush before a synchronous write that must see every earlier vote (undo, placement)."""
+        if self._current or self._segments:
+            await self.flush()
+
+    async def recover(self) -> int:
+        """Queue segments left by a previous run (everything on disk but the fresh one) and flush them."""
+        for path in self.log.segments():
+            if path == self.log.path:
+                continue
+            records = read_segment(path)
+            for record in records:
+                self._pending_users[record["user_id"]] = self._pending_users.get(record["user_id"], 0) + 1
+            self._segments.append((path, records))
+        return await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:  # pragma: no cover - keep the loop alive; the log keeps the votes
+                logger.exception("vote buffer flush failed")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self.log.close()
+
+
+_buffer: Optional[VoteBuffer] = None
+
+
+def get_vote_buffer() -> Optional[VoteBuffer]:
+    return _buffer
+
+
+async def start_vote_buffer(directory: str, flush_interval: float) -> VoteBuffer:
+    """Open the log, replay anything a crash left behind, and start the background flusher."""
+    global _buffer
+    buffer = VoteBuffer(directory, flush_interval)
+    recovered = await buffer.recover()
+    if recovered:
+        logger.info("replayed %d buffered votes from %s", recovered, directory)
+    buffer.start()
+    _buffer = buffer
+    return buffer
+
+
+async def stop_vote_buffer() -> None:
+    global _buffer
+    if _buffer is not None:
+        await _buffer.stop()
+        _buffer = None
+
+
+__all__ = ["VoteLog", "VoteBuffer", "get_vote_buffer", "start_vote_buffer", "stop_vote_buffer"]
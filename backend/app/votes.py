@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+
+from .changes import record_ranking_changes
+from .community import normalized_rating, record_ratings
+from .core.elo import update_elo
+from .exclusions import get_exclusions
+from .history import maybe_snapshot
+from .models import Album, Comparison, EloScore
+from .placement import discard_placements, submit_placement
+from .schemas import CompareSubmit
+from .stats import record_comparison
+from .versioning import bump_data_version
+
+# Attempts at recording a vote before reporting a conflict to the client.
+VOTE_ATTEMPTS = 3
+
+
+async def vote_recorded(db: AsyncSession, user_id: int, vote_id: Optional[str]) -> bool:
+    if vote_id is None:
+        return False
+    res = await db.execute(select(Comparison.id).where(Comparison.user_id == user_id, Comparison.vote_id == vote_id))
+    return res.first() is not None
+
+
+async def record_vote(db: AsyncSession, user_id: int, payload: CompareSubmit) -> Dict[str, Any]:
+    """Apply and commit one vote, retrying when a concurrent write to the same rows wins.
+
+    EloScore and UserStats rows carry version counters, so a concurrent write to the same rows
+    makes the flush fail instead of silently overwriting it; the vote is then recomputed from
+    fresh rows.
+    """
+    for _ in range(VOTE_ATTEMPTS):
+        if await vote_recorded(db, user_id, payload.vote_id):
+            return {"status": "ok", "duplicate": True}
+        try:
+            result = await apply_vote(db, user_id, payload)
+            await db.commit()
+            return result
+        except (StaleDataError, IntegrityError):
+            # IntegrityError covers a retry racing the original on vote_id, and two first votes
+            # creating the same EloScore.
+            await db.rollback()
+    if await vote_recorded(db, user_id, payload.vote_id):
+        return {"status": "ok", "duplicate": True}
+    raise HTTPException(status_code=409, detail="Vote conflicted with concurrent updates; please retry")
+
+
+async def apply_vote(
+    db: AsyncSession, user_id: int, payload: CompareSubmit, created_at: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Record one vote and everything derived from it in the session, without committing.
+
+    ``created_at`` backdates votes applied later than they were cast (the write-behind buffer).
+    """
+    res = await db.execute(select(Album).where(Album.id.in_([payload.album_a_id, payload.album_b_id])))
+    albums = {a.id: a for a in res.scalars().all()}
+    if len(albums) != 2:
+        raise HTTPException(status_code=404, detail="Albums not found")
+    if payload.mode == "placement":
+        return await submit_placement(db, user_id, payload, albums)
+
+    res = await db.execute(
+        select(EloScore).where(
+            EloScore.user_id == user_id, EloScore.album_id.in_([payload.album_a_id, payload.album_b_id])
+        )
+    )
+    elo_rows = {e.album_id: e for e in res.scalars().all()}
+    new_album_ids: list[int] = []
+
+    def ensure_elo(album_id: int) -> EloScore:
+        if album_id not in elo_rows:
+            es = EloScore(user_id=user_id, album_id=album_id, elo=1500.0, comparisons_count=0)
+            db.add(es)
+            elo_rows[album_id] = es
+            new_album_ids.append(album_id)
+        return elo_rows[album_id]
+
+    ea = ensure_elo(payload.album_a_id)
+    eb = ensure_elo(payload.album_b_id)
+    excluded = await get_exclusions(db, user_id)
+    old_states = {
+        es.album_id: None if es.album_id in new_album_ids else (es.elo, es.comparisons_count)
+        for es in (ea, eb)
+        if es.album_id not in excluded
+    }
+
+    if payload.winner_album_id is None:
+        score_a = 0.5
+    elif payload.winner_album_id == payload.album_a_id:
+        score_a = 1.0
+    elif payload.winner_album_id == payload.album_b_id:
+        score_a = 0.0
+    else:
+        raise HTTPException(status_code=400, detail="winner_album_id must be one of the compared albums or null")
+
+    old_ratings = {es.album_id: normalized_rating(es.elo) for es in (ea, eb)}
+    # Seeded but never dueled: not yet part of the community averages (see community.reconcile).
+    unrated = {es.album_id for es in (ea, eb) if es.album_id in new_album_ids or not es.comparisons_count}
+    new_a, new_b = update_elo(
+        ea.elo, eb.elo, score_a, ea.comparisons_count + (ea.prior_count or 0), eb.comparisons_count + (eb.prior_count or 0)
+    )
+    abs_delta = (abs(new_a - ea.elo) + abs(new_b - eb.elo)) / 2.0
+    cmp_row = Comparison(
+        user_id=user_id,
+        album_a_id=payload.album_a_id,
+        album_b_id=payload.album_b_id,
+        winner_album_id=payload.winner_album_id,
+        vote_id=payload.vote_id,
+        created_at=created_at or datetime.utcnow(),
+        elo_a_before=ea.elo,
+        elo_a_after=new_a,
+        elo_b_before=eb.elo,
+        elo_b_after=new_b,
+    )
+    ea.elo, eb.elo = new_a, new_b
+    ea.comparisons_count += 1
+    eb.comparisons_count += 1
+
+    db.add(cmp_row)
+    await record_comparison(
+        db,
+        user_id,
+        albums[payload.album_a_id],
+        albums[payload.album_b_id],
+        payload.winner_album_id,
+        new_album_ids,
+        abs_delta,
+    )
+    await record_ratings(
+        db,
+        {
+            es.album_id: (normalized_rating(es.elo), None if es.album_id in unrated else old_ratings[es.album_id])
+            for es in (ea, eb)
+        },
+    )
+    await discard_placements(db, user_id, new_album_ids)
+    version = await bump_data_version(db, user_id)
+    await record_ranking_changes(db, user_id, version, old_states)
+    await maybe_snapshot(db, user_id, version)
+    return {"status": "ok"}
+
+
+__all__ = ["VOTE_ATTEMPTS", "vote_recorded", "record_vote", "apply_vote"]
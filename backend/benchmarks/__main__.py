@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+
+from .dataset import DatasetConfig, generate
+from .runner import SCENARIOS, RunConfig, run
+from . import closure, search, serialization, startup, topk
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Generate synthetic AlbumDuel data and benchmark the API in-process. "
+        "Point DATABASE_URL at a scratch database before running.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="write a synthetic dataset into an empty database")
+    gen.add_argument("--albums", type=int, default=DatasetConfig.albums)
+    gen.add_argument("--users", type=int, default=DatasetConfig.users)
+    gen.add_argument("--comparisons", type=int, default=DatasetConfig.comparisons)
+    gen.add_argument("--seed", type=int, default=DatasetConfig.seed)
+    gen.add_argument("--skip-aggregates", action="store_true", help="leave /stats aggregates to be built lazily")
+
+    bench = sub.add_parser("run", help="drive the API and report latency percentiles as JSON")
+    bench.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    bench.add_argument("--requests", type=int, default=RunConfig.requests, help="requests per scenario")
+    bench.add_argument("--concurrency", type=int, default=RunConfig.concurrency)
+    bench.add_argument("--seed", type=int, default=RunConfig.seed)
+    bench.add_argument("--output", help="write the JSON report here instead of stdout")
+
+    ser = sub.add_parser("serialization", help="compare the fast /rankings encoder with the Pydantic path")
+    ser.add_argument("--items", type=int, default=10_000)
+    ser.add_argument("--repeat", type=int, default=7)
+
+    clo = sub.add_parser("closure", help="time incremental transitive-closure updates for one user")
+    clo.add_argument("--albums", type=int, default=5_000)
+    clo.add_argument("--votes", type=int, default=20_000)
+    clo.add_argument("--noise", type=float, default=0.05, help="fraction of votes against the hidden order")
+    clo.add_argument("--seed", type=int, default=1)
+
+    top = sub.add_parser("topk", help="simulate votes needed for a reliable top K, uniform vs ?mode=topk")
+    top.add_argument("--albums", type=int, default=500)
+    top.add_argument("--k", type=int, default=25)
+    top.add_argument("--target", type=float, default=0.9, help="required overlap with the true top K")
+    top.add_argument("--max-votes", type=int, default=50_000)
+    top.add_argument("--confidence", type=float, default=0.95)
+    top.add_argument("--seed", type=int, default=1)
+
+    sea = sub.add_parser("search", help="time /albums/search trigram lookups on a synthetic catalog")
+    sea.add_argument("--albums", type=int, default=100_000)
+    sea.add_argument("--queries", type=int, default=500)
+    sea.add_argument("--limit", type=int, default=10)
+    sea.add_argument("--seed", type=int, default=1)
+
+    boot = sub.add_parser("startup", help="time cold import and schema check; exits 1 when over budget")
+    boot.add_argument("--runs", type=int, default=5)
+    boot.add_argument("--budget-ms", type=float, default=1500.0)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+
+    if args.command == "generate":
+        config = DatasetConfig(
+            albums=args.albums,
+            users=args.users,
+            comparisons=args.comparisons,
+            seed=args.seed,
+            build_aggregates=not args.skip_aggregates,
+        )
+        summary = asyncio.run(generate(config, log=lambda msg: print(msg, file=sys.stderr)))
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    if args.command == "closure":
+        report = closure.run(albums=args.albums, votes=args.votes, noise=args.noise, seed=args.seed)
+        print(json.dumps(report, indent=2))
+        return 0
+
+    if args.command == "topk":
+        report = topk.run(
+            albums=args.albums,
+            k=args.k,
+            target=args.target,
+            max_votes=args.max_votes,
+            confidence=args.confidence,
+            seed=args.seed,
+        )
+        print(json.dumps(report, indent=2))
+        return 0
+
+    if args.command == "search":
+        report = search.run(albums=args.albums, queries=args.queries, limit=args.limit, seed=args.seed)
+        print(json.dumps(report, indent=2))
+        return 0
+
+    if args.command == "startup":
+        report = startup.run(runs=args.runs, budget_ms=args.budget_ms)
+        print(json.dumps(report, indent=2))
+        return 0 if report["ok"] else 1
+
+    if args.command == "serialization":
+        print(json.dumps(serialization.run(items=args.items, repeat=args.repeat), indent=2))
+        return 0
+
+    config = RunConfig(
+        scenarios=[s.strip() for s in args.scenarios.split(",") if s.strip()],
+        requests=args.requests,
+        concurrency=args.concurrency,
+        seed=args.seed,
+    )
+    report = asyncio.run(run(config))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
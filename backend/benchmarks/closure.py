@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import random
+import statistics
+import time
+from typing import Dict
+
+from app.inference import PreferenceClosure
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run(albums: int = 5_000, votes: int = 20_000, noise: float = 0.05, seed: int = 1) -> Dict:
+    """Time incremental closure updates for one user with ``albums`` albums.
+
+    Votes follow a hidden true order, with ``noise`` of them flipped to exercise the contradiction
+    path. Pair choice is uniform, like /compare/next before transitive skipping.
+    """
+    rng = random.Random(seed)
+    order = list(range(albums))
+    rng.shuffle(order)
+    strength = {album: rank for rank, album in enumerate(order)}
+
+    closure = PreferenceClosure()
+    timings = []
+    implied_hits = 0
+    started = time.perf_counter()
+    for _ in range(votes):
+        a, b = rng.sample(range(albums), 2)
+        if closure.implied(a, b):
+            implied_hits += 1
+        winner, loser = (a, b) if strength[a] < strength[b] else (b, a)
+        if rng.random() < noise:
+            winner, loser = loser, winner
+        t0 = time.perf_counter()
+        closure.add(winner, loser)
+        timings.append(time.perf_counter() - t0)
+    total = time.perf_counter() - started
+
+    us = [t * 1e6 for t in timings]
+    pairs = closure.albums * (closure.albums - 1) // 2
+    bitset_bytes = sum((m.bit_length() + 7) // 8 for m in closure.desc) + sum(
+        (m.bit_length() + 7) // 8 for m in closure.anc
+    )
+    return {
+        "albums": albums,
+        "votes": votes,
+        "update_us": {
+            "mean": round(statistics.fmean(us), 1),
+            "p50": round(_percentile(us, 50), 1),
+            "p99": round(_percentile(us, 99), 1),
+            "max": round(max(us), 1),
+        },
+        "total_seconds": round(total, 3),
+        "resolved_pairs": closure.resolved,
+        "resolved_fraction": round(closure.resolved / pairs, 4) if pairs else 0.0,
+        "contradictions": closure.contradictions,
+        "sampled_pairs_already_implied": implied_hits,
+        "bitset_bytes": bitset_bytes,
+    }
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import math
+import random
+import string
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import SessionLocal, engine
+from app.migrations import migrate
+from app.models import Album, Comparison, EloScore, SpotifyToken, User, UserAlbum
+from app.stats import rebuild_user_stats
+
+WORDS = (
+    "midnight static golden echoes velvet paper summer ghosts neon river silent machine "
+    "northern lights broken radio electric garden hollow crown wild heart glass city "
+    "blue hour distant signals crystal shadows burning bridges ocean drive violet dawn "
+    "endless night lonely planet iron sky fading memory sweet chaos black lake"
+).split()
+SOURCES = (("spotify", 0.6), ("aoty", 0.25), ("lastfm", 0.15))
+CHUNK = 10_000
+
+
+@dataclass
+class DatasetConfig:
+    albums: int = 100_000
+    users: int = 1_000
+    comparisons: int = 10_000_000
+    seed: int = 1
+    draw_rate: float = 0.05
+    history_days: int = 365
+    build_aggregates: bool = True
+
+
+def _spotify_id(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=22))
+
+
+def _title(rng: random.Random) -> str:
+    return " ".join(w.capitalize() for w in rng.sample(WORDS, rng.randint(1, 4)))
+
+
+async def _insert_chunks(table, rows: List[dict]) -> None:
+    async with engine.begin() as conn:
+        for i in range(0, len(rows), CHUNK):
+            await conn.execute(insert(table), rows[i : i + CHUNK])
+
+
+async def generate(config: DatasetConfig, log=print) -> Dict[str, int]:
+    """Write a synthetic catalog, user libraries and duel history straight into the database."""
+    rng = random.Random(config.seed)
+    started = time.perf_counter()
+    await migrate(engine, log=log)
+
+    async with SessionLocal() as db:
+        res = await db.execute(select(Album.id).limit(1))
+        if res.first() is not None:
+            raise RuntimeError("Benchmark data must be generated into an empty database.")
+
+    # Catalog: artists follow a Zipf-like popularity curve, releases skew towards recent years.
+    n_artists = max(1, config.albums // 8)
+    artists = [f"{_title(rng)} {i}" for i in range(n_artists)]
+    artist_cum = []
+    acc = 0.0
+    for rank in range(n_artists):
+        acc += 1.0 / (rank + 1) ** 0.9
+        artist_cum.append(acc)
+    album_rows = []
+    quality: List[float] = []
+    for album_id in range(1, config.albums + 1):
+        source = rng.choices([s for s, _ in SOURCES], weights=[w for _, w in SOURCES])[0]
+        spotify_id = _spotify_id(rng) if source == "spotify" else None
+        album_rows.append(
+            {
+                "id": album_id,
+                "title": _title(rng),
+                "artist": rng.choices(artists, cum_weights=artist_cum)[0],
+                "year": int(rng.triangular(1960, 2025, 2018)),
+                "spotify_id": spotify_id,
+                "cover_url": f"https://i.scdn.co/image/{spotify_id}" if spotify_id else None,
+                "source": source,
+                "cover_provider": source if spotify_id else None,
+            }
+        )
+        quality.append(rng.gauss(0.0, 1.0))
+    await _insert_chunks(Album.__table__, album_rows)
+    spotify_ids = [row["spotify_id"] for row in album_rows if row["spotify_id"]]
+    del album_rows
+    log(f"albums: {config.albums} in {time.perf_counter() - started:.1f}s")
+
+    user_rows = [
+        {"id": user_id, "provider": "spotify", "provider_user_id": f"bench-{user_id}", "display_name": f"Bench {user_id}"}
+        for user_id in range(1, config.users + 1)
+    ]
+    await _insert_chunks(User.__table__, user_rows)
+    await _insert_chunks(
+        SpotifyToken.__table__,
+        [
+            {"user_id": row["id"], "access_token": "bench", "refresh_token": "bench", "expires_at": 2**31 - 1}
+            for row in user_rows
+        ],
+    )
+
+    # Libraries are log-normally sized; popular albums show up in more libraries.
+    album_ids = list(range(1, config.albums + 1))
+    album_cum = []
+    acc = 0.0
+    for rank in range(config.albums):
+        acc += 1.0 / (rank + 10) ** 0.7
+        album_cum.append(acc)
+    libraries: Dict[int, List[int]] = {}
+    link_rows = []
+    for user_id in range(1, config.users + 1):
+        size = int(min(5000, max(20, rng.lognormvariate(math.log(300), 0.8))))
+        size = min(size, config.albums)
+        library = list(set(rng.choices(album_ids, cum_weights=album_cum, k=size)))
+        libraries[user_id] = library
+        source = rng.choices([s for s, _ in SOURCES], weights=[w for _, w in SOURCES])[0]
+        link_rows.extend({"user_id": user_id, "album_id": a, "added_from": source} for a in library)
+    await _insert_chunks(UserAlbum.__table__, link_rows)
+    log(f"user_albums: {len(link_rows)} in {time.perf_counter() - started:.1f}s")
+    del link_rows
+
+    # Duel history is split across users in proportion to library size.
+    total_library = sum(len(lib) for lib in libraries.values())
+    now = datetime.utcnow()
+    written = 0
+    elo_total = 0
+    for user_id, library in libraries.items():
+        if len(library) < 2:
+            continue
+        remaining = config.comparisons - written
+        share = remaining if user_id == config.users else int(config.comparisons * len(library) / total_library)
+        share = min(share, remaining)
+        counts: Dict[int, int] = {}
+        rows = []
+        for _ in range(share):
+            a, b = rng.sample(library, 2)
+            if rng.random() < config.draw_rate:
+                winner = None
+            else:
+                p_a = 1.0 / (1.0 + math.exp(quality[b - 1] - quality[a - 1]))
+                winner = a if rng.random() < p_a else b
+            counts[a] = counts.get(a, 0) + 1
+            counts[b] = counts.get(b, 0) + 1
+            rows.append(
+                {
+                    "user_id": user_id,
+                    "album_a_id": a,
+                    "album_b_id": b,
+                    "winner_album_id": winner,
+                    "created_at": now - timedelta(seconds=rng.randint(0, config.history_days * 86400)),
+                }
+            )
+            if len(rows) >= CHUNK:
+                await _insert_chunks(Comparison.__table__, rows)
+                rows = []
+        if rows:
+            await _insert_chunks(Comparison.__table__, rows)
+        written += share
+
+        elo_rows = [
+            {
+                "user_id": user_id,
+                "album_id": album_id,
+                "elo": 1500.0 + 150.0 * quality[album_id - 1] + rng.gauss(0.0, 40.0),
+                "comparisons_count": count,
+                "updated_at": now,
+            }
+            for album_id, count in counts.items()
+        ]
+        await _insert_chunks(EloScore.__table__, elo_rows)
+        elo_total += len(elo_rows)
+    log(f"comparisons: {written}, elo_scores: {elo_total} in {time.perf_counter() - started:.1f}s")
+
+    if config.build_aggregates:
+        for user_id in libraries:
+            async with SessionLocal() as db:
+                await rebuild_user_stats(db, user_id)
+                await db.commit()
+        log(f"aggregates built in {time.perf_counter() - started:.1f}s")
+
+    return {
+        "albums": config.albums,
+        "spotify_albums": len(spotify_ids),
+        "users": config.users,
+        "comparisons": written,
+        "elo_scores": elo_total,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+async def load_context(db: AsyncSession) -> Dict[str, list]:
+    """Ids the load driver needs to build realistic requests against a generated dataset."""
+    users = (await db.execute(select(User.id).where(User.provider == "spotify"))).scalars().all()
+    albums = (await db.execute(select(Album.id))).scalars().all()
+    spotify = (
+        await db.execute(select(Album.spotify_id).where(Album.spotify_id.is_not(None)).limit(50_000))
+    ).scalars().all()
+    return {"users": list(users), "albums": list(albums), "spotify_ids": list(spotify)}
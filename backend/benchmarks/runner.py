@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+import jwt
+
+from app.core.config import settings
+from app.db import SessionLocal
+from app.lastfm import LASTFM_SESSIONS
+from app.main import app
+from app.vote_buffer import start_vote_buffer, stop_vote_buffer
+
+from .dataset import load_context
+from .upstream import fake_upstream
+
+
+@dataclass
+class RunConfig:
+    scenarios: List[str]
+    requests: int = 1_000
+    concurrency: int = 16
+    seed: int = 1
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    status_codes: Dict[int, int] = field(default_factory=dict)
+    exceptions: Dict[str, int] = field(default_factory=dict)
+    wall_s: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies_ms)
+        count = len(lat)
+
+        def pct(p: float) -> float:
+            if not lat:
+                return 0.0
+            return round(lat[min(count - 1, max(0, int(round(p / 100.0 * count)) - 1))], 3)
+
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "status_codes": {str(k): v for k, v in sorted(self.status_codes.items())},
+            "exceptions": dict(self.exceptions),
+            "wall_s": round(self.wall_s, 3),
+            "throughput_rps": round(count / self.wall_s, 2) if self.wall_s else 0.0,
+            "latency_ms": {
+                "min": round(lat[0], 3) if lat else 0.0,
+                "mean": round(sum(lat) / count, 3) if lat else 0.0,
+                "p50": pct(50),
+                "p90": pct(90),
+                "p95": pct(95),
+                "p99": pct(99),
+                "max": round(lat[-1], 3) if lat else 0.0,
+            },
+        }
+
+
+Request = Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+
+
+class Scenarios:
+    """Request builders for each benchmarked endpoint, bound to a generated dataset."""
+
+    def __init__(self, context: Dict[str, list]) -> None:
+        self.users = context["users"]
+        self.albums = context["albums"]
+        self._tokens: Dict[int, str] = {}
+
+    def _headers(self, rng: random.Random) -> Dict[str, str]:
+        user_id = rng.choice(self.users)
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = jwt.encode({"sub": str(user_id), "provider": "spotify"}, settings.jwt_secret, algorithm="HS256")
+            self._tokens[user_id] = token
+        return {"Authorization": f"Bearer {token}"}
+
+    async def compare_next(self, client, rng):
+        return await client.get("/compare/next", headers=self._headers(rng))
+
+    async def compare_submit(self, client, rng):
+        a, b = rng.sample(self.albums, 2)
+        winner = rng.choice((a, b, None))
+        return await client.post(
+            "/compare/submit",
+            headers=self._headers(rng),
+            json={"album_a_id": a, "album_b_id": b, "winner_album_id": winner},
+        )
+
+    async def rankings(self, client, rng):
+        return await client.get("/rankings", headers=self._headers(rng))
+
+    async def stats(self, client, rng):
+        return await client.get("/stats", headers=self._headers(rng))
+
+    async def import_demo(self, client, rng):
+        return await client.post("/import/demo-albums")
+
+    async def import_spotify(self, client, rng):
+        return await client.post("/import/spotify/top-albums", headers=self._headers(rng), params={"max_albums": 200})
+
+    async def import_spotify_albums(self, client, rng):
+        return await client.post(
+            "/import/spotify/top-albums",
+            headers=self._headers(rng),
+            params={"max_albums": 200, "mode": "albums"},
+        )
+
+    async def import_lastfm(self, client, rng):
+        return await client.post("/import/lastfm/top-albums", headers=self._headers(rng), params={"limit": 200})
+
+    def get(self, name: str) -> Request:
+        if name.startswith("_") or not hasattr(self, name):
+            raise ValueError(f"Unknown scenario: {name}")
+        return getattr(self, name)
+
+
+SCENARIOS = (
+    "compare_next",
+    "compare_submit",
+    "rankings",
+    "stats",
+    "import_demo",
+    "import_spotify",
+    "import_spotify_albums",
+    "import_lastfm",
+)
+
+
+async def _drive(client: httpx.AsyncClient, name: str, request: Request, config: RunConfig) -> ScenarioResult:
+    result = ScenarioResult(name=name)
+    remaining = config.requests
+
+    async def worker(worker_id: int) -> None:
+        nonlocal remaining
+        rng = random.Random(config.seed * 1_000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                resp = await request(client, rng)
+            except Exception as exc:
+                result.errors += 1
+                kind = type(exc).__name__
+                result.exceptions[kind] = result.exceptions.get(kind, 0) + 1
+                continue
+            result.latencies_ms.append((time.perf_counter() - started) * 1000.0)
+            result.status_codes[resp.status_code] = result.status_codes.get(resp.status_code, 0) + 1
+            if resp.status_code >= 400:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(config.concurrency)))
+    result.wall_s = time.perf_counter() - started
+    return result
+
+
+async def run(config: RunConfig) -> Dict[str, Any]:
+    """Drive the in-process ASGI app and return a JSON-serializable latency report."""
+    async with SessionLocal() as db:
+        context = await load_context(db)
+    if len(context["users"]) < 1 or len(context["albums"]) < 2:
+        raise RuntimeError("No benchmark data found; run `python -m benchmarks generate` first.")
+
+    for user_id in context["users"]:
+        LASTFM_SESSIONS[user_id] = {"username": f"bench-{user_id}", "key": "bench"}
+
+    scenarios = Scenarios(context)
+    report: Dict[str, Any] = {
+        "config": {
+            "requests": config.requests,
+            "concurrency": config.concurrency,
+            "seed": config.seed,
+            "users": len(context["users"]),
+            "albums": len(context["albums"]),
+        },
+        "scenarios": {},
+    }
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not send lifespan events, so start the vote buffer the way startup would.
+    if settings.vote_buffer_dir:
+        await start_vote_buffer(settings.vote_buffer_dir, settings.vote_buffer_flush_interval)
+        report["config"]["vote_buffer"] = True
+    try:
+        with fake_upstream(context["spotify_ids"], seed=config.seed):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for name in config.scenarios:
+                    result = await _drive(client, name, scenarios.get(name), config)
+                    report["scenarios"][name] = result.summary()
+    finally:
+        await stop_vote_buffer()
+    return report
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from app.catalog import AlbumCatalog
+from app.search import SearchIndex
+
+from .dataset import _title
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _typo(rng: random.Random, text: str) -> str:
+    # Drop, double or swap one character of a longer word, like a fast typist would.
+    words = text.split()
+    i = max(range(len(words)), key=lambda j: len(words[j]))
+    word = words[i]
+    if len(word) > 3:
+        k = rng.randrange(1, len(word) - 1)
+        dropped = word[:k] + word[k + 1 :]
+        doubled = word[:k] + word[k] + word[k:]
+        swapped = word[: k - 1] + word[k] + word[k - 1] + word[k + 1 :]
+        word = rng.choice([dropped, doubled, swapped])
+    words[i] = word
+    return " ".join(words)
+
+
+def run(albums: int = 100_000, queries: int = 500, limit: int = 10, seed: int = 1) -> Dict:
+    """Time /albums/search lookups against an in-memory index of ``albums`` synthetic albums.
+
+    Queries are album texts cut to at least half their length (autocomplete) or with one typo; ``found`` is the share
+    where the intended album is among the top ``limit`` results.
+    """
+    rng = random.Random(seed)
+    catalog = AlbumCatalog()
+    index = SearchIndex(catalog)
+    artists = [f"{_title(rng)} {i}" for i in range(max(1, albums // 8))]
+    for album_id in range(1, albums + 1):
+        catalog.put((album_id, _title(rng), rng.choice(artists), None, None, None, "spotify", None))
+    started = time.perf_counter()
+    index.build()
+    build_s = time.perf_counter() - started
+
+    report: Dict = {"albums": albums, "queries": queries, "build_s": round(build_s, 2)}
+    for kind in ("prefix", "typo"):
+        timings: List[float] = []
+        found = 0
+        for _ in range(queries):
+            album_id = rng.randint(1, albums)
+            record = catalog.get(album_id)
+            text = f"{record.title} {record.artist.rsplit(' ', 1)[0]}"
+            query = text[: rng.randint(len(text) // 2, len(text))] if kind == "prefix" else _typo(rng, text)
+            t0 = time.perf_counter()
+            results = index.search(query, limit)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+            found += any(r.id == album_id for _, r in results)
+        report[kind] = {
+            "found": round(found / queries, 3),
+            "mean_ms": round(statistics.fmean(timings), 2),
+            "p50_ms": round(_percentile(timings, 50), 2),
+            "p99_ms": round(_percentile(timings, 99), 2),
+        }
+    return report
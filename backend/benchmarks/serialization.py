@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from app.fastjson import FastJSONResponse, orjson
+from app.rankings import ALBUM_FIELDS, choose_canonical_album, merge_ranking_rows
+from app.core.elo import elo_to_100
+from app.schemas import RankingEntry, RankingsResponse
+
+
+def _rows(items: int, seed: int) -> List[SimpleNamespace]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, items + 1):
+        spotify_id = f"sp{i:020d}" if rng.random() < 0.6 else None
+        rows.append(
+            SimpleNamespace(
+                id=i,
+                title=f"Album {i}",
+                artist=f"Artist {i % (items // 8 + 1)}",
+                year=rng.randint(1960, 2025),
+                cover_url=f"https://i.scdn.co/image/{spotify_id}" if spotify_id else None,
+                spotify_id=spotify_id,
+                source="spotify" if spotify_id else "aoty",
+                cover_provider="spotify" if spotify_id else None,
+                elo=rng.gauss(1500.0, 120.0),
+                comparisons_count=rng.randint(0, 60),
+            )
+        )
+    return rows
+
+
+def pydantic_path(rows) -> bytes:
+    """The previous /rankings path: models per entry, response_model re-validation, default encoder."""
+    groups: Dict[tuple, list] = {}
+    for row in rows:
+        key = (row.title.strip().lower(), row.artist.strip().lower())
+        groups.setdefault(key, []).append(row)
+    items = []
+    for entries in groups.values():
+        total, weight, count, canonical = 0.0, 0, 0, None
+        for row in entries:
+            w = max(1, row.comparisons_count)
+            total += row.elo * w
+            weight += w
+            count += row.comparisons_count
+            canonical = row if canonical is None else choose_canonical_album(canonical, row)
+        merged = total / weight
+        items.append(RankingEntry(album=canonical, elo=merged, rating_100=elo_to_100(merged), comparisons_count=count))
+    items.sort(key=lambda x: x.elo, reverse=True)
+    response = RankingsResponse(items=items)
+    validated = RankingsResponse.model_validate(response.model_dump())
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def fast_path(rows) -> bytes:
+    return FastJSONResponse({"items": merge_ranking_rows(rows)}).body
+
+
+def _time(fn: Callable[[Any], bytes], rows, repeat: int) -> Dict[str, float]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn(rows))
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+    return {"best_ms": round(timings[0], 3), "median_ms": round(timings[len(timings) // 2], 3), "bytes": size}
+
+
+def run(items: int = 10_000, repeat: int = 7, seed: int = 1) -> Dict[str, Any]:
+    """Compare the old and new /rankings serialization on the same synthetic rows."""
+    rows = _rows(items, seed)
+    assert json.loads(pydantic_path(rows)) == json.loads(fast_path(rows)), "paths disagree"
+    old = _time(pydantic_path, rows, repeat)
+    new = _time(fast_path, rows, repeat)
+    return {
+        "items": items,
+        "encoder": "orjson" if orjson is not None else "json",
+        "album_fields": len(ALBUM_FIELDS),
+        "pydantic": old,
+        "fast": new,
+        "speedup": round(old["median_ms"] / new["median_ms"], 2) if new["median_ms"] else None,
+    }
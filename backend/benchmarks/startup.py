@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+# Modules that must not be imported just by loading the app: they are only needed by rarely used endpoints.
+LAZY_MODULES = ("albumoftheyearapi",)
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter() - started
+
+import asyncio
+from app.db import check_schema
+started = time.perf_counter()
+asyncio.run(check_schema())
+checked = time.perf_counter() - started
+print(json.dumps({
+    "import_ms": imported * 1000.0,
+    "schema_check_ms": checked * 1000.0,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def _backend_dir() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env(database_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = database_url
+    env.setdefault("JWT_SECRET", "startup-benchmark-" + "x" * 32)
+    return env
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(runs: int = 5, budget_ms: float = 1500.0) -> Dict:
+    """Time cold ``import app.main`` plus the boot schema check, each in a fresh interpreter.
+
+    A scratch SQLite database is migrated first so the check measures the steady state. The report
+    includes ``ok``, false when the median startup exceeds ``budget_ms`` or a lazy module leaked in.
+    """
+    backend = _backend_dir()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(f"sqlite+aiosqlite:///{os.path.join(tmp, 'startup.db')}")
+        subprocess.run(
+            [sys.executable, "-m", "app.migrations"], cwd=backend, env=env, check=True, capture_output=True
+        )
+        samples = []
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, "-c", _PROBE % (LAZY_MODULES,)],
+                cwd=backend,
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    totals = [s["import_ms"] + s["schema_check_ms"] for s in samples]
+    leaked = sorted({m for s in samples for m in s["loaded"]})
+    median = statistics.median(totals)
+    return {
+        "runs": runs,
+        "budget_ms": budget_ms,
+        "import_ms": {
+            "p50": round(statistics.median(s["import_ms"] for s in samples), 1),
+            "max": round(max(s["import_ms"] for s in samples), 1),
+        },
+        "schema_check_ms": {
+            "p50": round(statistics.median(s["schema_check_ms"] for s in samples), 1),
+            "max": round(max(s["schema_check_ms"] for s in samples), 1),
+        },
+        "total_ms": {"p50": round(median, 1), "p90": round(_percentile(totals, 90), 1)},
+        "eagerly_loaded": leaked,
+        "ok": median <= budget_ms and not leaked,
+    }
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import random
+from typing import Dict, List
+
+from app.core.elo import expected_score, update_elo
+from app.refinement import find_boundary, pick_pair
+
+CHECK_EVERY = 25
+
+
+def _top(elos: List[float], k: int) -> set:
+    return set(sorted(range(len(elos)), key=lambda i: elos[i], reverse=True)[:k])
+
+
+def _simulate(strategy: str, albums: int, k: int, target: float, max_votes: int, confidence: float, seed: int) -> Dict:
+    rng = random.Random(seed)
+    true = [rng.gauss(1500.0, 200.0) for _ in range(albums)]
+    truth = _top(true, k)
+    elos = [1500.0] * albums
+    counts = [0] * albums
+
+    def vote(a: int, b: int) -> None:
+        # The simulated voter is noisy: they prefer the truly better album with Elo-odds probability.
+        score_a = 1.0 if rng.random() < expected_score(true[a], true[b]) else 0.0
+        elos[a], elos[b] = update_elo(elos[a], elos[b], score_a, counts[a], counts[b])
+        counts[a] += 1
+        counts[b] += 1
+
+    # Warm-up: every album gets a couple of uniform duels so it is in the ranking at all.
+    for _ in range(albums):
+        vote(*rng.sample(range(albums), 2))
+    votes = albums
+
+    converged_at = None
+    reached_at = None
+    while votes < max_votes:
+        pair = None
+        if strategy == "topk":
+            order = sorted(range(albums), key=lambda i: elos[i], reverse=True)
+            ranked = [elos[i] for i in order]
+            boundary = find_boundary(ranked, [counts[i] for i in order], k, confidence)
+            if boundary.converged and converged_at is None:
+                converged_at = votes
+            picked = pick_pair(boundary, ranked, rng)
+            if picked is not None:
+                pair = (order[picked[0]], order[picked[1]])
+        vote(*(pair or rng.sample(range(albums), 2)))
+        votes += 1
+        if votes % CHECK_EVERY == 0 and reached_at is None:
+            if len(_top(elos, k) & truth) >= target * k:
+                reached_at = votes
+        if reached_at is not None and (strategy != "topk" or converged_at is not None):
+            break
+
+    return {
+        "votes_to_target_overlap": reached_at,
+        "votes_to_convergence": converged_at,
+        "final_overlap": round(len(_top(elos, k) & truth) / k, 3),
+    }
+
+
+def run(
+    albums: int = 500,
+    k: int = 25,
+    target: float = 0.9,
+    max_votes: int = 50_000,
+    confidence: float = 0.95,
+    seed: int = 1,
+) -> Dict:
+    """Votes needed before the estimated top K shares ``target`` of its albums with the true top K.
+
+    Compares uniform random pairs (the default /compare/next) against ?mode=topk on the same
+    simulated voter. ``None`` means the target was not reached within ``max_votes``.
+    """
+    return {
+        "albums": albums,
+        "k": k,
+        "target_overlap": target,
+        "uniform": _simulate("uniform", albums, k, target, max_votes, confidence, seed),
+        "topk": _simulate("topk", albums, k, target, max_votes, confidence, seed),
+    }
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import random
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import httpx
+
+from app import lastfm
+from app.http_client import set_upstream_transport
+
+# Spotify caps pages at 50 items; the fake serves a fixed-size library per user.
+FAKE_SAVED_TRACKS = 1_000
+FAKE_SAVED_ALBUMS = 300
+
+
+def _album_json(spotify_id: str, rng: random.Random) -> dict:
+    return {
+        "id": spotify_id,
+        "name": f"Bench Album {spotify_id[:6]}",
+        "album_type": "album",
+        "total_tracks": rng.randint(8, 16),
+        "release_date": f"{rng.randint(1960, 2025)}-01-01",
+        "artists": [{"name": f"Bench Artist {spotify_id[:3]}"}],
+        "images": [{"url": f"https://i.scdn.co/image/{spotify_id}"}],
+    }
+
+
+def _handler(spotify_ids: List[str], seed: int):
+    def handle(request: httpx.Request) -> httpx.Response:
+        rng = random.Random(f"{seed}:{request.url}")
+        if request.url.host == "api.spotify.com" and request.url.path == "/v1/me/tracks":
+            limit = int(request.url.params.get("limit", 50))
+            offset = int(request.url.params.get("offset", 0))
+            count = max(0, min(limit, FAKE_SAVED_TRACKS - offset))
+            items = [{"track": {"album": _album_json(rng.choice(spotify_ids), rng)}} for _ in range(count)]
+            return httpx.Response(200, json={"items": items, "total": FAKE_SAVED_TRACKS})
+        if request.url.host == "api.spotify.com" and request.url.path == "/v1/me/albums":
+            limit = int(request.url.params.get("limit", 50))
+            offset = int(request.url.params.get("offset", 0))
+            count = max(0, min(limit, FAKE_SAVED_ALBUMS - offset))
+            items = [{"album": _album_json(rng.choice(spotify_ids), rng)} for _ in range(count)]
+            return httpx.Response(200, json={"items": items, "total": FAKE_SAVED_ALBUMS})
+        if request.url.host == "api.spotify.com" and request.url.path == "/v1/me/top/tracks":
+            limit = int(request.url.params.get("limit", 50))
+            items = [{"album": _album_json(rng.choice(spotify_ids), rng)} for _ in range(limit)]
+            return httpx.Response(200, json={"items": items})
+        if request.url.host == "ws.audioscrobbler.com":
+            limit = int(request.url.params.get("limit", 50))
+            albums = [
+                {
+                    "name": f"Bench Album {rng.randrange(10_000)}",
+                    "artist": {"name": f"Bench Artist {rng.randrange(500)}"},
+                    "mbid": "",
+                    "image": [{"#text": "https://lastfm.freetls.fastly.net/bench.png"}],
+                    "playcount": str(rng.randint(1, 500)),
+                }
+                for _ in range(limit)
+            ]
+            return httpx.Response(200, json={"topalbums": {"album": albums}})
+        return httpx.Response(404, json={"error": "not mocked"})
+
+    return handle
+
+
+@contextmanager
+def fake_upstream(spotify_ids: List[str], seed: int = 1) -> Iterator[None]:
+    """Serve Spotify and Last.fm importer calls from synthetic data instead of the network."""
+    saved = (lastfm.settings.lastfm_api_key, lastfm.settings.lastfm_api_secret)
+    set_upstream_transport(httpx.MockTransport(_handler(spotify_ids or ["0" * 22], seed)))
+    lastfm.settings.lastfm_api_key = lastfm.settings.lastfm_api_key or "bench"
+    lastfm.settings.lastfm_api_secret = lastfm.settings.lastfm_api_secret or "bench"
+    try:
+        yield
+    finally:
+        set_upstream_transport(None)
+        lastfm.settings.lastfm_api_key, lastfm.settings.lastfm_api_secret = saved
@@ -23,12 +23,15 @@ interface PairResponse {
 export const Duel: React.FC = () => {
   const [pair, setPair] = useState<PairResponse | null>(null);
   const [loading, setLoading] = useState(false);
+  const [voteId, setVoteId] = useState<string | null>(null);
 
   const loadPair = useCallback(async () => {
     setLoading(true);
     try {
       const { data } = await api.get<PairResponse>('/compare/next');
       setPair(data);
+      // One id per shown pair, so a double-click or a retried request records a single vote.
+      setVoteId(crypto.randomUUID());
     } finally {
       setLoading(false);
     }
@@ -44,6 +47,7 @@ export const Duel: React.FC = () => {
       album_a_id: pair.album_a.id,
       album_b_id: pair.album_b.id,
       winner_album_id: winnerAlbumId,
+      vote_id: voteId,
     });
     loadPair();
   };
@@ -1,13 +1,68 @@
 import React, { useEffect, useState } from 'react';
 import { api } from '../api';
 
+interface FacetStat {
+  value: string;
+  library_albums: number;
+  rated_albums: number;
+  wins: number;
+  losses: number;
+  draws: number;
+  win_rate: number | null;
+}
+
 interface StatsResponse {
   total_albums: number;
   total_comparisons: number;
+  library_albums: number;
+  draws: number;
+  comparisons_last_7_days: number;
+  comparisons_last_30_days: number;
+  comparisons_per_day: number;
+  mean_abs_elo_change: number | null;
+  convergence: number | null;
+  by_year: FacetStat[];
+  by_artist: FacetStat[];
+  by_source: FacetStat[];
 }
 
 const formatNumber = (n: number) => n.toLocaleString();
 
+const formatRate = (rate: number | null) => (rate === null ? '—' : `${(rate * 100).toFixed(0)}%`);
+
+const FacetTable: React.FC<{ title: string; rows: FacetStat[] }> = ({ title, rows }) => {
+  if (!rows.length) return null;
+  return (
+    <div className="stats-facet">
+      <h3>{title}</h3>
+      <table>
+        <thead>
+          <tr>
+            <th></th>
+            <th>Library</th>
+            <th>Ranked</th>
+            <th>W / L / D</th>
+            <th>Win rate</th>
+          </tr>
+        </thead>
+        <tbody>
+          {rows.map((row) => (
+            <tr key={row.value}>
+              <td>{row.value}</td>
+              <td>{formatNumber(row.library_albums)}</td>
+              <td>{formatNumber(row.rated_albums)}</td>
+              <td>
+                {row.wins} / {row.losses} / {row.draws}
+              </td>
+              <td>{formatRate(row.win_rate)}</td>
+            </tr>
+          ))}
+        </tbody>
+      </table>
+    </div>
+  );
+};
+
 export const Stats: React.FC = () => {
   const [stats, setStats] = useState<StatsResponse | null>(null);
 
@@ -58,7 +113,29 @@ export const Stats: React.FC = () => {
             />
           </div>
         </div>
+        <div className="stat-card">
+          <div className="stat-label">Duels per Day</div>
+          <div className="stat-value">{stats.comparisons_per_day.toFixed(1)}</div>
+          <div className="stat-sub">
+            {formatNumber(stats.comparisons_last_7_days)} this week, {formatNumber(stats.comparisons_last_30_days)} in 30 days.
+          </div>
+        </div>
+        <div className="stat-card">
+          <div className="stat-label">Ranking Convergence</div>
+          <div className="stat-value">{stats.convergence === null ? '—' : `${(stats.convergence * 100).toFixed(0)}%`}</div>
+          <div className="stat-sub">
+            {stats.mean_abs_elo_change === null
+              ? 'Settles as you keep dueling.'
+              : `Recent duels move Elo by ~${stats.mean_abs_elo_change.toFixed(1)} points.`}
+          </div>
+          <div className="stat-bar-wrapper">
+            <div className="stat-bar" style={{ width: `${(stats.convergence ?? 0) * 100}%` }} />
+          </div>
+        </div>
       </div>
+      <FacetTable title="By Source" rows={stats.by_source} />
+      <FacetTable title="By Year" rows={stats.by_year} />
+      <FacetTable title="Top Artists" rows={stats.by_artist} />
     </div>
   );
 };
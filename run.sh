@@ -1,6 +1,7 @@
 #!/bin/bash
 echo "Starting AlbumDuel backend..."
 cd backend
+poetry run python -m app.migrations || exit 1
 poetry run uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload &
 BACKEND_PID=$!
 cd ..